@@ -0,0 +1,264 @@
+"""
+Offline throughput benchmark of demag against the local NOAA/BGS stand-in.
+Reports points per second, p50/p99 latency of a call and memory per call.
+Batch scenarios (md_many, amd_many, md_grid, md_series) look up about
+--batch points per call.
+
+    python benchmarks/bench.py --requests 200 --latency 0.02 --workers 8
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import math
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+)
+
+from demag import MagneticDeclination, _run  # noqa: E402
+from tests.standin import StandIn  # noqa: E402
+
+ROW = "{:<28} {:>10} {:>10} {:>10} {:>12} {:>12}"
+
+
+def percentile(latencies, q):
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(q / 100 * len(latencies)))]
+
+
+def report(name, elapsed, latencies, memory, count=None):
+    count = len(latencies) if count is None else count
+    print(
+        ROW.format(
+            name,
+            "{:.1f}".format(count / elapsed),
+            "{:.2f}".format(percentile(latencies, 50) * 1000),
+            "{:.2f}".format(percentile(latencies, 99) * 1000),
+            "{:.1f}".format(memory[0]),
+            "{:.2f}".format(memory[1]),
+        )
+    )
+
+
+def points(count):
+    """Distinct points, so no lookup is coalesced"""
+
+    return [
+        (-60.0 + (i * 7.0) % 120.0, -180.0 + (i * 13.0) % 360.0, 0.0, i)
+        for i in range(count)
+    ]
+
+
+def dated(count, offset=0):
+    """Distinct (lat, lon, elev, date) points of md_many()"""
+
+    return [
+        (lat, lon, elev, (2020, 10, 15))
+        for lat, lon, elev, _ in points(offset + count)[offset:]
+    ]
+
+
+def memory_per_call(call, count=20):
+    """
+    Returns peak traced KiB of a call and blocks a call allocated and still
+    held when it returned, averaged. Tracing restarts for every call, so
+    each starts with no traces and its own peak.
+    """
+
+    call()
+    peaks = []
+    blocks = 0
+    for _ in range(count):
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        call()
+        after = tracemalloc.take_snapshot()
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        # the snapshot taken before is traced too, leave tracemalloc out
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        after = after.filter_traces(ignore)
+        before = before.filter_traces(ignore)
+        blocks += sum(
+            stat.count_diff for stat in after.compare_to(before, "filename")
+        )
+    return max(peaks) / 1024, blocks / count
+
+
+def bench_sync(md_object, provider, count, workers):
+    def timed(point):
+        lat, lon, elev, _ = point
+        start = time.perf_counter()
+        md_object.md(lat, lon, elev, 2020, 10, 15, provider)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        latencies = list(pool.map(timed, points(count)))
+    elapsed = time.perf_counter() - start
+    memory = memory_per_call(lambda: timed(points(1)[0]))
+    return elapsed, latencies, memory
+
+
+def bench_async(md_object, provider, count):
+    async def timed(point):
+        lat, lon, elev, _ = point
+        start = time.perf_counter()
+        await md_object.amd(lat, lon, elev, 2020, 10, 15, provider)
+        return time.perf_counter() - start
+
+    async def run():
+        try:
+            start = time.perf_counter()
+            latencies = await asyncio.gather(*map(timed, points(count)))
+            return time.perf_counter() - start, latencies
+        finally:
+            await md_object.aclose()
+
+    elapsed, latencies = _run(run())
+    memory = memory_per_call(
+        lambda: _run(bench_async_one(md_object, provider))
+    )
+    return elapsed, latencies, memory
+
+
+async def bench_async_one(md_object, provider):
+    try:
+        await md_object.amd(10.0, 10.0, 0.0, 2020, 10, 15, provider)
+    finally:
+        await md_object.aclose()
+
+
+def bench_batches(call, count):
+    """
+    Runs call(i) for consecutive batches i until count points are looked
+    up, call returns the number of points it looked up
+    """
+
+    latencies = []
+    looked_up = 0
+    start = time.perf_counter()
+    while looked_up < count:
+        call_start = time.perf_counter()
+        looked_up += call(len(latencies))
+        latencies.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+    memory = memory_per_call(lambda: call(0))
+    return elapsed, latencies, memory, looked_up
+
+
+def bench_many(md_object, provider, count, batch):
+    def call(i):
+        return len(md_object.md_many(dated(batch, i * batch), provider))
+
+    return bench_batches(call, count)
+
+
+def bench_amany(md_object, provider, count, batch):
+    async def lookup(i):
+        try:
+            return await md_object.amd_many(dated(batch, i * batch), provider)
+        finally:
+            await md_object.aclose()
+
+    def call(i):
+        return len(_run(lookup(i)))
+
+    return bench_batches(call, count)
+
+
+def bench_grid(md_object, provider, count, batch):
+    side = max(1, int(math.sqrt(batch)))
+
+    def call(i):
+        lat = -60.0 + (i * 7.0) % 100.0
+        grid = md_object.md_grid(
+            lat,
+            lat + side - 1.0,
+            -180.0,
+            -180.0 + side - 1.0,
+            1.0,
+            1.0,
+            year=2020,
+            mon=10,
+            day=15,
+            provider=provider,
+        )
+        return sum(map(len, grid))
+
+    return bench_batches(call, count)
+
+
+def bench_series(md_object, provider, count, batch):
+    def call(i):
+        lat, lon, elev, _ = points(i + 1)[i]
+        series = md_object.md_series(
+            lat,
+            lon,
+            elev,
+            start=(2020, 1, 1),
+            end=(2021, 1, 1),
+            step=1.0 / max(1, batch - 1),
+            provider=provider,
+        )
+        return len(series)
+
+    return bench_batches(call, count)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", "--requests", type=int, default=200)
+    parser.add_argument("-l", "--latency", type=float, default=0.02)
+    parser.add_argument("-w", "--workers", type=int, default=8)
+    parser.add_argument("-c", "--concurrency", type=int, default=50)
+    parser.add_argument("-b", "--batch", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    print(
+        ROW.format(
+            "scenario", "req/s", "p50 ms", "p99 ms", "peak KiB", "blocks/call"
+        )
+    )
+    with StandIn(latency=args.latency) as stand_in:
+        md_object = MagneticDeclination(
+            workers=args.workers,
+            concurrency=args.concurrency,
+            urls=stand_in.urls,
+        )
+        report(
+            "LOCAL_WMM md()",
+            *bench_sync(md_object, "LOCAL_WMM", args.requests, 1),
+        )
+        for provider in ("NOAA_WMM", "BGS_WMM"):
+            report(
+                provider + " md()",
+                *bench_sync(md_object, provider, args.requests, 1),
+            )
+            report(
+                "{} md() x{}".format(provider, args.workers),
+                *bench_sync(md_object, provider, args.requests, args.workers),
+            )
+            report(
+                "{} amd() x{}".format(provider, args.concurrency),
+                *bench_async(md_object, provider, args.requests),
+            )
+            for name, bench in (
+                ("md_many()", bench_many),
+                ("amd_many()", bench_amany),
+                ("md_grid()", bench_grid),
+                ("md_series()", bench_series),
+            ):
+                report(
+                    "{} {}".format(provider, name),
+                    *bench(md_object, provider, args.requests, args.batch),
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,2632 @@
+import bisect
+import collections
+import concurrent.futures
+import contextlib
+import datetime
 import functools
+import glob
+import itertools
+import json
+import math
+import mmap
+import os
+import random
+import struct
+import sys
+import threading
+import time
 import typing
-import xml.etree.ElementTree as ET
+import weakref
 
-import requests
+if typing.TYPE_CHECKING:
+    import sqlite3
+
+    import requests
+
+COEFFICIENTS_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "coefficients"
+)
+
+# online calculators' base URLs by service
+SERVICE_URLS = {
+    "NOAA": "https://www.ngdc.noaa.gov",
+    "BGS": "http://geomag.bgs.ac.uk",
+}
+
+# HTTP statuses worth retrying: rate limited and server errors
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+# maximum number of cells requested from a grid calculator at once
+GRID_MAX_CELLS = 1000
+
+# number of points evaluated at once by vectorized local models
+ARRAY_CHUNK = 65536
+
+# statuses of md_columns() points: answered, rejected as incorrect (md()
+# raises ValueError), not answered by the provider (e.g. date out of range
+# or response that can't be parsed)
+STATUS_OK = 0
+STATUS_INCORRECT = 1
+STATUS_FAILED = 2
+
+# WGS84 ellipsoid and geomagnetic reference radius, km
+WGS84_A = 6378.137
+WGS84_F = 1 / 298.257223563
+GEOMAG_RE = 6371.2
+
+# registered providers by name: built-in ones are (service, model) pairs,
+# others are callables, see register_provider()
+PROVIDERS = {
+    "NOAA_WMM": ("NOAA", "WMM"),
+    "NOAA_IGRF": ("NOAA", "IGRF"),
+    "BGS_WMM": ("BGS", "WMM"),
+    "LOCAL_WMM": ("LOCAL", "WMM"),
+    "LOCAL_IGRF": ("LOCAL", "IGRF"),
+    "ANY_WMM": ("ANY", ("NOAA_WMM", "BGS_WMM")),
+}
+
+# entry point group of third-party providers
+ENTRY_POINT_GROUP = "demag.providers"
+
+
+class Field(typing.NamedTuple):
+    """
+    Magnetic field elements returned by the provider, elements the provider
+    does not return are None. Angles are in degrees, intensities in nT,
+    secular variation (_sv) is per year.
+    """
+
+    declination: float
+    inclination: typing.Optional[float] = None
+    total_intensity: typing.Optional[float] = None
+    horizontal_intensity: typing.Optional[float] = None
+    north_intensity: typing.Optional[float] = None
+    east_intensity: typing.Optional[float] = None
+    vertical_intensity: typing.Optional[float] = None
+    declination_sv: typing.Optional[float] = None
+    inclination_sv: typing.Optional[float] = None
+    total_intensity_sv: typing.Optional[float] = None
+    horizontal_intensity_sv: typing.Optional[float] = None
+    north_intensity_sv: typing.Optional[float] = None
+    east_intensity_sv: typing.Optional[float] = None
+    vertical_intensity_sv: typing.Optional[float] = None
+    declination_uncertainty: typing.Optional[float] = None
+
+
+class Answer(typing.NamedTuple):
+    """
+    Magnetic declination with its source: the requested provider's name,
+    or the fallback that answered in its place ("cache", "spatial" or the
+    fallback provider's name).
+    """
+
+    declination: float
+    source: str
+
+
+def _days_in_mon(year) -> typing.Tuple[int, ...]:
+    """Returns number of days in every month of the year"""
+
+    leap = year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+    return (31, 29 if leap else 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def _decimal_year(year, mon, day) -> float:
+    """Converts calendar date into decimal year"""
+
+    days_in_mon = _days_in_mon(year)
+    day_of_year = sum(days_in_mon[: mon - 1]) + day
+    return year + (day_of_year - 1) / sum(days_in_mon)
+
+
+def _calendar_date(decimal_year) -> typing.Tuple[int, int, int]:
+    """Converts decimal year into calendar date (year, mon, day)"""
+
+    year = int(math.floor(decimal_year))
+    days_in_mon = _days_in_mon(year)
+    day_of_year = int((decimal_year - year) * sum(days_in_mon) + 1e-6)
+    for mon, days in enumerate(days_in_mon, 1):
+        if day_of_year < days:
+            return year, mon, day_of_year + 1
+        day_of_year -= days
+    return year + 1, 1, 1
+
+
+class SphericalHarmonicModel:
+    """
+    Main geomagnetic field model as a set of Schmidt semi-normalized Gauss
+    coefficients g, h (nT) and their secular variation (nT/year) at epoch.
+    Coefficients are stored as dicts keyed by (n, m).
+    """
+
+    def __init__(self, name, epoch, nmax, g, h, g_sv, h_sv, valid_to=None):
+        self.name = name
+        self.epoch = epoch
+        self.nmax = nmax
+        self.g = g
+        self.h = h
+        self.g_sv = g_sv
+        self.h_sv = h_sv
+        self.valid_to = valid_to if valid_to is not None else epoch + 5.0
+
+    @classmethod
+    def from_cof(cls, path):
+        """Loads model from the WMM coefficient file (WMM.COF format)"""
+
+        g, h, g_sv, h_sv = {}, {}, {}, {}
+        with open(path) as cof:
+            header = cof.readline().split()
+            epoch, name = float(header[0]), header[1]
+            for line in cof:
+                fields = line.split()
+                if len(fields) != 6:
+                    break
+                n, m = int(fields[0]), int(fields[1])
+                g[n, m], h[n, m], g_sv[n, m], h_sv[n, m] = map(
+                    float, fields[2:]
+                )
+        nmax = max(n for n, _ in g)
+        return cls(name, epoch, nmax, g, h, g_sv, h_sv)
+
+    @classmethod
+    def from_shc(cls, path) -> typing.List["SphericalHarmonicModel"]:
+        """
+        Loads model from the IGRF coefficient file (SHC format).
+        Returns one model per epoch interval, secular variation is taken
+        as the linear change of coefficients within the interval, so
+        propagating the model to the date interpolates between epochs.
+        The last interval extrapolates with the predictive variation.
+        """
+
+        name = os.path.splitext(os.path.basename(path))[0]
+        rows = []
+        with open(path) as shc:
+            lines = (line for line in shc if not line.startswith("#"))
+            next(lines)
+            epochs = [float(epoch) for epoch in next(lines).split()]
+            for line in lines:
+                fields = line.split()
+                if fields:
+                    rows.append((int(fields[0]), int(fields[1]), fields[2:]))
+
+        models = []
+        for i, (epoch, next_epoch) in enumerate(zip(epochs, epochs[1:])):
+            step = next_epoch - epoch
+            g, h, g_sv, h_sv = {}, {}, {}, {}
+            for n, m, values in rows:
+                value = float(values[i])
+                sv = (float(values[i + 1]) - value) / step
+                if m >= 0:
+                    g[n, m], g_sv[n, m] = value, sv
+                    h.setdefault((n, m), 0.0)
+                    h_sv.setdefault((n, m), 0.0)
+                else:
+                    h[n, -m], h_sv[n, -m] = value, sv
+            nmax = max(n for n, _ in g)
+            models.append(
+                cls(name, epoch, nmax, g, h, g_sv, h_sv, valid_to=next_epoch)
+            )
+        # the model is valid up to and including the last epoch, dates
+        # are a day (about 0.0027 year) apart so 1e-9 admits the epoch only
+        models[-1].valid_to = epochs[-1] + 1e-9
+        return models
+
+    def is_valid(self, decimal_year) -> bool:
+        """Checks whether the date is within model's validity range"""
+
+        return self.epoch <= decimal_year < self.valid_to
+
+    @functools.lru_cache(maxsize=32)
+    def coefficients(self, decimal_year) -> typing.Tuple[dict, dict]:
+        """Returns g, h coefficients propagated to the date"""
+
+        dt = decimal_year - self.epoch
+        g = {k: v + dt * self.g_sv[k] for k, v in self.g.items()}
+        h = {k: v + dt * self.h_sv[k] for k, v in self.h.items()}
+        return g, h
+
+    def field(
+        self, lat, lon, elev, decimal_year
+    ) -> typing.Tuple[float, float, float]:
+        """
+        Returns geodetic north, east and down components (nT) of the main
+        field at geodetic lat/lon (degrees) and elevation (km above MSL).
+        """
+
+        g, h = self.coefficients(decimal_year)
+        return _synthesize(self.nmax, g, h, lat, lon, elev)
+
+    def declination(self, lat, lon, elev, decimal_year) -> float:
+        """Returns magnetic declination (degrees east)"""
+
+        x, y, _ = self.field(lat, lon, elev, decimal_year)
+        return math.degrees(math.atan2(y, x))
+
+    def declination_array(self, lat, lon, elev, decimal_year):
+        """
+        Vectorized declination() for NumPy arrays of points and dates.
+        The field is linear in coefficients, so it is synthesized once for
+        the coefficients at epoch and once for their secular variation.
+        """
+
+        import numpy as np
+
+        (x, y, _), (x_sv, y_sv, _) = _synthesize_array(
+            self.nmax,
+            ((self.g, self.h), (self.g_sv, self.h_sv)),
+            lat,
+            lon,
+            elev,
+        )
+        dt = decimal_year - self.epoch
+        return np.degrees(np.arctan2(y + dt * y_sv, x + dt * x_sv))
+
+    def elements(self, lat, lon, elev, decimal_year) -> Field:
+        """Returns all magnetic field elements and their secular variation"""
+
+        x, y, z = self.field(lat, lon, elev, decimal_year)
+        # components are linear in time, so one year step is exact for them
+        x_sv, y_sv, z_sv = (
+            after - now
+            for after, now in zip(
+                self.field(lat, lon, elev, decimal_year + 1.0), (x, y, z)
+            )
+        )
+        h = math.hypot(x, y)
+        f = math.hypot(h, z)
+        h_sv = (x * x_sv + y * y_sv) / h
+        return Field(
+            declination=math.degrees(math.atan2(y, x)),
+            inclination=math.degrees(math.atan2(z, h)),
+            total_intensity=f,
+            horizontal_intensity=h,
+            north_intensity=x,
+            east_intensity=y,
+            vertical_intensity=z,
+            declination_sv=math.degrees((x * y_sv - y * x_sv) / (h * h)),
+            inclination_sv=math.degrees((h * z_sv - z * h_sv) / (f * f)),
+            total_intensity_sv=(x * x_sv + y * y_sv + z * z_sv) / f,
+            horizontal_intensity_sv=h_sv,
+            north_intensity_sv=x_sv,
+            east_intensity_sv=y_sv,
+            vertical_intensity_sv=z_sv,
+        )
+
+
+def _synthesize(nmax, g, h, lat, lon, elev):
+    """
+    Spherical harmonic synthesis of the field for Schmidt semi-normalized
+    coefficients, see The US/UK World Magnetic Model technical report.
+    """
+
+    # geodetic to geocentric spherical coordinates, poles are nudged to
+    # keep the east component finite
+    lat = max(min(lat, 90.0 - 1e-9), -90.0 + 1e-9)
+    phi = math.radians(lat)
+    sin_phi, cos_phi = math.sin(phi), math.cos(phi)
+    e2 = WGS84_F * (2.0 - WGS84_F)
+    rc = WGS84_A / math.sqrt(1.0 - e2 * sin_phi * sin_phi)
+    p = (rc + elev) * cos_phi
+    z = (rc * (1.0 - e2) + elev) * sin_phi
+    r = math.hypot(p, z)
+    phi_c = math.asin(z / r)
+
+    # colatitude terms for the Legendre functions
+    cos_t, sin_t = math.sin(phi_c), math.cos(phi_c)
+    lam = math.radians(lon)
+    cos_ml = [math.cos(m * lam) for m in range(nmax + 1)]
+    sin_ml = [math.sin(m * lam) for m in range(nmax + 1)]
+
+    # Schmidt semi-normalized associated Legendre functions and their
+    # derivatives with respect to colatitude
+    pnm = {(0, 0): 1.0}
+    dpnm = {(0, 0): 0.0}
+    b_r = b_t = b_p = 0.0
+    ratio = GEOMAG_RE / r
+    for n in range(1, nmax + 1):
+        ar = ratio ** (n + 2)
+        for m in range(n + 1):
+            if n == m:
+                k = math.sqrt(1.0 - 0.5 / n) if n > 1 else 1.0
+                pnm[n, m] = k * sin_t * pnm[n - 1, m - 1]
+                dpnm[n, m] = k * (
+                    sin_t * dpnm[n - 1, m - 1] + cos_t * pnm[n - 1, m - 1]
+                )
+            else:
+                a = (2 * n - 1) / math.sqrt(n * n - m * m)
+                b = math.sqrt(((n - 1) ** 2 - m * m) / (n * n - m * m))
+                pnm[n, m] = a * cos_t * pnm[n - 1, m]
+                dpnm[n, m] = a * (
+                    cos_t * dpnm[n - 1, m] - sin_t * pnm[n - 1, m]
+                )
+                if n > m + 1:
+                    pnm[n, m] -= b * pnm[n - 2, m]
+                    dpnm[n, m] -= b * dpnm[n - 2, m]
+            gnm, hnm = g.get((n, m), 0.0), h.get((n, m), 0.0)
+            cos_term = gnm * cos_ml[m] + hnm * sin_ml[m]
+            b_r += (n + 1) * ar * cos_term * pnm[n, m]
+            b_t -= ar * cos_term * dpnm[n, m]
+            b_p += ar * m * (gnm * sin_ml[m] - hnm * cos_ml[m]) * pnm[n, m]
+    b_p /= sin_t
+
+    # geocentric north/east/down back to geodetic frame
+    x_c, y_c, z_c = -b_t, b_p, -b_r
+    psi = phi_c - phi
+    x = x_c * math.cos(psi) - z_c * math.sin(psi)
+    z = x_c * math.sin(psi) + z_c * math.cos(psi)
+    return x, y_c, z
+
+
+def _synthesize_array(nmax, coefficients, lat, lon, elev) -> list:
+    """
+    Vectorized _synthesize for NumPy arrays of points, every (g, h) set of
+    coefficients shares the Legendre functions. Returns list of geodetic
+    (x, y, z) arrays, one per set.
+    """
+
+    import numpy as np
+
+    lat = np.clip(lat, -90.0 + 1e-9, 90.0 - 1e-9)
+    phi = np.radians(lat)
+    sin_phi, cos_phi = np.sin(phi), np.cos(phi)
+    e2 = WGS84_F * (2.0 - WGS84_F)
+    rc = WGS84_A / np.sqrt(1.0 - e2 * sin_phi * sin_phi)
+    p = (rc + elev) * cos_phi
+    z = (rc * (1.0 - e2) + elev) * sin_phi
+    r = np.hypot(p, z)
+    phi_c = np.arcsin(z / r)
+
+    cos_t, sin_t = np.sin(phi_c), np.cos(phi_c)
+    lam = np.radians(lon)
+    cos_ml = [np.cos(m * lam) for m in range(nmax + 1)]
+    sin_ml = [np.sin(m * lam) for m in range(nmax + 1)]
+
+    # Legendre functions of the previous two degrees by order
+    pnm, dpnm = [np.ones_like(cos_t)], [np.zeros_like(cos_t)]
+    pnm_2 = dpnm_2 = None
+    sums = [[np.zeros_like(cos_t) for _ in range(3)] for _ in coefficients]
+    ratio = GEOMAG_RE / r
+    ar = ratio * ratio
+    for n in range(1, nmax + 1):
+        ar = ar * ratio
+        pn, dpn = [], []
+        for m in range(n + 1):
+            if n == m:
+                k = math.sqrt(1.0 - 0.5 / n) if n > 1 else 1.0
+                pv = k * sin_t * pnm[m - 1]
+                dpv = k * (sin_t * dpnm[m - 1] + cos_t * pnm[m - 1])
+            else:
+                a = (2 * n - 1) / math.sqrt(n * n - m * m)
+                b = math.sqrt(((n - 1) ** 2 - m * m) / (n * n - m * m))
+                pv = a * cos_t * pnm[m]
+                dpv = a * (cos_t * dpnm[m] - sin_t * pnm[m])
+                if n > m + 1:
+                    pv -= b * pnm_2[m]
+                    dpv -= b * dpnm_2[m]
+            pn.append(pv)
+            dpn.append(dpv)
+            arp, ardp = ar * pv, ar * dpv
+            for (g, h), (b_r, b_t, b_p) in zip(coefficients, sums):
+                gnm, hnm = g.get((n, m), 0.0), h.get((n, m), 0.0)
+                cos_term = gnm * cos_ml[m] + hnm * sin_ml[m]
+                b_r += (n + 1) * cos_term * arp
+                b_t -= cos_term * ardp
+                if m:
+                    b_p += m * (gnm * sin_ml[m] - hnm * cos_ml[m]) * arp
+        pnm_2, dpnm_2, pnm, dpnm = pnm, dpnm, pn, dpn
+
+    psi = phi_c - phi
+    cos_psi, sin_psi = np.cos(psi), np.sin(psi)
+    fields = []
+    for b_r, b_t, b_p in sums:
+        x_c, y_c, z_c = -b_t, b_p / sin_t, -b_r
+        fields.append(
+            (
+                x_c * cos_psi - z_c * sin_psi,
+                y_c,
+                x_c * sin_psi + z_c * cos_psi,
+            )
+        )
+    return fields
+
+
+def _split_date(date) -> typing.Tuple[int, int, int]:
+    """
+    Returns (year, mon, day) for either datetime.date/datetime.datetime or
+    (year, mon, day) sequence.
+    """
+
+    if isinstance(date, datetime.date):
+        return date.year, date.month, date.day
+    year, mon, day = date
+    return year, mon, day
+
+
+def _wrap(angle) -> float:
+    """Returns the angle (degrees) within (-180, 180]"""
+
+    if -180.0 < angle <= 180.0:
+        return angle
+    return -((180.0 - angle) % 360.0) + 180.0
+
+
+def _distance(lat1, lon1, lat2, lon2) -> float:
+    """Returns great-circle distance between points, km"""
+
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (
+        math.sin((phi2 - phi1) / 2.0) ** 2
+        + math.cos(phi1)
+        * math.cos(phi2)
+        * math.sin(math.radians(lon2 - lon1) / 2.0) ** 2
+    )
+    return 2.0 * GEOMAG_RE * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _chord(a, b) -> float:
+    """Returns straight-line distance between x, y, z points"""
+
+    (ax, ay, az), (bx, by, bz) = a, b
+    return math.sqrt((ax - bx) ** 2 + (ay - by) ** 2 + (az - bz) ** 2)
+
+
+# end (time.monotonic()) of the lookup with deadline the thread runs
+_deadline = threading.local()
+
+
+def _time_left() -> typing.Optional[float]:
+    """Returns seconds left to the thread's deadline, None if there is none"""
+
+    end = getattr(_deadline, "end", None)
+    return None if end is None else end - time.monotonic()
+
+
+def _bounded(timeout, left):
+    """Returns timeout (seconds or tuple of them) cut to left seconds"""
+
+    if left is None:
+        return timeout
+    left = max(left, 0.0)
+    if isinstance(timeout, tuple):
+        return tuple(min(value, left) for value in timeout)
+    return min(timeout, left)
+
+
+def _grid_axis(start, stop, step) -> typing.List[float]:
+    """Returns values from start to stop (inclusive) with step"""
+
+    start, stop, step = float(start), float(stop), float(step)
+    if step <= 0.0 or stop < start:
+        raise ValueError(f"Incorrect grid axis {start}:{stop}:{step}")
+    count = int(math.floor((stop - start) / step + 1e-9)) + 1
+    return [start + i * step for i in range(count)]
+
+
+_models_lock = threading.Lock()
+_models = {}
+
+
+def _load_models(model) -> typing.List[SphericalHarmonicModel]:
+    """
+    Loads (once per process) all coefficient sets available for the model
+    from COEFFICIENTS_DIR.
+    """
+
+    with _models_lock:
+        if model not in _models:
+            models = []
+            pattern = os.path.join(COEFFICIENTS_DIR, f"{model}*")
+            for path in sorted(glob.glob(pattern)):
+                if path.endswith(".COF"):
+                    models.append(SphericalHarmonicModel.from_cof(path))
+                elif path.endswith(".shc"):
+                    models.extend(SphericalHarmonicModel.from_shc(path))
+            _models[model] = models
+        return _models[model]
+
+
+def _decimal_years(date):
+    """
+    Returns decimal years for datetime.date or (year, mon, day), for NumPy
+    array of datetime64 or of decimal years.
+    """
+
+    import numpy as np
+
+    if isinstance(date, (datetime.date, tuple)):
+        return np.float64(_decimal_year(*_split_date(date)))
+    date = np.asarray(date)
+    if not np.issubdtype(date.dtype, np.datetime64):
+        return date.astype(np.float64)
+    days = date.astype("datetime64[D]")
+    years = days.astype("datetime64[Y]")
+    first = years.astype("datetime64[D]")
+    length = (years + 1).astype("datetime64[D]") - first
+    return (
+        years.astype(np.float64)
+        + 1970.0
+        + (days - first).astype(np.float64) / length.astype(np.float64)
+    )
+
+
+def _column_years(columns, chunk):
+    """
+    Returns decimal years of the chunk of date (numpy.datetime64 or
+    decimal years) or year, mon, day columns and mask of correct dates.
+    """
+
+    import numpy as np
+
+    if "date" in columns:
+        date = np.asarray(columns["date"][chunk])
+        if np.issubdtype(date.dtype, np.datetime64):
+            correct = ~np.isnat(date)
+            date = np.where(correct, date, np.datetime64("2000-01-01"))
+            return _decimal_years(date), correct
+        years = date.astype(np.float64)
+        return years, np.isfinite(years)
+
+    year, mon, day = (
+        np.asarray(columns[name][chunk], dtype=np.float64)
+        for name in ("year", "mon", "day")
+    )
+    correct = np.ones(year.shape, dtype=bool)
+    for values in (year, mon, day):
+        correct &= np.isfinite(values) & (values == np.round(values))
+    correct &= (mon >= 1) & (mon <= 12) & (day >= 1)
+    year, mon, day = (
+        np.where(correct, values, 1).astype(np.int64)
+        for values in (year, mon, day)
+    )
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    days_in_mon = np.array(_days_in_mon(1), dtype=np.int64)
+    days_before = np.concatenate(([0], np.cumsum(days_in_mon)[:-1]))
+    correct &= day <= days_in_mon[mon - 1] + (leap & (mon == 2))
+    day_of_year = days_before[mon - 1] + (leap & (mon > 2)) + day
+    return year + (day_of_year - 1) / (365 + leap), correct
+
+
+def _in_model_range(model, decimal_year):
+    """Returns mask of decimal years within the local model's range"""
+
+    import numpy as np
+
+    valid = np.zeros(decimal_year.shape, dtype=bool)
+    for sh_model in _load_models(model):
+        valid |= (sh_model.epoch <= decimal_year) & (
+            decimal_year < sh_model.valid_to
+        )
+    return valid
+
+
+def _declination_array(model, lat, lon, elev, decimal_year, out):
+    """
+    Calculates magnetic declinations of the local model into out array,
+    ARRAY_CHUNK points at a time. All arguments are 1-D float64 arrays.
+    Raises exception if any date is out of the model's range.
+    """
+
+    import numpy as np
+
+    models = _load_models(model)
+    for start in range(0, len(out), ARRAY_CHUNK):
+        chunk = slice(start, start + ARRAY_CHUNK)
+        years = decimal_year[chunk]
+        done = np.zeros(len(years), dtype=bool)
+        for sh_model in models:
+            valid = (sh_model.epoch <= years) & (years < sh_model.valid_to)
+            if valid.all():
+                out[chunk] = sh_model.declination_array(
+                    lat[chunk], lon[chunk], elev[chunk], years
+                )
+                done[:] = True
+                break
+            if valid.any():
+                out[chunk][valid] = sh_model.declination_array(
+                    lat[chunk][valid],
+                    lon[chunk][valid],
+                    elev[chunk][valid],
+                    years[valid],
+                )
+                done |= valid
+        if not done.all():
+            raise RuntimeError(
+                f"Date is out of {model} range {years[~done][0]}"
+            )
+
+
+# shared memory blocks attached by the process pool's workers
+_shared_blocks = {}
+
+
+def _attach_shared(name):
+    """Process pool initializer, attaches the shared memory block"""
+
+    from multiprocessing import shared_memory
+
+    _shared_blocks[name] = shared_memory.SharedMemory(name=name)
+
+
+def _declination_worker(model, name, size, start, stop):
+    """
+    Process pool task, calculates declinations of the points from start to
+    stop of the shared (lat, lon, elev, decimal year, result) rows.
+    """
+
+    import numpy as np
+
+    rows = np.ndarray(
+        (5, size), dtype=np.float64, buffer=_shared_blocks[name].buf
+    )
+    span = slice(start, stop)
+    lat, lon, elev, years, out = rows[:, span]
+    _declination_array(model, lat, lon, elev, years, out)
+
+
+def _declination_pool(model, lat, lon, elev, decimal_year, processes):
+    """
+    _declination_array split across processes worker processes, points
+    and results are passed in shared memory instead of being pickled.
+    Evaluated in-process before Python 3.8, which has no shared memory.
+    """
+
+    import numpy as np
+
+    size = len(decimal_year)
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:
+        out = np.empty(size)
+        _declination_array(model, lat, lon, elev, decimal_year, out)
+        return out
+
+    block = shared_memory.SharedMemory(create=True, size=5 * size * 8)
+    try:
+        rows = np.ndarray((5, size), dtype=np.float64, buffer=block.buf)
+        try:
+            for row, values in zip(rows, (lat, lon, elev, decimal_year)):
+                row[:] = values
+            # a few tasks per process even out the uneven ones
+            step = max(1, -(-size // (4 * processes)))
+            with concurrent.futures.ProcessPoolExecutor(
+                processes, initializer=_attach_shared, initargs=(block.name,)
+            ) as pool:
+                tasks = [
+                    pool.submit(
+                        _declination_worker,
+                        model,
+                        block.name,
+                        size,
+                        start,
+                        min(start + step, size),
+                    )
+                    for start in range(0, size, step)
+                ]
+                for task in tasks:
+                    task.result()
+            return rows[4].copy()
+        finally:
+            # views of the block must be gone before it is closed
+            del rows
+    finally:
+        block.close()
+        block.unlink()
+
+
+def _provider_name(provider) -> bytes:
+    """Returns the provider's name as stored in tile and quadtree files"""
+
+    name = provider.encode()
+    if len(name) > 16:
+        raise ValueError(f"Provider name {provider} is over 16 bytes")
+    return name
+
+
+class Tile:
+    """
+    Magnetic declinations precomputed on the regular grid for a single date
+    and elevation, stored in a file and memory-mapped, so processes share
+    its pages.
+    Values between grid nodes are interpolated bilinearly.
+    File layout: HEADER followed by rows x cols little-endian doubles,
+    rows of latitude from lat1, values along longitude from lon1.
+    """
+
+    MAGIC = b"DEMAGTIL"
+    VERSION = 2
+    HEADER = struct.Struct("<8sH7d2I3H16s")
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as tile_file:
+            self.__data = mmap.mmap(
+                tile_file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        (
+            magic,
+            version,
+            self.lat1,
+            self.lat2,
+            self.lon1,
+            self.lon2,
+            self.lat_step,
+            self.lon_step,
+            self.elev,
+            self.rows,
+            self.cols,
+            year,
+            mon,
+            day,
+            provider,
+        ) = self.HEADER.unpack_from(self.__data)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError(f"Unsupported tile file {path}")
+        self.date = (year, mon, day)
+        self.epoch = _decimal_year(year, mon, day)
+        self.provider = provider.rstrip(b"\0").decode()
+
+    @classmethod
+    def write(cls, path, lats, lons, grid, date, provider, elev=0.0):
+        """Writes md_grid() result at elev km to the tile file"""
+
+        header = cls.HEADER.pack(
+            cls.MAGIC,
+            cls.VERSION,
+            lats[0],
+            lats[-1],
+            lons[0],
+            lons[-1],
+            lats[1] - lats[0] if len(lats) > 1 else 1.0,
+            lons[1] - lons[0] if len(lons) > 1 else 1.0,
+            elev,
+            len(lats),
+            len(lons),
+            *date,
+            _provider_name(provider),
+        )
+        row = struct.Struct(f"<{len(lons)}d")
+        with open(path, "wb") as tile_file:
+            tile_file.write(header)
+            for values in grid:
+                tile_file.write(row.pack(*values))
+
+    def __value(self, row, col) -> float:
+        """Returns the grid node value"""
+
+        offset = self.HEADER.size + 8 * (row * self.cols + col)
+        return struct.unpack_from("<d", self.__data, offset)[0]
+
+    def declination(self, lat, lon) -> float:
+        """
+        Returns interpolated magnetic declination, raises exception if the
+        point is outside of the tile.
+        """
+
+        if not (
+            self.lat1 <= lat <= self.lat2 and self.lon1 <= lon <= self.lon2
+        ):
+            raise RuntimeError(f"Point is out of tile lat:{lat} lon:{lon}")
+
+        row, lat_frac = _cell(lat, self.lat1, self.lat_step, self.rows)
+        col, lon_frac = _cell(lon, self.lon1, self.lon_step, self.cols)
+        row_next = min(row + 1, self.rows - 1)
+        col_next = min(col + 1, self.cols - 1)
+        corners = (
+            self.__value(row, col),
+            self.__value(row, col_next),
+            self.__value(row_next, col),
+            self.__value(row_next, col_next),
+        )
+        return _bilinear(corners, lat_frac, lon_frac)
+
+    def close(self):
+        """Unmaps the file"""
+
+        self.__data.close()
+
+
+class QuadTree:
+    """
+    Magnetic declinations sampled adaptively for a single date and
+    elevation: a regular grid of root cells of step degrees, every cell is
+    either split in four or a leaf interpolated bilinearly from its
+    corners. Stored in a file and memory-mapped like Tile.
+    File layout: HEADER, nodes of four little-endian int32, values as
+    little-endian float32. The first rows x cols nodes are root cells,
+    rows of latitude from lat1. A split node holds minus index of its
+    first child, children are south-west, south-east, north-west and
+    north-east quarters. A leaf holds indexes of its corners' values in
+    the same order.
+    """
+
+    MAGIC = b"DEMAGQTR"
+    VERSION = 2
+    HEADER = struct.Struct("<8sH4d2I3H16s2I")
+    NODE = struct.Struct("<4i")
+    VALUE = struct.Struct("<f")
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as tree_file:
+            self.__data = mmap.mmap(
+                tree_file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        (
+            magic,
+            version,
+            self.lat1,
+            self.lon1,
+            self.step,
+            self.elev,
+            self.rows,
+            self.cols,
+            year,
+            mon,
+            day,
+            provider,
+            self.nodes,
+            self.values,
+        ) = self.HEADER.unpack_from(self.__data)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError(f"Unsupported quadtree file {path}")
+        self.lat2 = self.lat1 + self.rows * self.step
+        self.lon2 = self.lon1 + self.cols * self.step
+        self.date = (year, mon, day)
+        self.epoch = _decimal_year(year, mon, day)
+        self.provider = provider.rstrip(b"\0").decode()
+        self.__values_offset = self.HEADER.size + self.NODE.size * self.nodes
+
+    @classmethod
+    def write(
+        cls,
+        path,
+        lat1,
+        lon1,
+        step,
+        shape,
+        nodes,
+        values,
+        date,
+        provider,
+        elev=0.0,
+    ):
+        """
+        Writes the tree of shape (rows, cols) root cells, nodes are
+        4-tuples as stored, values are declinations at elev km.
+        """
+
+        header = cls.HEADER.pack(
+            cls.MAGIC,
+            cls.VERSION,
+            lat1,
+            lon1,
+            step,
+            elev,
+            *shape,
+            *date,
+            _provider_name(provider),
+            len(nodes),
+            len(values),
+        )
+        with open(path, "wb") as tree_file:
+            tree_file.write(header)
+            for node in nodes:
+                tree_file.write(cls.NODE.pack(*node))
+            tree_file.write(struct.pack(f"<{len(values)}f", *values))
+
+    def declination(self, lat, lon) -> float:
+        """
+        Returns interpolated magnetic declination, raises exception if the
+        point is outside of the tree.
+        """
+
+        if not (
+            self.lat1 <= lat <= self.lat2 and self.lon1 <= lon <= self.lon2
+        ):
+            raise RuntimeError(f"Point is out of tree lat:{lat} lon:{lon}")
+
+        row, lat_frac = _cell(lat, self.lat1, self.step, self.rows + 1)
+        col, lon_frac = _cell(lon, self.lon1, self.step, self.cols + 1)
+        node = self.NODE.unpack_from(
+            self.__data,
+            self.HEADER.size + self.NODE.size * (row * self.cols + col),
+        )
+        while node[0] < 0:
+            north, east = lat_frac >= 0.5, lon_frac >= 0.5
+            lat_frac = 2.0 * lat_frac - north
+            lon_frac = 2.0 * lon_frac - east
+            child = -node[0] + 2 * north + east
+            node = self.NODE.unpack_from(
+                self.__data, self.HEADER.size + self.NODE.size * child
+            )
+        offset = self.__values_offset
+        corners = tuple(
+            self.VALUE.unpack_from(self.__data, offset + 4 * i)[0]
+            for i in node
+        )
+        return _bilinear(corners, lat_frac, lon_frac)
+
+    def close(self):
+        """Unmaps the file"""
+
+        self.__data.close()
+
+
+def _bilinear(corners, lat_frac, lon_frac) -> float:
+    """
+    Interpolates declination bilinearly from the cell's (south-west,
+    south-east, north-west, north-east) corners.
+    """
+
+    # declination wraps at 180 degrees near the poles
+    v00, v01, v10, v11 = (
+        value - 360.0 * round((value - corners[0]) / 360.0)
+        for value in corners
+    )
+    md = (v00 * (1 - lon_frac) + v01 * lon_frac) * (1 - lat_frac) + (
+        v10 * (1 - lon_frac) + v11 * lon_frac
+    ) * lat_frac
+    return (md + 180.0) % 360.0 - 180.0
+
+
+def _cell(value, start, step, count) -> typing.Tuple[int, float]:
+    """Returns grid cell index and position within the cell"""
+
+    if count < 2:
+        return 0, 0.0
+    position = (value - start) / step
+    index = max(0, min(int(math.floor(position)), count - 2))
+    return index, max(0.0, min(position - index, 1.0))
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket allowing rate requests per second on average
+    and bursts of up to burst requests.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.__tokens = self.burst
+        self.__updated = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Takes a token, returns number of seconds to wait before the token
+        may be used.
+        """
+
+        with self.__lock:
+            now = time.monotonic()
+            self.__tokens = min(
+                self.burst, self.__tokens + (now - self.__updated) * self.rate
+            )
+            self.__updated = now
+            self.__tokens -= 1.0
+            return max(0.0, -self.__tokens / self.rate)
+
+    def acquire(self):
+        """Blocks until a token is available"""
+
+        time.sleep(self.reserve())
+
+
+class LatencyStats:
+    """
+    Thread-safe latencies (seconds) and outcomes of the provider's last
+    window requests, plus total request and error counters.
+    """
+
+    def __init__(self, window=100):
+        self.requests = 0
+        self.errors = 0
+        self.__recent = collections.deque(maxlen=window)
+        self.__lock = threading.Lock()
+
+    def record(self, latency, ok=True):
+        """Records the request's latency and outcome"""
+
+        with self.__lock:
+            self.requests += 1
+            self.errors += not ok
+            self.__recent.append((latency, ok))
+
+    def percentile(self, q) -> typing.Optional[float]:
+        """Returns q-th percentile of successful requests' latency"""
+
+        with self.__lock:
+            latencies = sorted(latency for latency, ok in self.__recent if ok)
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(q / 100.0 * len(latencies)))
+        return latencies[index]
+
+    def error_rate(self) -> float:
+        """Returns share of failed recent requests"""
+
+        with self.__lock:
+            if not self.__recent:
+                return 0.0
+            return sum(not ok for _, ok in self.__recent) / len(self.__recent)
+
+    def score(self) -> float:
+        """Returns expected cost of the request, lower is better"""
+
+        return (self.percentile(50) or 0.0) * (1.0 + 4.0 * self.error_rate())
+
+
+@contextlib.contextmanager
+def _untimed():
+    """Context manager doing nothing, stands for a phase without metrics"""
+
+    yield
+
+
+def _label(value) -> str:
+    """Returns Prometheus label value with special characters escaped"""
+
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+    )
+
+
+class Metrics:
+    """
+    Thread-safe instrumentation of lookups: latency histograms and error
+    counters of every phase (validate, cache, provider, http, parse) by
+    provider, cache hits and misses, retries by service.
+    Callbacks and context managers added with add_callback() and
+    add_context() run around every phase, prometheus() renders all metrics
+    in Prometheus text exposition format, serve() exposes them for scraping.
+    """
+
+    BUCKETS = (
+        0.0001,
+        0.001,
+        0.005,
+        0.01,
+        0.025,
+        0.05,
+        0.1,
+        0.25,
+        0.5,
+        1.0,
+        2.5,
+        5.0,
+        10.0,
+    )
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.__histograms = {}
+        self.__errors = collections.Counter()
+        self.__caches = collections.Counter()
+        self.__retries = collections.Counter()
+        self.__answers = collections.Counter()
+        self.__callbacks = []
+        self.__contexts = []
+        self.__lock = threading.Lock()
+
+    def add_callback(self, callback):
+        """
+        Registers callback(phase, provider, seconds, error) called after
+        every phase, error is the raised exception or None.
+        """
+
+        self.__callbacks.append(callback)
+
+    def add_context(self, factory):
+        """
+        Registers factory(phase, provider) returning context manager entered
+        around every phase, e.g. a tracing span.
+        """
+
+        self.__contexts.append(factory)
+
+    @contextlib.contextmanager
+    def phase(self, phase, provider):
+        """
+        Context manager timing the phase of the provider's lookup, an
+        exception raised inside counts as the phase's error. Cancelled
+        phases are not recorded.
+        """
+
+        with contextlib.ExitStack() as stack:
+            for factory in self.__contexts:
+                stack.enter_context(factory(phase, provider))
+            start = time.perf_counter()
+            try:
+                yield
+            except Exception as error:
+                # CancelledError is an Exception before Python 3.8, asyncio
+                # is imported by whoever cancelled
+                asyncio = sys.modules.get("asyncio")
+                if asyncio is None or not isinstance(
+                    error, asyncio.CancelledError
+                ):
+                    self.observe(
+                        phase, provider, time.perf_counter() - start, error
+                    )
+                raise
+            self.observe(phase, provider, time.perf_counter() - start)
+
+    def observe(self, phase, provider, seconds, error=None):
+        """Records the phase's duration and outcome, runs callbacks"""
+
+        key = (phase, provider)
+        with self.__lock:
+            histogram = self.__histograms.get(key)
+            if histogram is None:
+                histogram = [[0] * (len(self.buckets) + 1), 0.0]
+                self.__histograms[key] = histogram
+            histogram[0][bisect.bisect_left(self.buckets, seconds)] += 1
+            histogram[1] += seconds
+            if error is not None:
+                self.__errors[key] += 1
+        for callback in self.__callbacks:
+            callback(phase, provider, seconds, error)
+
+    def cache(self, name, hit):
+        """Records hit or miss of the cache (memo or cache)"""
+
+        with self.__lock:
+            self.__caches[name, "hit" if hit else "miss"] += 1
+
+    def retry(self, service):
+        """Records retry of the service's request"""
+
+        with self.__lock:
+            self.__retries[service] += 1
+
+    def answer(self, provider, source):
+        """Records the source of the provider's answer within deadline"""
+
+        with self.__lock:
+            self.__answers[provider, source] += 1
+
+    def answers(self, provider, source) -> int:
+        """Returns number of the provider's answers given by the source"""
+
+        with self.__lock:
+            return self.__answers[provider, source]
+
+    def hit_ratio(self, name) -> typing.Optional[float]:
+        """Returns share of the cache's hits, None before any lookup"""
+
+        with self.__lock:
+            hits = self.__caches[name, "hit"]
+            total = hits + self.__caches[name, "miss"]
+        return hits / total if total else None
+
+    def errors(self, phase, provider) -> int:
+        """Returns number of the provider's failed phases"""
+
+        with self.__lock:
+            return self.__errors[phase, provider]
+
+    def prometheus(self) -> str:
+        """Returns all metrics in Prometheus text exposition format"""
+
+        with self.__lock:
+            histograms = {
+                key: (list(counts), total)
+                for key, (counts, total) in self.__histograms.items()
+            }
+            errors = dict(self.__errors)
+            caches = dict(self.__caches)
+            retries = dict(self.__retries)
+            answers = dict(self.__answers)
+
+        lines = [
+            "# HELP demag_phase_seconds Duration of lookup phases.",
+            "# TYPE demag_phase_seconds histogram",
+        ]
+        bounds = [repr(float(bound)) for bound in self.buckets] + ["+Inf"]
+        for (phase, provider), (counts, total) in sorted(histograms.items()):
+            labels = f'phase="{_label(phase)}",provider="{_label(provider)}"'
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                lines.append(
+                    f'demag_phase_seconds_bucket{{{labels},le="{bound}"}} '
+                    f"{cumulative}"
+                )
+            lines.append(f"demag_phase_seconds_sum{{{labels}}} {total!r}")
+            lines.append(f"demag_phase_seconds_count{{{labels}}} {cumulative}")
+
+        lines += [
+            "# HELP demag_errors_total Failed lookup phases.",
+            "# TYPE demag_errors_total counter",
+        ]
+        for (phase, provider), count in sorted(errors.items()):
+            lines.append(
+                f'demag_errors_total{{phase="{_label(phase)}",'
+                f'provider="{_label(provider)}"}} {count}'
+            )
+
+        lines += [
+            "# HELP demag_cache_requests_total Cache lookups by result.",
+            "# TYPE demag_cache_requests_total counter",
+        ]
+        for (name, result), count in sorted(caches.items()):
+            lines.append(
+                f'demag_cache_requests_total{{cache="{_label(name)}",'
+                f'result="{result}"}} {count}'
+            )
+
+        lines += [
+            "# HELP demag_cache_hit_ratio Share of cache lookups that hit.",
+            "# TYPE demag_cache_hit_ratio gauge",
+        ]
+        for name in sorted({name for name, _ in caches}):
+            hits = caches.get((name, "hit"), 0)
+            total = hits + caches.get((name, "miss"), 0)
+            lines.append(
+                f'demag_cache_hit_ratio{{cache="{_label(name)}"}} '
+                f"{hits / total!r}"
+            )
+
+        lines += [
+            "# HELP demag_retries_total Retried requests by service.",
+            "# TYPE demag_retries_total counter",
+        ]
+        for service, count in sorted(retries.items()):
+            lines.append(
+                f'demag_retries_total{{service="{_label(service)}"}} {count}'
+            )
+
+        lines += [
+            "# HELP demag_answers_total Lookups with deadline by source.",
+            "# TYPE demag_answers_total counter",
+        ]
+        for (provider, source), count in sorted(answers.items()):
+            lines.append(
+                f'demag_answers_total{{provider="{_label(provider)}",'
+                f'source="{_label(source)}"}} {count}'
+            )
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=9464, addr=""):
+        """
+        Starts HTTP server answering GET /metrics with prometheus() in a
+        daemon thread, returns the server, call its shutdown() to stop.
+        """
+
+        import http.server
+        import socketserver
+
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode()
+                self.send_response(200)
+                self.send_header(
+                    "Content-Type", "text/plain; version=0.0.4; charset=utf-8"
+                )
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        class ThreadingServer(
+            socketserver.ThreadingMixIn, http.server.HTTPServer
+        ):
+            daemon_threads = True
+
+        server = ThreadingServer((addr, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory cache of magnetic declinations holding up to
+    capacity least recently used entries. Coordinates are quantized to
+    resolution degrees and elevation to elev_resolution km, so near points
+    share an entry.
+    """
+
+    def __init__(self, capacity=4096, resolution=0.01, elev_resolution=0.01):
+        self.capacity = capacity
+        self.resolution = resolution
+        self.elev_resolution = elev_resolution
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__entries = collections.OrderedDict()
+        self.__lock = threading.Lock()
+
+    def key(self, provider, lat, lon, elev, year, mon, day) -> tuple:
+        """Returns cache key of quantized point"""
+
+        return (
+            provider,
+            round(float(lat) / self.resolution),
+            round(float(lon) / self.resolution),
+            round(float(elev) / self.elev_resolution),
+            year,
+            mon,
+            day,
+        )
+
+    def get(self, key) -> typing.Optional[float]:
+        """Returns cached value or None if missing"""
+
+        with self.__lock:
+            md = self.__entries.get(key)
+            if md is None:
+                self.misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return md
+
+    def set(self, key, md):
+        """Stores value, evicts least recently used entry if needed"""
+
+        with self.__lock:
+            self.__entries[key] = md
+            self.__entries.move_to_end(key)
+            if len(self.__entries) > self.capacity:
+                self.__entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        """Returns hit, miss and eviction counters and current size"""
+
+        with self.__lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self.__entries),
+            }
+
+
+class TemporalCache:
+    """
+    Thread-safe in-memory store of declinations with their secular
+    variation by point, answering lookups for other dates of the point by
+    linear extrapolation. Within a model epoch field components are linear
+    in time, so the extrapolation error is about |sv| * rate * dt^2, where
+    rate is the relative yearly change of horizontal intensity, |H_sv / H|,
+    taken from the provider's result or the rate argument if missing.
+    A sample answers only within window years of its date, if the
+    projected error is within tolerance degrees and no model epoch
+    (multiple of epoch_step years) lies between the dates.
+    Holds samples of up to capacity least recently used points, coordinates
+    are quantized as in LRUCache.
+    """
+
+    def __init__(
+        self,
+        window=1.0,
+        tolerance=0.01,
+        rate=0.01,
+        capacity=4096,
+        resolution=0.01,
+        elev_resolution=0.01,
+        epoch_step=5,
+        samples=4,
+    ):
+        self.window = window
+        self.tolerance = tolerance
+        self.rate = rate
+        self.capacity = capacity
+        self.resolution = resolution
+        self.elev_resolution = elev_resolution
+        self.epoch_step = epoch_step
+        self.samples = samples
+        self.hits = 0
+        self.misses = 0
+        self.__points = collections.OrderedDict()
+        self.__lock = threading.Lock()
+
+    def key(self, provider, lat, lon, elev) -> tuple:
+        """Returns key of quantized point"""
+
+        return (
+            provider,
+            round(float(lat) / self.resolution),
+            round(float(lon) / self.resolution),
+            round(float(elev) / self.elev_resolution),
+        )
+
+    def get(self, key, decimal_year) -> typing.Optional[float]:
+        """
+        Returns declination extrapolated from the closest in time usable
+        sample of the point or None if there is none.
+        """
+
+        epoch = math.floor(decimal_year / self.epoch_step)
+        with self.__lock:
+            best = None
+            for year, md, md_sv, rate in self.__points.get(key, ()):
+                dt = abs(decimal_year - year)
+                if (
+                    dt <= self.window
+                    and abs(md_sv) * rate * dt * dt <= self.tolerance
+                    and math.floor(year / self.epoch_step) == epoch
+                    and (best is None or dt < best[0])
+                ):
+                    best = dt, md + md_sv * (decimal_year - year)
+            if best is None:
+                self.misses += 1
+                return None
+            self.__points.move_to_end(key)
+            self.hits += 1
+        return _wrap(best[1])
+
+    def set(self, key, decimal_year, field):
+        """
+        Stores the provider's Field of the point and date, fields without
+        declination's secular variation are ignored.
+        """
+
+        if field.declination_sv is None:
+            return
+        rate = self.rate
+        h, h_sv = field.horizontal_intensity, field.horizontal_intensity_sv
+        if h and h_sv is not None:
+            rate = abs(h_sv / h)
+        sample = (decimal_year, field.declination, field.declination_sv, rate)
+        with self.__lock:
+            samples = self.__points.setdefault(key, [])
+            samples.append(sample)
+            del samples[: -self.samples]
+            self.__points.move_to_end(key)
+            if len(self.__points) > self.capacity:
+                self.__points.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Returns hit and miss counters and number of points"""
+
+        with self.__lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self.__points),
+            }
+
+
+class SpatialCache:
+    """
+    Thread-safe in-memory index of declinations by provider, elevation and
+    date over points on the sphere, answering lookups from results of
+    neighbouring points within distance km. Points are bucketed in cubes
+    of distance km by their position, so a lookup checks 27 buckets
+    regardless of poles and the antimeridian.
+    Error of the answer is estimated as the nearest neighbour's distance
+    times declination gradient, the larger of gradient (degrees/km) and
+    the one seen between the neighbours; it must be within tolerance
+    degrees. Up to neighbours nearest points are interpolated by inverse
+    distance.
+    Holds up to capacity points, the oldest are evicted first.
+    """
+
+    def __init__(
+        self,
+        distance=1.0,
+        tolerance=0.01,
+        gradient=0.01,
+        neighbours=8,
+        capacity=100000,
+        elev_resolution=0.01,
+    ):
+        self.distance = distance
+        self.neighbours = neighbours
+        self.tolerance = tolerance
+        self.gradient = gradient
+        self.capacity = capacity
+        self.elev_resolution = elev_resolution
+        self.hits = 0
+        self.misses = 0
+        self.__buckets = {}
+        self.__order = collections.deque()
+        self.__lock = threading.Lock()
+
+    def key(self, provider, elev, year, mon, day) -> tuple:
+        """Returns key of points sharing the provider, elevation and date"""
+
+        return (
+            provider,
+            round(float(elev) / self.elev_resolution),
+            year,
+            mon,
+            day,
+        )
+
+    def __position(self, lat, lon) -> typing.Tuple[float, float, float]:
+        """Returns position on the sphere of GEOMAG_RE radius, km"""
+
+        phi, lam = math.radians(float(lat)), math.radians(float(lon))
+        return (
+            GEOMAG_RE * math.cos(phi) * math.cos(lam),
+            GEOMAG_RE * math.cos(phi) * math.sin(lam),
+            GEOMAG_RE * math.sin(phi),
+        )
+
+    def __bucket(self, position) -> typing.Tuple[int, int, int]:
+        """Returns bucket of the position"""
+
+        x, y, z = (math.floor(value / self.distance) for value in position)
+        return x, y, z
+
+    def get(self, key, lat, lon) -> typing.Optional[float]:
+        """
+        Returns declination of neighbouring points or None if there are no
+        neighbours close enough.
+        """
+
+        position = self.__position(lat, lon)
+        x, y, z = self.__bucket(position)
+        neighbours = []
+        with self.__lock:
+            for dx, dy, dz in itertools.product((-1, 0, 1), repeat=3):
+                bucket = (key, (x + dx, y + dy, z + dz))
+                for point, md in self.__buckets.get(bucket, ()):
+                    distance = _chord(position, point)
+                    if distance <= self.distance:
+                        neighbours.append((distance, point, md))
+            md = self.__estimate(neighbours)
+            if md is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return md
+
+    def nearest(self, key, lat, lon) -> typing.Optional[float]:
+        """
+        Returns declination of the nearest point of the buckets around
+        (at least distance km in every direction) regardless of tolerance,
+        None if there is none. Used as a degraded answer.
+        """
+
+        position = self.__position(lat, lon)
+        x, y, z = self.__bucket(position)
+        nearest = None
+        with self.__lock:
+            for dx, dy, dz in itertools.product((-1, 0, 1), repeat=3):
+                bucket = (key, (x + dx, y + dy, z + dz))
+                for point, md in self.__buckets.get(bucket, ()):
+                    distance = _chord(position, point)
+                    if nearest is None or distance < nearest[0]:
+                        nearest = (distance, md)
+        return nearest[1] if nearest is not None else None
+
+    def __estimate(self, neighbours) -> typing.Optional[float]:
+        """Returns declination interpolated from neighbours if accurate"""
+
+        if not neighbours:
+            return None
+        neighbours = sorted(neighbours, key=lambda neighbour: neighbour[0])
+        neighbours = neighbours[: self.neighbours]
+        nearest, _, md = neighbours[0]
+        if nearest == 0.0:
+            return md
+
+        # declinations relative to the nearest one, unwrapped at 180
+        gradient = self.gradient
+        deltas = [
+            (md_i - md + 180.0) % 360.0 - 180.0 for *_, md_i in neighbours
+        ]
+        for (_, point_i, _), delta_i in zip(neighbours, deltas):
+            for (_, point_j, _), delta_j in zip(neighbours, deltas):
+                distance = _chord(point_i, point_j)
+                if distance > 0.0:
+                    gradient = max(gradient, abs(delta_i - delta_j) / distance)
+        if gradient * nearest > self.tolerance:
+            return None
+
+        weights = [1.0 / distance for distance, *_ in neighbours]
+        delta = sum(w * d for w, d in zip(weights, deltas)) / sum(weights)
+        return _wrap(md + delta)
+
+    def set(self, key, lat, lon, md):
+        """Stores declination of the point, evicts the oldest if needed"""
+
+        position = self.__position(lat, lon)
+        bucket = (key, self.__bucket(position))
+        entry = (position, md)
+        with self.__lock:
+            self.__buckets.setdefault(bucket, []).append(entry)
+            self.__order.append((bucket, entry))
+            if len(self.__order) > self.capacity:
+                old_bucket, old_entry = self.__order.popleft()
+                entries = self.__buckets[old_bucket]
+                entries.remove(old_entry)
+                if not entries:
+                    del self.__buckets[old_bucket]
+
+    def stats(self) -> dict:
+        """Returns hit and miss counters and number of points"""
+
+        with self.__lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self.__order),
+            }
+
+
+class SQLiteCache:
+    """
+    Persistent cache of magnetic declinations in SQLite database.
+    Entries older than ttl seconds are ignored (never expire if ttl is None),
+    least recently used entries are evicted beyond max_size entries.
+    Coordinates and elevation are rounded to digits decimal places.
+    The database can be shared by processes on the same host.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS md_cache ("
+        "key TEXT PRIMARY KEY, md REAL NOT NULL, "
+        "created REAL NOT NULL, accessed REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS md_cache_accessed "
+        "ON md_cache (accessed)",
+    )
+
+    def __init__(self, path, ttl=None, max_size=100000, digits=5):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.digits = digits
+        self.__local = threading.local()
+        with self.__connection() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            for statement in self.SCHEMA:
+                db.execute(statement)
+
+    def __connection(self) -> "sqlite3.Connection":
+        """Returns database connection of the current thread"""
+
+        if not hasattr(self.__local, "db"):
+            import sqlite3
+
+            self.__local.db = sqlite3.connect(self.path, timeout=30.0)
+        return self.__local.db
+
+    def key(self, provider, lat, lon, elev, year, mon, day) -> str:
+        """Returns cache key, the provider's name includes its model"""
+
+        lat, lon, elev = (
+            round(float(value), self.digits) for value in (lat, lon, elev)
+        )
+        return f"{provider}|{lat}|{lon}|{elev}|{year}-{mon}-{day}"
+
+    def get(self, key, stale=False) -> typing.Optional[float]:
+        """
+        Returns cached value or None if missing or expired, expired values
+        are returned too if stale. Expired entries are kept until replaced
+        or evicted, to be used as degraded answers.
+        """
+
+        now = time.time()
+        with self.__connection() as db:
+            row = db.execute(
+                "SELECT md, created FROM md_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            md, created = row
+            if not stale and self.ttl is not None and now - created > self.ttl:
+                return None
+            db.execute(
+                "UPDATE md_cache SET accessed = ? WHERE key = ?", (now, key)
+            )
+        return md
+
+    def set(self, key, md):
+        """Stores value, evicts least recently used entries if needed"""
+
+        now = time.time()
+        with self.__connection() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO md_cache VALUES (?, ?, ?, ?)",
+                (key, md, now, now),
+            )
+            (size,) = db.execute("SELECT COUNT(*) FROM md_cache").fetchone()
+            if size > self.max_size:
+                db.execute(
+                    "DELETE FROM md_cache WHERE key IN (SELECT key "
+                    "FROM md_cache ORDER BY accessed LIMIT ?)",
+                    (size - self.max_size,),
+                )
+
+
+_providers_lock = threading.Lock()
+_entry_points = None
+
+
+def register_provider(name, provider):
+    """
+    Registers provider for all MagneticDeclination objects, provider is
+    callable(md_object, lat, lon, elev, year, mon, day) returning magnetic
+    declination. Third-party packages may register providers as entry
+    points of ENTRY_POINT_GROUP group instead, they are imported on first
+    use.
+    """
+
+    with _providers_lock:
+        PROVIDERS[name] = provider
+
+
+def _provider(name):
+    """
+    Returns registered provider or None. Entry points are listed on the
+    first lookup of unknown name, the provider's package is imported on
+    the first lookup of its name.
+    """
+
+    global _entry_points
+
+    with _providers_lock:
+        if name not in PROVIDERS:
+            if _entry_points is None:
+                _entry_points = _load_entry_points()
+            entry_point = _entry_points.pop(name, None)
+            if entry_point is not None:
+                PROVIDERS[name] = entry_point.load()
+        return PROVIDERS.get(name)
+
+
+def _load_entry_points() -> dict:
+    """
+    Returns third-party providers' entry points by name, there are none
+    if neither importlib.metadata (Python 3.8) nor setuptools is present.
+    """
+
+    try:
+        import importlib.metadata
+    except ImportError:
+        try:
+            import pkg_resources
+        except ImportError:
+            return {}
+        return {
+            entry_point.name: entry_point
+            for entry_point in pkg_resources.iter_entry_points(
+                ENTRY_POINT_GROUP
+            )
+        }
+
+    entry_points = importlib.metadata.entry_points()
+    if hasattr(entry_points, "select"):
+        group = entry_points.select(group=ENTRY_POINT_GROUP)
+    else:
+        group = entry_points.get(ENTRY_POINT_GROUP, ())
+    return {entry_point.name: entry_point for entry_point in group}
 
 
 class MagneticDeclination:
-    def __init__(self):
-        self.__providers = {
-            "NOAA_WMM": functools.partial(self.__noaa_provider, "WMM"),
-            "NOAA_IGRF": functools.partial(self.__noaa_provider, "IGRF"),
-            "BGS_WMM": functools.partial(self.__bgs_provider, "WMM"),
+    def __init__(
+        self,
+        workers=8,
+        concurrency=50,
+        cache=None,
+        memo=None,
+        rate_limits=None,
+        timeout=(3.05, 30.0),
+        retries=3,
+        backoff=0.5,
+        hedge_delay=1.0,
+        urls=None,
+        metrics=None,
+        temporal=None,
+        spatial=None,
+        fallbacks=("cache", "spatial", "local"),
+    ):
+        """
+        workers - number of concurrent requests for batch lookups, also the
+        size of the HTTP connection pool of every provider.
+        concurrency - maximum number of asynchronous requests in flight to
+        every provider.
+        cache - optional persistent cache of results, e.g. SQLiteCache.
+        memo - optional in-memory cache checked first, e.g. LRUCache, its
+        hits skip arguments validation.
+        rate_limits - requests per second or RateLimiter by service
+        ("NOAA", "BGS"), services not listed are not limited.
+        timeout - (connect, read) timeout of HTTP requests, seconds.
+        retries - number of retries of rate limited (429), failed (5xx) or
+        not connected requests, backoff - base delay between them, the
+        delay doubles every retry and is randomly jittered.
+        hedge_delay - delay before a composite provider (ANY_WMM) sends a
+        duplicate request to the next provider until the first one has
+        enough latency history to use its 95th percentile.
+        urls - base URLs by service overriding SERVICE_URLS, e.g. to use
+        a mirror or a local stand-in.
+        metrics - optional Metrics instrumenting lookups' phases.
+        temporal - optional TemporalCache answering network providers'
+        lookups from their result of another date of the point extrapolated
+        with its secular variation.
+        spatial - optional SpatialCache answering network providers'
+        lookups from their results of neighbouring points of the same date.
+        fallbacks - sources answering lookups with deadline in place of
+        late or failed providers, tried in order, see answer().
+        """
+
+        self.workers = workers
+        self.concurrency = concurrency
+        self.cache = cache
+        self.memo = memo
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge_delay = hedge_delay
+        self.urls = dict(SERVICE_URLS, **(urls or {}))
+        self.metrics = metrics
+        self.temporal = temporal
+        self.spatial = spatial
+        self.fallbacks = tuple(fallbacks)
+        self.__rate_limiters = {}
+        for service, limit in (rate_limits or {}).items():
+            if not isinstance(limit, RateLimiter):
+                limit = RateLimiter(limit)
+            self.__rate_limiters[service] = limit
+        self.__sessions = {}
+        self.__sessions_lock = threading.Lock()
+        # asynchronous lookups' state by event loop, see __loop_maps()
+        self.__async_states = None
+        self.__async_inflight = None
+        self.__hedge_pool = None
+        self.__deadline_pool = None
+        # late lookups' tasks mapped to their loops
+        self.__background = {}
+        self.__inflight = {}
+        self.__inflight_lock = threading.Lock()
+        # composite providers' members' LatencyStats, see __latency()
+        self.__latency_stats = {}
+        # providers' methods by (name, lookup kind), bound on first use
+        self.__methods = {}
+        self.__tiles = {}
+
+    def check(self, lat, lon, elev, year, mon, day, provider):
+        """
+        Raises ValueError if md() would reject the arguments, tells
+        incorrect points from failures of the provider before the lookup.
+        """
+
+        self.__check__all_args(lat, lon, elev, year, mon, day, provider)
+
+    def md(
+        self,
+        lat=0.0,
+        lon=0.0,
+        elev=0.0,
+        year=2000,
+        mon=1,
+        day=1,
+        provider="NOAA_WMM",
+        deadline=None,
+    ) -> typing.Optional[float]:
+        """
+        Returns magnetic declination for certain lat/lon and date.
+        If deadline (seconds) is set, late or failed network providers are
+        replaced by fallbacks, see answer().
+        """
+
+        if deadline is not None:
+            return self.answer(
+                lat, lon, elev, year, mon, day, provider, deadline
+            ).declination
+
+        memo_key = self.__memo_key(provider, lat, lon, elev, year, mon, day)
+        if memo_key is not None:
+            md = self.__cache_get(self.memo, "memo", provider, memo_key)
+            if md is not None:
+                return md
+
+        with self.__phase("validate", provider):
+            self.__check__all_args(lat, lon, elev, year, mon, day, provider)
+
+        md = cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.key(
+                provider, lat, lon, elev, year, mon, day
+            )
+            md = self.__cache_get(self.cache, "cache", provider, cache_key)
+
+        if md is None and self.temporal is not None:
+            md = self.__temporal_get(provider, lat, lon, elev, year, mon, day)
+
+        if md is None and self.spatial is not None:
+            md = self.__spatial_get(provider, lat, lon, elev, year, mon, day)
+
+        if md is None:
+            md = self.__dispatch(
+                provider, lat, lon, elev, year, mon, day, cache_key
+            )
+
+        if memo_key is not None:
+            self.memo.set(memo_key, md)
+        return md
+
+    def answer(
+        self,
+        lat=0.0,
+        lon=0.0,
+        elev=0.0,
+        year=2000,
+        mon=1,
+        day=1,
+        provider="NOAA_WMM",
+        deadline=None,
+    ) -> Answer:
+        """
+        Returns Answer: magnetic declination and its source. If deadline
+        (seconds) is set, a provider that is not local is waited for no
+        longer than that; if it is late or fails, the first source of
+        self.fallbacks that can answer does:
+        "cache" - memo or persistent cache, expired entries included,
+        "spatial" - the nearest point of the spatial cache,
+        "local" - the local model of the provider's model,
+        provider's name - e.g. a tile or quadtree added to the object.
+        The late lookup gives up at the deadline too: its requests'
+        timeouts are cut to the time left, so it doesn't outlive the call.
+        Raises the provider's error if no fallback can answer.
+        """
+
+        if deadline is None or self.__is_local(provider):
+            md = self.md(lat, lon, elev, year, mon, day, provider)
+            return self.__answered(
+                provider, Answer(md, provider), deadline is not None
+            )
+
+        memo_key = self.__memo_key(provider, lat, lon, elev, year, mon, day)
+        if memo_key is not None:
+            md = self.__cache_get(self.memo, "memo", provider, memo_key)
+            if md is not None:
+                return self.__answered(provider, Answer(md, provider))
+
+        with self.__phase("validate", provider):
+            self.__check__all_args(lat, lon, elev, year, mon, day, provider)
+
+        with self.__sessions_lock:
+            if self.__deadline_pool is None:
+                self.__deadline_pool = concurrent.futures.ThreadPoolExecutor(
+                    2 * self.workers
+                )
+        future = self.__deadline_pool.submit(
+            self.__md_until,
+            time.monotonic() + deadline,
+            lat,
+            lon,
+            elev,
+            year,
+            mon,
+            day,
+            provider,
+        )
+        try:
+            md = future.result(timeout=max(deadline, 0.0))
+            return self.__answered(provider, Answer(md, provider))
+        except concurrent.futures.TimeoutError:
+            error = RuntimeError(
+                f"{provider} did not answer within {deadline} s"
+            )
+        except Exception as provider_error:
+            error = provider_error
+
+        answer = self.__fallback(provider, lat, lon, elev, year, mon, day)
+        if answer is None:
+            raise error
+        return self.__answered(provider, answer)
+
+    def close(self):
+        """
+        Stops thread pools of lookups with deadline and of composite
+        providers without waiting for lookups left running, closes HTTP
+        sessions of synchronous lookups.
+        """
+
+        with self.__sessions_lock:
+            pools = (self.__deadline_pool, self.__hedge_pool)
+            self.__deadline_pool = self.__hedge_pool = None
+            sessions = list(self.__sessions.values())
+            self.__sessions.clear()
+        for pool in pools:
+            if pool is not None:
+                pool.shutdown(wait=False)
+        for session in sessions:
+            session.close()
+
+    def field(
+        self,
+        lat=0.0,
+        lon=0.0,
+        elev=0.0,
+        year=2000,
+        mon=1,
+        day=1,
+        provider="NOAA_WMM",
+    ) -> Field:
+        """
+        Returns all magnetic field elements the provider calculates for
+        certain lat/lon and date with a single request. Results are not
+        cached.
+        """
+
+        self.__check__all_args(lat, lon, elev, year, mon, day, provider)
+
+        provider_method = self.__method(provider, "field")
+        if provider_method is None:
+            md = self.__provider_factory(provider)(
+                lat, lon, elev, year, mon, day
+            )
+            return Field(declination=md)
+        return provider_method(lat, lon, elev, year, mon, day)
+
+    def md_many(
+        self, points, provider="NOAA_WMM", deadline=None
+    ) -> typing.List[typing.Optional[float]]:
+        """
+        Returns magnetic declinations for an iterable of
+        (lat, lon, elev, date) points in the same order. Date is either
+        datetime.date or (year, mon, day). Up to self.workers requests are
+        in flight at once over the provider's keep-alive connections.
+        The first failed lookup raises its exception. If deadline (seconds)
+        is set, points not answered within it from the call are answered
+        by fallbacks, see answer().
+        """
+
+        if deadline is not None:
+            end = time.monotonic() + deadline
+
+        def lookup(point):
+            lat, lon, elev, date = point
+            year, mon, day = _split_date(date)
+            if deadline is None:
+                return self.md(lat, lon, elev, year, mon, day, provider)
+            return self.md(
+                lat,
+                lon,
+                elev,
+                year,
+                mon,
+                day,
+                provider,
+                end - time.monotonic(),
+            )
+
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as pool:
+            return list(pool.map(lookup, points))
+
+    def md_grid(
+        self,
+        lat1,
+        lat2,
+        lon1,
+        lon2,
+        lat_step,
+        lon_step,
+        elev=0.0,
+        year=2000,
+        mon=1,
+        day=1,
+        provider="NOAA_WMM",
+        max_cells=GRID_MAX_CELLS,
+    ) -> typing.List[typing.List[float]]:
+        """
+        Returns magnetic declinations on the regular grid from lat1 to lat2
+        and from lon1 to lon2 (inclusive) as rows of latitude, each row is
+        a list of values along longitude.
+        Providers with grid calculator (NOAA) are queried in blocks of no
+        more than max_cells cells, others point by point with md_many().
+        """
+
+        lats = _grid_axis(lat1, lat2, lat_step)
+        lons = _grid_axis(lon1, lon2, lon_step)
+        for lat, lon in ((lats[0], lons[0]), (lats[-1], lons[-1])):
+            self.__check__all_args(lat, lon, elev, year, mon, day, provider)
+
+        grid_method = self.__method(provider, "grid")
+        if grid_method is None:
+            date = (year, mon, day)
+            points = [(lat, lon, elev, date) for lat in lats for lon in lons]
+            mds = iter(self.md_many(points, provider))
+            return [[next(mds) for _ in lons] for _ in lats]
+
+        # blocks of whole rows, rows wider than max_cells are split too
+        width = max(1, min(len(lons), max_cells))
+        height = max(1, max_cells // width)
+        blocks = [
+            (row, col)
+            for row in range(0, len(lats), height)
+            for col in range(0, len(lons), width)
+        ]
+
+        def lookup(block):
+            row, col = block
+            row_end, col_end = row + height, col + width
+            return grid_method(
+                lats[row:row_end],
+                lons[col:col_end],
+                lat_step,
+                lon_step,
+                elev,
+                year,
+                mon,
+                day,
+            )
+
+        grid = [[None] * len(lons) for _ in lats]
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as pool:
+            for (row, col), values in zip(blocks, pool.map(lookup, blocks)):
+                for i, values_row in enumerate(values):
+                    col_end = col + len(values_row)
+                    grid[row + i][col:col_end] = values_row
+        return grid
+
+    def md_series(
+        self,
+        lat=0.0,
+        lon=0.0,
+        elev=0.0,
+        start=(2000, 1, 1),
+        end=(2000, 1, 1),
+        step=1.0,
+        provider="NOAA_WMM",
+    ) -> typing.List[typing.Tuple[float, float]]:
+        """
+        Returns magnetic declinations at the point from start to end date
+        (inclusive) every step years as (decimal year, declination) pairs.
+        Dates are either datetime.date or (year, mon, day).
+        NOAA providers return the whole series in a single request, others
+        are looked up date by date with md_many().
+        """
+
+        start, end = _split_date(start), _split_date(end)
+        self.__check__all_args(lat, lon, elev, *start, provider)
+        self.__check__all_args(lat, lon, elev, *end, provider)
+        first, last = _decimal_year(*start), _decimal_year(*end)
+        if step <= 0.0 or last < first:
+            raise ValueError(f"Incorrect series {start}:{end}:{step}")
+
+        series_method = self.__method(provider, "series")
+        if series_method is not None:
+            return series_method(lat, lon, elev, start, end, step)
+
+        count = int(math.floor((last - first) / step + 1e-9)) + 1
+        dates = [_calendar_date(first + i * step) for i in range(count)]
+        mds = self.md_many(
+            [(lat, lon, elev, date) for date in dates], provider
+        )
+        return [(_decimal_year(*date), md) for date, md in zip(dates, mds)]
+
+    def md_track(
+        self,
+        track,
+        provider="NOAA_WMM",
+        tolerance=0.05,
+        max_distance=250.0,
+    ) -> typing.List[float]:
+        """
+        Returns magnetic declinations for the ordered track of
+        (lat, lon, elev, date) fixes, date is either datetime.date or
+        (year, mon, day). The provider is queried at both ends of the track
+        and at the fixes closest to along-track midpoints of its segments.
+        A segment shorter than max_distance km whose midpoint declination
+        differs from the interpolated one by no more than tolerance degrees
+        is interpolated linearly along the track, otherwise its halves are
+        refined. Midpoints of every refinement round are looked up at once
+        with md_many().
+        """
+
+        fixes = []
+        for lat, lon, elev, date in track:
+            year, mon, day = _split_date(date)
+            self.__check__all_args(lat, lon, elev, year, mon, day, provider)
+            fixes.append((lat, lon, elev, (year, mon, day)))
+        if not fixes:
+            return []
+
+        along = [0.0]
+        for (lat1, lon1, *_), (lat2, lon2, *_) in zip(fixes, fixes[1:]):
+            along.append(along[-1] + _distance(lat1, lon1, lat2, lon2))
+
+        mds = [None] * len(fixes)
+
+        def sample(indexes):
+            points = [fixes[index] for index in indexes]
+            for index, md in zip(indexes, self.md_many(points, provider)):
+                mds[index] = md
+
+        def interpolated(first, last, index):
+            length = along[last] - along[first]
+            if length > 0.0:
+                t = (along[index] - along[first]) / length
+            else:
+                t = (index - first) / (last - first)
+            return _wrap(mds[first] + t * _wrap(mds[last] - mds[first]))
+
+        end = len(fixes) - 1
+        sample(sorted({0, end}))
+        segments = [(0, end)] if end > 1 else []
+        while segments:
+            midpoints = []
+            for first, last in segments:
+                middle = bisect.bisect(
+                    along, (along[first] + along[last]) / 2.0, first, last
+                )
+                middle = max(first + 1, min(middle, last - 1))
+                midpoints.append((first, last, middle))
+            sample([middle for *_, middle in midpoints])
+
+            segments = []
+            for first, last, middle in midpoints:
+                error = _wrap(mds[middle] - interpolated(first, last, middle))
+                if (
+                    along[last] - along[first] > max_distance
+                    or abs(error) > tolerance
+                ):
+                    for half in ((first, middle), (middle, last)):
+                        if half[1] - half[0] > 1:
+                            segments.append(half)
+                    continue
+                for index in range(first + 1, last):
+                    if mds[index] is None:
+                        mds[index] = interpolated(first, last, index)
+        return mds
+
+    def build_tile(
+        self,
+        path,
+        lat1=-90.0,
+        lat2=90.0,
+        lon1=-180.0,
+        lon2=180.0,
+        lat_step=1.0,
+        lon_step=1.0,
+        elev=0.0,
+        year=2000,
+        mon=1,
+        day=1,
+        provider="NOAA_WMM",
+    ):
+        """
+        Precomputes magnetic declinations on the grid with the provider and
+        writes them to the tile file, see add_tile().
+        """
+
+        _provider_name(provider)
+        grid = self.md_grid(
+            lat1,
+            lat2,
+            lon1,
+            lon2,
+            lat_step,
+            lon_step,
+            elev,
+            year,
+            mon,
+            day,
+            provider,
+        )
+        Tile.write(
+            path,
+            _grid_axis(lat1, lat2, lat_step),
+            _grid_axis(lon1, lon2, lon_step),
+            grid,
+            (year, mon, day),
+            provider,
+            float(elev),
+        )
+
+    def add_tile(self, name, path, max_age=0.5, max_elev=0.0):
+        """
+        Registers provider answering from the tile file built with
+        build_tile(). Dates further than max_age years from the tile's
+        date, elevations further than max_elev km from its elevation and
+        points outside of the tile raise exception.
+        """
+
+        tile = Tile(path)
+        self.__tiles[name] = tile
+        self.__methods[name, "md"] = functools.partial(
+            self.__tile_provider, tile, max_age, max_elev
+        )
+
+    def md_array(
+        self,
+        lat,
+        lon,
+        elev=0.0,
+        date=(2000, 1, 1),
+        provider="LOCAL_WMM",
+        processes=None,
+        deadline=None,
+    ):
+        """
+        Returns magnetic declinations for NumPy arrays (or scalars) of
+        points as float64 array of their broadcast shape. Date is
+        datetime.date, (year, mon, day) or array of numpy.datetime64 or of
+        decimal years. LOCAL_WMM/LOCAL_IGRF are evaluated vectorized, split
+        across processes worker processes sharing input and output buffers
+        if set (Python 3.8+), other providers are looked up with md_many()
+        with deadline. Requires numpy.
+        """
+
+        import numpy as np
+
+        if isinstance(date, (datetime.date, tuple)):
+            if not self.__is_date_correct(*_split_date(date)):
+                raise ValueError(f"Incorrect date! {date}")
+        if not self.__is_provider_registered(provider):
+            raise ValueError(f"Unregistered provider {provider}")
+        lat, lon, elev, years = np.broadcast_arrays(
+            *(
+                np.asarray(values, dtype=np.float64)
+                for values in (lat, lon, elev, _decimal_years(date))
+            )
+        )
+        shape = lat.shape
+        lat, lon, elev, years = (
+            np.ascontiguousarray(values).ravel()
+            for values in (lat, lon, elev, years)
+        )
+        if not ((np.abs(lat) <= 90.0).all() and (np.abs(lon) <= 180.0).all()):
+            raise ValueError("Lat and/or Lon beyond limits")
+
+        spec = _provider(provider)
+        if (
+            provider in self.__tiles
+            or not isinstance(spec, tuple)
+            or spec[0] != "LOCAL"
+        ):
+            points = [
+                (*point[:3], _calendar_date(point[3]))
+                for point in zip(lat, lon, elev, years)
+            ]
+            mds = self.md_many(points, provider, deadline)
+            return np.array(mds, dtype=np.float64).reshape(shape)
+
+        model = spec[1]
+        if processes is not None and processes > 1 and len(years) > 1:
+            mds = _declination_pool(model, lat, lon, elev, years, processes)
+        else:
+            mds = np.empty(len(years))
+            _declination_array(model, lat, lon, elev, years, mds)
+        return mds.reshape(shape)
+
+    def md_columns(
+        self, columns, provider="LOCAL_WMM", deadline=None
+    ) -> tuple:
+        """
+        Returns magnetic declinations and statuses of points given as
+        columns of structured (e.g. memory-mapped) NumPy array or mapping
+        of arrays: lat, lon, optional elev and either date (array of
+        numpy.datetime64 or of decimal years) or year, mon, day. Columns
+        are broadcast together, validated and evaluated ARRAY_CHUNK points
+        at a time. Declinations are float64 array (NaN where failed),
+        statuses are uint8 array of STATUS_* codes, both of the columns'
+        shape. LOCAL_WMM/LOCAL_IGRF are evaluated vectorized, other
+        providers are looked up point by point, if deadline (seconds) is
+        set, points not answered within it from the call are answered by
+        fallbacks, see answer(). Requires numpy.
+        """
+
+        import numpy as np
+
+        if not self.__is_provider_registered(provider):
+            raise ValueError(f"Unregistered provider {provider}")
+        if isinstance(columns, np.ndarray):
+            fields = set(columns.dtype.names or ())
+        else:
+            fields = set(columns.keys())
+        dates = ("date",) if "date" in fields else ("year", "mon", "day")
+        names = ["lat", "lon", *dates]
+        missing = set(names) - fields
+        if missing:
+            raise ValueError(f"Missing columns {', '.join(sorted(missing))}")
+        if "elev" in fields:
+            names.append("elev")
+        arrays = np.broadcast_arrays(*(columns[name] for name in names))
+        shape = arrays[0].shape
+        arrays = {
+            name: array.reshape(-1) for name, array in zip(names, arrays)
         }
+        size = arrays["lat"].size
 
-    def md(
+        spec = _provider(provider)
+        local = (
+            provider not in self.__tiles
+            and isinstance(spec, tuple)
+            and spec[0] == "LOCAL"
+        )
+
+        if deadline is not None:
+            end = time.monotonic() + deadline
+
+        def lookup(point):
+            left = None if deadline is None else end - time.monotonic()
+            # points are validated, so any error is the provider's one,
+            # e.g. ValueError of a response that can't be parsed
+            try:
+                return self.md(*point, provider, left), STATUS_OK
+            except Exception:
+                return math.nan, STATUS_FAILED
+
+        mds = np.full(size, np.nan)
+        statuses = np.zeros(size, dtype=np.uint8)
+        for start in range(0, size, ARRAY_CHUNK):
+            chunk = slice(start, start + ARRAY_CHUNK)
+            lat, lon = (
+                np.asarray(arrays[name][chunk], dtype=np.float64)
+                for name in ("lat", "lon")
+            )
+            if "elev" in arrays:
+                elev = np.asarray(arrays["elev"][chunk], dtype=np.float64)
+            else:
+                elev = np.zeros(len(lat))
+            years, correct = _column_years(arrays, chunk)
+            correct &= (np.abs(lat) <= 90.0) & (np.abs(lon) <= 180.0)
+            correct &= np.isfinite(elev)
+            statuses[chunk][~correct] = STATUS_INCORRECT
+
+            if local:
+                valid = correct & _in_model_range(spec[1], years)
+                statuses[chunk][correct & ~valid] = STATUS_FAILED
+                out = np.empty(np.count_nonzero(valid))
+                _declination_array(
+                    spec[1],
+                    lat[valid],
+                    lon[valid],
+                    elev[valid],
+                    years[valid],
+                    out,
+                )
+                mds[chunk][valid] = out
+                continue
+
+            indices = np.flatnonzero(correct)
+            points = (
+                (lat[i], lon[i], elev[i], *_calendar_date(years[i]))
+                for i in indices.tolist()
+            )
+            results = _ordered_map(lookup, points, self.workers)
+            for i, (md, status) in zip(indices.tolist(), results):
+                mds[start + i] = md
+                statuses[start + i] = status
+        return mds.reshape(shape), statuses.reshape(shape)
+
+    def build_quadtree(
+        self,
+        path,
+        lat1=-90.0,
+        lat2=90.0,
+        lon1=-180.0,
+        lon2=180.0,
+        step=10.0,
+        tolerance=0.1,
+        max_depth=8,
+        min_depth=0,
+        elev=0.0,
+        year=2000,
+        mon=1,
+        day=1,
+        provider="NOAA_WMM",
+    ) -> int:
+        """
+        Samples magnetic declinations with the provider on the tree of cells
+        starting from root cells of step degrees and writes it to the
+        quadtree file, see add_quadtree(). A cell is split in four until
+        bilinear interpolation from its corners matches declinations at its
+        center and edges' midpoints within tolerance degrees, or the cell
+        is max_depth levels deep. Cells are always split down to min_depth.
+        Points of every level are looked up at once with md_many().
+        Returns number of provider lookups.
+        """
+
+        lats = _grid_axis(lat1, lat2, step)
+        lons = _grid_axis(lon1, lon2, step)
+        if len(lats) < 2 or len(lons) < 2:
+            raise ValueError(f"Incorrect quadtree root step {step}")
+        for lat, lon in ((lats[0], lons[0]), (lats[-1], lons[-1])):
+            self.__check__all_args(lat, lon, elev, year, mon, day, provider)
+        _provider_name(provider)
+
+        # points are kept on the integer lattice of the deepest cells
+        scale = 2**max_depth
+        unit = step / scale
+        mds = {}
+
+        def sample(points):
+            points = sorted(set(points) - mds.keys())
+            date = (year, mon, day)
+            coordinates = [
+                (lats[0] + i * unit, lons[0] + j * unit, elev, date)
+                for i, j in points
+            ]
+            mds.update(zip(points, self.md_many(coordinates, provider)))
+
+        def corners(i, j, size):
+            return (i, j), (i, j + size), (i + size, j), (i + size, j + size)
+
+        rows, cols = len(lats) - 1, len(lons) - 1
+        nodes = [None] * (rows * cols)
+        leaves = {}
+        cells = [
+            (row * cols + col, row * scale, col * scale, scale, 0)
+            for row in range(rows)
+            for col in range(cols)
+        ]
+        sample(point for cell in cells for point in corners(*cell[1:4]))
+        while cells:
+            probes = {}
+            for _, i, j, size, depth in cells:
+                if depth < max_depth:
+                    half = size // 2
+                    probes[i, j] = [
+                        (i + half, j + half),
+                        (i, j + half),
+                        (i + size, j + half),
+                        (i + half, j),
+                        (i + half, j + size),
+                    ]
+            sample(point for points in probes.values() for point in points)
+
+            children = []
+            for node, i, j, size, depth in cells:
+                values = [mds[point] for point in corners(i, j, size)]
+                if depth < max_depth and (
+                    depth < min_depth
+                    or self.__cell_error(values, probes[i, j], mds) > tolerance
+                ):
+                    first, half = len(nodes), size // 2
+                    nodes[node] = (-first, 0, 0, 0)
+                    nodes.extend([None] * 4)
+                    for k, (ci, cj) in enumerate(corners(i, j, half)):
+                        children.append((first + k, ci, cj, half, depth + 1))
+                else:
+                    leaves[node] = corners(i, j, size)
+            cells = children
+
+        # only leaves' corners are stored
+        indexes = {}
+        for node, points in leaves.items():
+            nodes[node] = tuple(
+                indexes.setdefault(point, len(indexes)) for point in points
+            )
+        QuadTree.write(
+            path,
+            lats[0],
+            lons[0],
+            step,
+            (rows, cols),
+            nodes,
+            [mds[point] for point in indexes],
+            (year, mon, day),
+            provider,
+            float(elev),
+        )
+        return len(mds)
+
+    def add_quadtree(self, name, path, max_age=0.5, max_elev=0.0):
+        """
+        Registers provider answering from the quadtree file built with
+        build_quadtree(). Dates further than max_age years from the tree's
+        date, elevations further than max_elev km from its elevation and
+        points outside of the tree raise exception.
+        """
+
+        tree = QuadTree(path)
+        self.__tiles[name] = tree
+        self.__methods[name, "md"] = functools.partial(
+            self.__tile_provider, tree, max_age, max_elev
+        )
+
+    async def amd(
         self,
         lat=0.0,
         lon=0.0,
@@ -22,15 +2635,136 @@ class MagneticDeclination:
         mon=1,
         day=1,
         provider="NOAA_WMM",
+        deadline=None,
     ) -> typing.Optional[float]:
         """
-        Returns magnetic declination for certain lat/lon and date.
+        Awaitable version of md(), network providers do not block the event
+        loop. Requires aiohttp.
         """
 
-        self.__check__all_args(lat, lon, elev, year, mon, day, provider)
+        if deadline is not None:
+            answer = await self.aanswer(
+                lat, lon, elev, year, mon, day, provider, deadline
+            )
+            return answer.declination
 
-        provider_method = self.__provider_factory(provider)
-        return provider_method(lat, lon, elev, year, mon, day)
+        if self.__method(provider, "async") is None:
+            # local providers never wait for I/O
+            return self.md(lat, lon, elev, year, mon, day, provider)
+
+        memo_key = self.__memo_key(provider, lat, lon, elev, year, mon, day)
+        if memo_key is not None:
+            md = self.__cache_get(self.memo, "memo", provider, memo_key)
+            if md is not None:
+                return md
+
+        with self.__phase("validate", provider):
+            self.__check__all_args(lat, lon, elev, year, mon, day, provider)
+
+        md = cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.key(
+                provider, lat, lon, elev, year, mon, day
+            )
+            md = self.__cache_get(self.cache, "cache", provider, cache_key)
+
+        if md is None and self.temporal is not None:
+            md = self.__temporal_get(provider, lat, lon, elev, year, mon, day)
+
+        if md is None and self.spatial is not None:
+            md = self.__spatial_get(provider, lat, lon, elev, year, mon, day)
+
+        if md is None:
+            md = await self.__dispatch_async(
+                provider, lat, lon, elev, year, mon, day, cache_key
+            )
+
+        if memo_key is not None:
+            self.memo.set(memo_key, md)
+        return md
+
+    async def amd_many(
+        self, points, provider="NOAA_WMM", deadline=None
+    ) -> typing.List[typing.Optional[float]]:
+        """
+        Awaitable version of md_many(), all points are looked up
+        concurrently, at most self.concurrency requests are in flight.
+        """
+
+        import asyncio
+
+        lookups = []
+        for lat, lon, elev, date in points:
+            year, mon, day = _split_date(date)
+            lookups.append(
+                self.amd(lat, lon, elev, year, mon, day, provider, deadline)
+            )
+        return list(await asyncio.gather(*lookups))
+
+    async def aanswer(
+        self,
+        lat=0.0,
+        lon=0.0,
+        elev=0.0,
+        year=2000,
+        mon=1,
+        day=1,
+        provider="NOAA_WMM",
+        deadline=None,
+    ) -> Answer:
+        """
+        Awaitable version of answer(), the late lookup is left to finish
+        as a task of the running loop until aclose().
+        """
+
+        import asyncio
+
+        if deadline is None or self.__is_local(provider):
+            md = await self.amd(lat, lon, elev, year, mon, day, provider)
+            return self.__answered(
+                provider, Answer(md, provider), deadline is not None
+            )
+
+        with self.__phase("validate", provider):
+            self.__check__all_args(lat, lon, elev, year, mon, day, provider)
+
+        task = asyncio.ensure_future(
+            self.amd(lat, lon, elev, year, mon, day, provider)
+        )
+        self.__background[task] = asyncio.get_event_loop()
+        task.add_done_callback(self.__background_done)
+        try:
+            md = await asyncio.wait_for(
+                asyncio.shield(task), max(deadline, 0.0)
+            )
+            return self.__answered(provider, Answer(md, provider))
+        except asyncio.TimeoutError:
+            error = RuntimeError(
+                f"{provider} did not answer within {deadline} s"
+            )
+        except Exception as provider_error:
+            error = provider_error
+
+        answer = self.__fallback(provider, lat, lon, elev, year, mon, day)
+        if answer is None:
+            raise error
+        return self.__answered(provider, answer)
+
+    def latency_stats(self) -> typing.Dict[str, dict]:
+        """
+        Returns latency percentiles (seconds) and error counters of the
+        providers behind composite providers requested so far.
+        """
+
+        return {
+            name: {
+                "p50": stats.percentile(50),
+                "p95": stats.percentile(95),
+                "requests": stats.requests,
+                "errors": stats.errors,
+            }
+            for name, stats in list(self.__latency_stats.items())
+        }
 
     def __check__all_args(
         self, lat, lon, elev, year, mon, day, provider
@@ -44,43 +2778,436 @@ class MagneticDeclination:
         lat = float(lat)
         lon = float(lon)
         elev = float(elev)
-        if any((lat > 90.0, lat < -90.0, lon > 180.0, lon < -180.0)):
+        # NaN fails the comparisons too
+        if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
             raise ValueError(
                 f"Lat and/or Lon beyond limits lat:{lat} lon:{lon}"
             )
+        if not math.isfinite(elev):
+            raise ValueError(f"Incorrect elevation {elev}")
         if not self.__is_date_correct(year, mon, day):
             raise ValueError(f"Incorrect date! {year}-{mon}-{day}")
         if not self.__is_provider_registered(provider):
             raise ValueError(f"Unregistered provider {provider}")
         return True
 
+    def __dispatch(
+        self, provider, lat, lon, elev, year, mon, day, cache_key
+    ) -> float:
+        """
+        Calls the provider and caches the result. Concurrent calls for
+        the same point wait for the first one and share its result or
+        exception.
+        """
+
+        key = (provider, float(lat), float(lon), float(elev), year, mon, day)
+        with self.__inflight_lock:
+            future = self.__inflight.get(key)
+            leader = future is None
+            if leader:
+                future = concurrent.futures.Future()
+                self.__inflight[key] = future
+        if not leader:
+            return future.result()
+
+        try:
+            with self.__phase("provider", provider):
+                if self.__is_temporal(provider):
+                    field = self.__method(provider, "field")(
+                        lat, lon, elev, year, mon, day
+                    )
+                    self.__temporal_set(
+                        provider, lat, lon, elev, year, mon, day, field
+                    )
+                    md = field.declination
+                else:
+                    provider_method = self.__provider_factory(provider)
+                    md = provider_method(lat, lon, elev, year, mon, day)
+            if cache_key is not None:
+                self.cache.set(cache_key, md)
+            if self.__is_spatial(provider):
+                spatial_key = self.spatial.key(provider, elev, year, mon, day)
+                self.spatial.set(spatial_key, lat, lon, md)
+        except Exception as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(md)
+            return md
+        finally:
+            with self.__inflight_lock:
+                del self.__inflight[key]
+
+    async def __dispatch_async(
+        self, provider, lat, lon, elev, year, mon, day, cache_key
+    ) -> float:
+        """Non-blocking version of __dispatch"""
+
+        import asyncio
+
+        async def call():
+            with self.__phase("provider", provider):
+                if self.__is_temporal(provider):
+                    field = await self.__method(provider, "async_field")(
+                        lat, lon, elev, year, mon, day
+                    )
+                    self.__temporal_set(
+                        provider, lat, lon, elev, year, mon, day, field
+                    )
+                    md = field.declination
+                else:
+                    provider_method = self.__method(provider, "async")
+                    md = await provider_method(lat, lon, elev, year, mon, day)
+            if cache_key is not None:
+                self.cache.set(cache_key, md)
+            if self.__is_spatial(provider):
+                spatial_key = self.spatial.key(provider, elev, year, mon, day)
+                self.spatial.set(spatial_key, lat, lon, md)
+            return md
+
+        key = (provider, float(lat), float(lon), float(elev), year, mon, day)
+        inflight = self.__loop_maps()[1].setdefault(
+            asyncio.get_event_loop(), {}
+        )
+        if key not in inflight:
+            inflight[key] = asyncio.ensure_future(call())
+            inflight[key].add_done_callback(lambda _: inflight.pop(key))
+        # a cancelled caller must not cancel the call shared with others
+        return await asyncio.shield(inflight[key])
+
+    def __phase(self, phase, provider) -> typing.ContextManager:
+        """Returns context manager timing the phase if metrics are on"""
+
+        if self.metrics is None:
+            return _untimed()
+        return self.metrics.phase(phase, provider)
+
+    def __cache_get(
+        self, cache, name, provider, key
+    ) -> typing.Optional[float]:
+        """Looks the key up in the cache, records the phase and hit or miss"""
+
+        if self.metrics is None:
+            return cache.get(key)
+        with self.metrics.phase("cache", provider):
+            md = cache.get(key)
+        self.metrics.cache(name, md is not None)
+        return md
+
+    def __is_temporal(self, provider) -> bool:
+        """Checks whether the provider's results are reused over time"""
+
+        return (
+            self.temporal is not None
+            and self.__method(provider, "async_field") is not None
+        )
+
+    def __temporal_get(
+        self, provider, lat, lon, elev, year, mon, day
+    ) -> typing.Optional[float]:
+        """
+        Returns declination extrapolated from the provider's result of
+        another date of the point, None if there is no usable one.
+        """
+
+        if not self.__is_temporal(provider):
+            return None
+        key = self.temporal.key(provider, lat, lon, elev)
+        md = self.temporal.get(key, _decimal_year(year, mon, day))
+        if self.metrics is not None:
+            self.metrics.cache("temporal", md is not None)
+        return md
+
+    def __temporal_set(self, provider, lat, lon, elev, year, mon, day, field):
+        """Stores the provider's result for reuse at other dates"""
+
+        key = self.temporal.key(provider, lat, lon, elev)
+        self.temporal.set(key, _decimal_year(year, mon, day), field)
+
+    def __is_spatial(self, provider) -> bool:
+        """Checks whether the provider's results are reused nearby"""
+
+        return (
+            self.spatial is not None
+            and self.__method(provider, "async") is not None
+        )
+
+    def __spatial_get(
+        self, provider, lat, lon, elev, year, mon, day
+    ) -> typing.Optional[float]:
+        """
+        Returns declination of the provider's results of neighbouring
+        points, None if there are no usable ones.
+        """
+
+        if not self.__is_spatial(provider):
+            return None
+        key = self.spatial.key(provider, elev, year, mon, day)
+        md = self.spatial.get(key, lat, lon)
+        if self.metrics is not None:
+            self.metrics.cache("spatial", md is not None)
+        return md
+
+    def __retried(self, service):
+        """Records retry of the service's request if metrics are on"""
+
+        if self.metrics is not None:
+            self.metrics.retry(service)
+
+    def __memo_key(self, provider, lat, lon, elev, year, mon, day):
+        """
+        Returns memo key of the point or None if memo is off. Dates of
+        wrong type and lat/lon beyond limits (rounded, they could match a
+        point within) get no key, they are left to the validation.
+        """
+
+        if self.memo is None or not self.__all_ints(year, mon, day):
+            return None
+        try:
+            if not (abs(float(lat)) <= 90.0 and abs(float(lon)) <= 180.0):
+                return None
+        except (TypeError, ValueError):
+            return None
+        return self.memo.key(provider, lat, lon, elev, year, mon, day)
+
     def __all_ints(self, *args) -> bool:
         """Checks whether all args are integeres"""
 
-        return all(map(lambda x: isinstance(x, int), args)) if args else None
+        return all(map(lambda x: isinstance(x, int), args)) if args else None
+
+    def __is_provider_registered(self, provider_name) -> bool:
+        """
+        Returns True if the provider is registered and a callable object is
+        assigned to that provider. Otherwise False returned.
+        """
+
+        return callable(self.__method(provider_name))
+
+    def __is_local(self, provider) -> bool:
+        """Checks whether the provider answers without network requests"""
+
+        spec = _provider(provider)
+        return provider in self.__tiles or (
+            isinstance(spec, tuple) and spec[0] == "LOCAL"
+        )
+
+    def __fallback(
+        self, provider, lat, lon, elev, year, mon, day
+    ) -> typing.Optional[Answer]:
+        """
+        Returns answer of the first of self.fallbacks that can answer in
+        place of the provider, None if none can.
+        """
+
+        for source in self.fallbacks:
+            md = None
+            if source == "cache":
+                key = self.__memo_key(provider, lat, lon, elev, year, mon, day)
+                if key is not None:
+                    md = self.memo.get(key)
+                if md is None and self.cache is not None:
+                    key = self.cache.key(
+                        provider, lat, lon, elev, year, mon, day
+                    )
+                    md = self.cache.get(key, stale=True)
+            elif source == "spatial":
+                if self.spatial is not None:
+                    key = self.spatial.key(provider, elev, year, mon, day)
+                    md = self.spatial.nearest(key, lat, lon)
+            else:
+                if source == "local":
+                    spec = _provider(provider)
+                    igrf = isinstance(spec, tuple) and spec[1] == "IGRF"
+                    source = "LOCAL_IGRF" if igrf else "LOCAL_WMM"
+                try:
+                    md = self.md(lat, lon, elev, year, mon, day, source)
+                except Exception:
+                    continue
+            if md is not None:
+                return Answer(md, source)
+        return None
+
+    def __answered(self, provider, answer, record=True) -> Answer:
+        """Records the source of the answer within deadline"""
+
+        if self.metrics is not None and record:
+            self.metrics.answer(provider, answer.source)
+        return answer
+
+    def __md_until(self, end, lat, lon, elev, year, mon, day, provider):
+        """md() whose HTTP requests give up at end (time.monotonic())"""
+
+        _deadline.end = end
+        try:
+            return self.md(lat, lon, elev, year, mon, day, provider)
+        finally:
+            _deadline.end = None
+
+    def __background_done(self, task):
+        """Forgets the finished late lookup, its error is not raised"""
+
+        self.__background.pop(task, None)
+        if not task.cancelled():
+            task.exception()
+
+    def __is_date_correct(self, year, mon, day) -> bool:
+        """Checks whether date is correct"""
+        return self.__all_ints(year, mon, day) and (
+            (mon in (1, 3, 5, 7, 8, 10, 12) and day in range(1, 32))
+            or (mon == 2 and day in range(1, 30))
+            or (mon in (4, 6, 9, 11) and day in range(1, 31))
+        )
+
+    def __provider_factory(self, provider_name: str) -> bool:
+        """Returns callable according to the provider's name"""
+
+        return self.__method(provider_name)
+
+    def __method(
+        self, provider, kind="md"
+    ) -> typing.Optional[typing.Callable]:
+        """
+        Returns the provider's callable for the kind of lookup (md, field,
+        async, async_field, grid, series) or None if the provider is not
+        registered or does not support it. Callables are bound on first use.
+        """
+
+        method = self.__methods.get((provider, kind))
+        if method is not None:
+            return method
+        spec = _provider(provider)
+        if spec is None:
+            return None
+        if isinstance(spec, tuple):
+            service, model = spec
+            function = self.__SERVICE_METHODS[service].get(kind)
+            if function is not None:
+                method = functools.partial(function, self, model)
+        elif kind == "md":
+            method = functools.partial(spec, self)
+        self.__methods[provider, kind] = method
+        return method
+
+    def __session(self, service) -> "requests.Session":
+        """
+        Returns HTTP session of the service, the session is created on first
+        use and keeps up to self.workers connections alive.
+        """
+
+        import requests
+
+        with self.__sessions_lock:
+            if service not in self.__sessions:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=1, pool_maxsize=self.workers
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self.__sessions[service] = session
+            return self.__sessions[service]
+
+    def __retry_delay(self, attempt, retry_after=None) -> float:
+        """
+        Returns jittered exponential delay before the retry, not less than
+        server's Retry-After (seconds).
+        """
+
+        delay = random.uniform(0.5, 1.5) * self.backoff * 2**attempt
+        try:
+            return max(delay, float(retry_after))
+        except (TypeError, ValueError):
+            return delay
 
-    def __is_provider_registered(self, provider_name) -> bool:
+    def __get(self, service, url) -> str:
         """
-        Returns True if the provider is registered and a callable object is
-        assigned to that provider. Otherwise False returned.
+        HTTP GET with the service's rate limit, timeouts and retries.
+        Returns response body, raises exception if the request fails.
         """
 
-        return provider_name in self.__providers and callable(
-            self.__providers[provider_name]
+        import requests
+
+        limiter = self.__rate_limiters.get(service)
+        for attempt in range(self.retries + 1):
+            if limiter is not None:
+                limiter.acquire()
+            left = _time_left()
+            if left is not None and left <= 0.0:
+                raise RuntimeError(f"{service} request is past deadline")
+            last_attempt = attempt == self.retries
+            try:
+                md_request = self.__session(service).get(
+                    url, timeout=_bounded(self.timeout, left)
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                if last_attempt:
+                    raise
+                self.__retried(service)
+                time.sleep(_bounded(self.__retry_delay(attempt), _time_left()))
+                continue
+
+            if md_request.status_code in RETRY_STATUSES and not last_attempt:
+                retry_after = md_request.headers.get("Retry-After")
+                self.__retried(service)
+                time.sleep(
+                    _bounded(
+                        self.__retry_delay(attempt, retry_after), _time_left()
+                    )
+                )
+                continue
+            if md_request.status_code != requests.codes.ok:
+                raise RuntimeError("Unknown result")
+            return md_request.text
+
+    def __noaa_url(self, model, lat, lon, elev, year, mon, day) -> str:
+        """Returns NOAA calculator request URL"""
+
+        BASE_URL_NOAA = (
+            "{base}/geomag-web/"
+            "calculators/calculateDeclination?"
+            "lat1={lat:f}&lon1={lon:f}&startYear={year:d}&"
+            "startMonth={mon:02d}&startDay={day:02d}&resultFormat={form}&"
+            "model={model}"
         )
 
-    def __is_date_correct(self, year, mon, day) -> bool:
-        """Checks whether date is correct"""
-        return self.__all_ints(year, mon, day) and (
-            (mon in (1, 3, 5, 7, 8, 10, 12) and day in range(1, 32))
-            or (mon == 2 and day in range(1, 30))
-            or (mon in (4, 6, 9, 11) and day in range(1, 31))
+        FORMAT_NOAA = "xml"
+
+        return BASE_URL_NOAA.format(
+            base=self.urls["NOAA"],
+            lat=lat,
+            lon=lon,
+            year=year,
+            mon=mon,
+            day=day,
+            form=FORMAT_NOAA,
+            model=model,
         )
 
-    def __provider_factory(self, provider_name: str) -> bool:
-        """Returns callable according to the provider's name"""
+    def __noaa_parse(self, text) -> Field:
+        """Extracts magnetic field elements from NOAA XML response"""
+
+        import xml.etree.ElementTree as ET
+
+        md_xml_tree = ET.fromstring(text)
+        md = float(
+            md_xml_tree.find("./result/declination").text.strip("\n")
+        )
+
+        elements = {}
+        for element in ("declination_sv", "declination_uncertainty"):
+            value = md_xml_tree.find(f"./result/{element}")
+            if value is not None:
+                elements[element] = float(value.text.strip("\n"))
+
+        return Field(declination=md, **elements)
+
+    def __noaa_get(self, model, lat, lon, elev, year, mon, day) -> str:
+        """Requests NOAA calculator, returns response body"""
 
-        return self.__providers[provider_name]
+        with self.__phase("http", f"NOAA_{model}"):
+            return self.__get(
+                "NOAA", self.__noaa_url(model, lat, lon, elev, year, mon, day)
+            )
 
     def __noaa_provider(self, model, lat, lon, elev, year, mon, date) -> float:
         """
@@ -93,37 +3220,178 @@ class MagneticDeclination:
         https://www.ngdc.noaa.gov/geomag/calculators/magcalc.shtml
         """
 
-        BASE_URL_NOAA = (
-            "https://www.ngdc.noaa.gov/geomag-web/"
-            "calculators/calculateDeclination?"
-            "lat1={lat:f}&lon1={lon:f}&startYear={year:d}&"
-            "startMonth={mon:02d}&startDay={day:02d}&resultFormat={form}&"
-            "model={model}"
+        text = self.__noaa_get(model, lat, lon, elev, year, mon, date)
+        with self.__phase("parse", f"NOAA_{model}"):
+            return self.__noaa_parse(text).declination
+
+    def __noaa_field_provider(
+        self, model, lat, lon, elev, year, mon, day
+    ) -> Field:
+        """
+        Same as __noaa_provider, but returns declination, its secular
+        variation and uncertainty.
+        """
+
+        text = self.__noaa_get(model, lat, lon, elev, year, mon, day)
+        with self.__phase("parse", f"NOAA_{model}"):
+            return self.__noaa_parse(text)
+
+    def __noaa_series_provider(
+        self, model, lat, lon, elev, start, end, step
+    ) -> typing.List[typing.Tuple[float, float]]:
+        """
+        Retrieves magnetic declinations for the date range with a single
+        request to NOAA calculator.
+        """
+
+        SERIES_NOAA = (
+            "&endYear={year:d}&endMonth={mon:02d}&endDay={day:02d}&"
+            "dateStepSize={step:f}"
+        )
+
+        import xml.etree.ElementTree as ET
+
+        year, mon, day = end
+        text = self.__get(
+            "NOAA",
+            self.__noaa_url(model, lat, lon, elev, *start)
+            + SERIES_NOAA.format(year=year, mon=mon, day=day, step=step),
+        )
+
+        return [
+            (
+                float(result.find("date").text),
+                float(result.find("declination").text),
+            )
+            for result in ET.fromstring(text).iterfind("./result")
+        ]
+
+    def __noaa_grid_provider(
+        self, model, lats, lons, lat_step, lon_step, elev, year, mon, day
+    ) -> typing.List[typing.List[float]]:
+        """
+        Retrieves magnetic declinations on the grid with a single request
+        to NOAA grid calculator.
+        https://www.ngdc.noaa.gov/geomag/calculators/help/gridHelp.html
+        """
+
+        BASE_URL_NOAA_GRID = (
+            "{base}/geomag-web/"
+            "calculators/calculateGrid?"
+            "lat1={lat1:f}&lat2={lat2:f}&latStepSize={lat_step:f}&"
+            "lon1={lon1:f}&lon2={lon2:f}&lonStepSize={lon_step:f}&"
+            "elevation={elev:f}&elevationUnits=K&magneticComponent=d&"
+            "startYear={year:d}&startMonth={mon:02d}&startDay={day:02d}&"
+            "resultFormat={form}&model={model}"
         )
 
         FORMAT_NOAA = "xml"
 
-        md_request = requests.get(
-            BASE_URL_NOAA.format(
-                lat=lat,
-                lon=lon,
+        import xml.etree.ElementTree as ET
+
+        text = self.__get(
+            "NOAA",
+            BASE_URL_NOAA_GRID.format(
+                base=self.urls["NOAA"],
+                lat1=lats[0],
+                lat2=lats[-1],
+                lat_step=lat_step,
+                lon1=lons[0],
+                lon2=lons[-1],
+                lon_step=lon_step,
+                elev=elev,
                 year=year,
                 mon=mon,
-                day=date,
+                day=day,
                 form=FORMAT_NOAA,
                 model=model,
+            ),
+        )
+
+        grid = [[None] * len(lons) for _ in lats]
+        for result in ET.fromstring(text).iterfind("./result"):
+            lat = float(result.find("latitude").text)
+            lon = float(result.find("longitude").text)
+            row = round((lat - lats[0]) / lat_step)
+            col = round((lon - lons[0]) / lon_step)
+            if 0 <= row < len(lats) and 0 <= col < len(lons):
+                grid[row][col] = float(result.find("declination").text)
+
+        if any(md is None for values in grid for md in values):
+            raise RuntimeError("Incomplete grid result")
+        return grid
+
+    async def __noaa_provider_async(
+        self, model, lat, lon, elev, year, mon, day
+    ) -> float:
+        """Non-blocking version of __noaa_provider"""
+
+        field = await self.__noaa_field_provider_async(
+            model, lat, lon, elev, year, mon, day
+        )
+        return field.declination
+
+    async def __noaa_field_provider_async(
+        self, model, lat, lon, elev, year, mon, day
+    ) -> Field:
+        """Non-blocking version of __noaa_field_provider"""
+
+        with self.__phase("http", f"NOAA_{model}"):
+            text = await self.__async_get(
+                "NOAA", self.__noaa_url(model, lat, lon, elev, year, mon, day)
             )
+        with self.__phase("parse", f"NOAA_{model}"):
+            return self.__noaa_parse(text)
+
+    def __bgs_url(self, model, lat, lon, elev, year, mon, day) -> str:
+        """Returns BGS calculator request URL"""
+
+        BASE_URL_BGS = (
+            "{base}/web_service/GMModels/wmm/2020/?"
+            "latitude={lat:f}&longitude={lon:f}&altitude={elev:f}"
+            "&date={date:s}&format={form}"
         )
+        FORMAT_BGS = "json"
 
-        if md_request.status_code != requests.codes.ok:
-            raise RuntimeError(f"Unknown result")
+        date = "{0}-{1}-{2}".format(year, mon, day)
 
-        md_xml_tree = ET.fromstring(md_request.text)
-        md = float(
-            md_xml_tree.find("./result/declination").text.strip("\n")
+        return BASE_URL_BGS.format(
+            base=self.urls["BGS"],
+            lat=lat,
+            lon=lon,
+            elev=elev,
+            date=date,
+            form=FORMAT_BGS,
         )
 
-        return md
+    def __bgs_parse(self, text) -> Field:
+        """Extracts magnetic field elements from BGS JSON response"""
+
+        result = json.loads(text)["geomagnetic-field-model-result"]
+        md = float(result["field-value"]["declination"]["value"])
+
+        elements = {}
+        groups = (("field-value", ""), ("secular-variation", "_sv"))
+        for group, suffix in groups:
+            for element, value in result.get(group, {}).items():
+                name = element.replace("-", "_") + suffix
+                if name in Field._fields and name != "declination":
+                    elements[name] = float(value["value"])
+        # angles' secular variation is in arcmin/year
+        for name in ("declination_sv", "inclination_sv"):
+            if name in elements:
+                elements[name] /= 60.0
+
+        # все ОК, возвращаем результат
+        return Field(declination=md, **elements)
+
+    def __bgs_get(self, model, lat, lon, elev, year, mon, day) -> str:
+        """Requests BGS calculator, returns response body"""
+
+        with self.__phase("http", f"BGS_{model}"):
+            return self.__get(
+                "BGS", self.__bgs_url(model, lat, lon, elev, year, mon, day)
+            )
 
     def __bgs_provider(self, model, lat, lon, elev, year, mon, day) -> float:
         """
@@ -133,29 +3401,950 @@ class MagneticDeclination:
         http://www.geomag.bgs.ac.uk/data_service/models_compass/wmm_calc.html
         """
 
-        BASE_URL_BGS = (
-            "http://geomag.bgs.ac.uk/web_service/GMModels/wmm/2020/?"
-            "latitude={lat:f}&longitude={lon:f}&altitude={elev:f}"
-            "&date={date:s}&format={form}"
+        text = self.__bgs_get(model, lat, lon, elev, year, mon, day)
+        with self.__phase("parse", f"BGS_{model}"):
+            return self.__bgs_parse(text).declination
+
+    def __bgs_field_provider(
+        self, model, lat, lon, elev, year, mon, day
+    ) -> Field:
+        """
+        Same as __bgs_provider, but returns all field elements and their
+        secular variation.
+        """
+
+        text = self.__bgs_get(model, lat, lon, elev, year, mon, day)
+        with self.__phase("parse", f"BGS_{model}"):
+            return self.__bgs_parse(text)
+
+    async def __bgs_provider_async(
+        self, model, lat, lon, elev, year, mon, day
+    ) -> float:
+        """Non-blocking version of __bgs_provider"""
+
+        field = await self.__bgs_field_provider_async(
+            model, lat, lon, elev, year, mon, day
         )
-        FORMAT_BGS = "json"
+        return field.declination
 
-        date = "{0}-{1}-{2}".format(year, mon, day)
+    async def __bgs_field_provider_async(
+        self, model, lat, lon, elev, year, mon, day
+    ) -> Field:
+        """Non-blocking version of __bgs_field_provider"""
+
+        with self.__phase("http", f"BGS_{model}"):
+            text = await self.__async_get(
+                "BGS", self.__bgs_url(model, lat, lon, elev, year, mon, day)
+            )
+        with self.__phase("parse", f"BGS_{model}"):
+            return self.__bgs_parse(text)
+
+    def __loop_maps(self) -> tuple:
+        """
+        Returns asynchronous lookups' maps by event loop: HTTP sessions
+        by service and lookups in flight, both are created on first use.
+        """
+
+        if self.__async_states is None:
+            with self.__sessions_lock:
+                if self.__async_states is None:
+                    self.__async_inflight = weakref.WeakKeyDictionary()
+                    self.__async_states = weakref.WeakKeyDictionary()
+        return self.__async_states, self.__async_inflight
+
+    def __async_state(self, service) -> list:
+        """
+        Returns [aiohttp.ClientSession, asyncio.Semaphore] of the service
+        for the running event loop, both are created on first use.
+        """
+
+        import asyncio
+
+        loop = asyncio.get_event_loop()
+        services = self.__loop_maps()[0].setdefault(loop, {})
+        if service not in services:
+            import aiohttp
 
-        md_request = requests.get(
-            BASE_URL_BGS.format(
-                lat=lat, lon=lon, elev=elev, date=date, form=FORMAT_BGS
+            connect, read = self.timeout
+            connector = aiohttp.TCPConnector(limit=self.concurrency)
+            timeout = aiohttp.ClientTimeout(
+                sock_connect=connect, sock_read=read
             )
+            services[service] = [
+                aiohttp.ClientSession(connector=connector, timeout=timeout),
+                asyncio.Semaphore(self.concurrency),
+            ]
+        return services[service]
+
+    async def __async_get(self, service, url) -> str:
+        """
+        Non-blocking version of __get, no more than self.concurrency
+        requests to the service are in flight at once.
+        """
+
+        import asyncio
+
+        if "aiohttp" not in sys.modules:
+            # the first import takes a while, it must not block the loop
+            # and so deadlines of the lookups running on it
+            await asyncio.get_event_loop().run_in_executor(
+                None, __import__, "aiohttp"
+            )
+        import aiohttp
+
+        session, semaphore = self.__async_state(service)
+        limiter = self.__rate_limiters.get(service)
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            async with semaphore:
+                if limiter is not None:
+                    await asyncio.sleep(limiter.reserve())
+                try:
+                    async with session.get(url) as md_request:
+                        status = md_request.status
+                        retry_after = md_request.headers.get("Retry-After")
+                        text = await md_request.text()
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    if last_attempt:
+                        raise
+                    status, retry_after = None, None
+
+            if status == 200:
+                return text
+            retry = status is None or status in RETRY_STATUSES
+            if last_attempt or not retry:
+                raise RuntimeError("Unknown result")
+            self.__retried(service)
+            await asyncio.sleep(self.__retry_delay(attempt, retry_after))
+
+    async def aclose(self):
+        """
+        Cancels late lookups left in the background and closes HTTP
+        sessions of asynchronous lookups of the running loop.
+        """
+
+        import asyncio
+
+        loop = asyncio.get_event_loop()
+        tasks = [
+            task
+            for task, task_loop in list(self.__background.items())
+            if task_loop is loop
+        ]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        if self.__async_states is None:
+            return
+        services = self.__async_states.pop(loop, {})
+        for session, _ in services.values():
+            await session.close()
+
+    def __local_provider(self, model, lat, lon, elev, year, mon, day) -> float:
+        """
+        Calculates magnetic declination locally from the model's
+        coefficient files, no network access required.
+        Elevation is in kilometers above MSL.
+        Raises exception if the date is out of model's range.
+        """
+
+        decimal_year = _decimal_year(year, mon, day)
+        return self.__local_model(model, decimal_year).declination(
+            float(lat), float(lon), float(elev), decimal_year
         )
 
-        if md_request.status_code != requests.codes.ok:
-            raise RuntimeError(f"Unknown result")
+    def __local_field_provider(
+        self, model, lat, lon, elev, year, mon, day
+    ) -> Field:
+        """
+        Same as __local_provider, but returns all field elements and their
+        secular variation.
+        """
 
-        md = float(
-            md_request.json()["geomagnetic-field-model-result"][
-                "field-value"
-            ]["declination"]["value"]
+        decimal_year = _decimal_year(year, mon, day)
+        return self.__local_model(model, decimal_year).elements(
+            float(lat), float(lon), float(elev), decimal_year
         )
 
-        # все ОК, возвращаем результат
-        return md
+    def __local_model(self, model, decimal_year) -> SphericalHarmonicModel:
+        """Returns the model's coefficients set valid for the date"""
+
+        for sh_model in _load_models(model):
+            if sh_model.is_valid(decimal_year):
+                return sh_model
+
+        raise RuntimeError(f"Date is out of {model} range {decimal_year}")
+
+    def __tile_provider(
+        self, tile, max_age, max_elev, lat, lon, elev, year, mon, day
+    ) -> float:
+        """
+        Interpolates magnetic declination from the precomputed tile (or
+        quadtree) of close enough date and elevation.
+        """
+
+        if abs(_decimal_year(year, mon, day) - tile.epoch) > max_age:
+            raise RuntimeError(
+                f"Date is too far from tile date {year}-{mon}-{day}"
+            )
+        if abs(float(elev) - tile.elev) > max_elev:
+            raise RuntimeError(
+                f"Elevation is too far from tile elevation {tile.elev}: {elev}"
+            )
+        return tile.declination(float(lat), float(lon))
+
+    def __cell_error(self, corners, probes, mds) -> float:
+        """
+        Returns the largest difference between declinations at the cell's
+        probes (center, south, north, west and east edges' midpoints) and
+        those interpolated from its corners.
+        """
+
+        fractions = (
+            (0.5, 0.5),
+            (0.0, 0.5),
+            (1.0, 0.5),
+            (0.5, 0.0),
+            (0.5, 1.0),
+        )
+        return max(
+            abs(_wrap(mds[probe] - _bilinear(corners, *fraction)))
+            for probe, fraction in zip(probes, fractions)
+        )
+
+    def __hedge_order(self, members) -> typing.List[str]:
+        """Returns members ordered by expected latency"""
+
+        return sorted(members, key=lambda name: self.__latency(name).score())
+
+    def __latency(self, name) -> LatencyStats:
+        """Returns latency stats of the member, created on first use"""
+
+        stats = self.__latency_stats.get(name)
+        if stats is None:
+            with self.__sessions_lock:
+                stats = self.__latency_stats.setdefault(name, LatencyStats())
+        return stats
+
+    def __hedge_timeout(self, name) -> float:
+        """Returns delay before hedging the provider's request"""
+
+        stats = self.__latency(name)
+        if stats.requests < 10:
+            return self.hedge_delay
+        return stats.percentile(95) or self.hedge_delay
+
+    def __hedged_provider(
+        self, members, lat, lon, elev, year, mon, day
+    ) -> float:
+        """
+        Composite provider: requests the member with the best recent
+        latency, if it does not answer within hedge delay (or fails) the
+        next member is requested too. The first answer wins, the rest
+        are cancelled (requests already sent are left to finish in the
+        background). Raises the last error if all members fail.
+        """
+
+        with self.__sessions_lock:
+            if self.__hedge_pool is None:
+                self.__hedge_pool = concurrent.futures.ThreadPoolExecutor(
+                    2 * self.workers
+                )
+
+        end = getattr(_deadline, "end", None)
+
+        def call(name):
+            # members' requests give up at the caller's deadline
+            _deadline.end = end
+            stats = self.__latency(name)
+            start = time.monotonic()
+            try:
+                md = self.__method(name)(lat, lon, elev, year, mon, day)
+            except Exception:
+                stats.record(time.monotonic() - start, ok=False)
+                raise
+            finally:
+                _deadline.end = None
+            stats.record(time.monotonic() - start)
+            return md
+
+        remaining = self.__hedge_order(members)
+        futures = set()
+        error = None
+        while remaining or futures:
+            timeout = None
+            if remaining:
+                name = remaining.pop(0)
+                futures.add(self.__hedge_pool.submit(call, name))
+                timeout = self.__hedge_timeout(name) if remaining else None
+            done, futures = concurrent.futures.wait(
+                futures, timeout, concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                if future.exception() is None:
+                    for loser in futures:
+                        loser.cancel()
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def __hedged_provider_async(
+        self, members, lat, lon, elev, year, mon, day
+    ) -> float:
+        """Non-blocking version of __hedged_provider, losers are cancelled"""
+
+        import asyncio
+
+        async def call(name):
+            stats = self.__latency(name)
+            start = time.monotonic()
+            try:
+                md = await self.__method(name, "async")(
+                    lat, lon, elev, year, mon, day
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                stats.record(time.monotonic() - start, ok=False)
+                raise
+            stats.record(time.monotonic() - start)
+            return md
+
+        remaining = self.__hedge_order(members)
+        tasks = set()
+        error = None
+        try:
+            while remaining or tasks:
+                timeout = None
+                if remaining:
+                    name = remaining.pop(0)
+                    tasks.add(asyncio.ensure_future(call(name)))
+                    timeout = self.__hedge_timeout(name) if remaining else None
+                done, tasks = await asyncio.wait(
+                    tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    # built-in services' methods by lookup kind
+    __SERVICE_METHODS = {
+        "NOAA": {
+            "md": __noaa_provider,
+            "field": __noaa_field_provider,
+            "async": __noaa_provider_async,
+            "async_field": __noaa_field_provider_async,
+            "grid": __noaa_grid_provider,
+            "series": __noaa_series_provider,
+        },
+        "BGS": {
+            "md": __bgs_provider,
+            "field": __bgs_field_provider,
+            "async": __bgs_provider_async,
+            "async_field": __bgs_field_provider_async,
+        },
+        "LOCAL": {
+            "md": __local_provider,
+            "field": __local_field_provider,
+        },
+        "ANY": {
+            "md": __hedged_provider,
+            "async": __hedged_provider_async,
+        },
+    }
+
+
+class Server:
+    """
+    HTTP server sharing one MagneticDeclination object between clients.
+    Concurrent point lookups are collected into micro-batches of up to
+    batch_size points or max_wait seconds, every batch is deduplicated and
+    resolved per provider: local models vectorized with md_array(),
+    network providers concurrently with amd() (so through the object's
+    caches and coalescing), other providers on the default thread pool.
+
+    GET /md?lat=&lon=&elev=&date= (or year, mon, day) returns the point
+    with declination and error added, POST /md takes a JSON array of such
+    points and returns them annotated in order. provider is taken from the
+    point, the query string or the server's default. GET /health, GET
+    /stats and, if the object has metrics, GET /metrics are served too.
+    """
+
+    def __init__(
+        self,
+        md_object=None,
+        provider="NOAA_WMM",
+        batch_size=64,
+        max_wait=0.005,
+        max_queue=10000,
+        max_body=1 << 20,
+    ):
+        self.md_object = md_object or MagneticDeclination()
+        self.provider = provider
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.max_body = max_body
+        self.port = None
+        self.requests = 0
+        self.points = 0
+        self.unique_points = 0
+        self.batches = 0
+        self.__server = None
+        self.__queue = None
+        self.__batcher_task = None
+        self.__getter = None
+        self.__tasks = set()
+        self.__connections = {}
+        self.__started = None
+
+    async def start(self, host="127.0.0.1", port=8080) -> "Server":
+        """Starts listening, port 0 picks a free port (see self.port)"""
+
+        import asyncio
+
+        loop = asyncio.get_event_loop()
+        self.__queue = asyncio.Queue(self.max_queue)
+        self.__batcher_task = loop.create_task(self.__batcher())
+        self.__server = await asyncio.start_server(
+            self.__connected, host, port
+        )
+        self.port = self.__server.sockets[0].getsockname()[1]
+        self.__started = time.monotonic()
+        return self
+
+    async def close(self):
+        """
+        Stops listening and batching, points being resolved are answered,
+        queued ones fail. Closes connections and the object's sessions.
+        """
+
+        import asyncio
+
+        if self.__server is not None:
+            self.__server.close()
+            await self.__server.wait_closed()
+            self.__server = None
+        if self.__batcher_task is not None:
+            self.__batcher_task.cancel()
+        queued = []
+        if self.__getter is not None and not self.__getter.cancel():
+            queued.append(self.__getter.result())
+        self.__batcher_task = self.__getter = None
+        while self.__queue is not None and not self.__queue.empty():
+            queued.append(self.__queue.get_nowait())
+        for _, _, future in queued:
+            if not future.done():
+                future.set_exception(RuntimeError("server is closed"))
+        await asyncio.gather(*self.__tasks, return_exceptions=True)
+        for writer in self.__connections:
+            writer.close()
+        await asyncio.gather(
+            *self.__connections.values(), return_exceptions=True
+        )
+        await self.md_object.aclose()
+
+    def run(self, host="127.0.0.1", port=8080):
+        """Serves until interrupted"""
+
+        import asyncio
+
+        async def serve():
+            await self.start(host, port)
+            try:
+                # cancelled on interrupt
+                await asyncio.Event().wait()
+            finally:
+                await self.close()
+
+        try:
+            _run(serve())
+        except KeyboardInterrupt:
+            pass
+
+    async def lookup(
+        self, lat, lon, elev, year, mon, day, provider=None
+    ) -> typing.Optional[float]:
+        """
+        Returns magnetic declination resolved in the next micro-batch,
+        waits while max_queue points are queued.
+        """
+
+        import asyncio
+
+        future = asyncio.get_event_loop().create_future()
+        await self.__queue.put(
+            (
+                (lat, lon, elev, year, mon, day),
+                provider or self.provider,
+                future,
+            )
+        )
+        return await future
+
+    def stats(self) -> dict:
+        """
+        Returns request, point and batch counters, queue length, uptime,
+        latency of composite providers' members and the object's caches'
+        stats.
+        """
+
+        caches = {}
+        for name in ("memo", "cache", "temporal", "spatial"):
+            cache = getattr(self.md_object, name)
+            if hasattr(cache, "stats"):
+                caches[name] = cache.stats()
+        return {
+            "requests": self.requests,
+            "points": self.points,
+            "unique_points": self.unique_points,
+            "batches": self.batches,
+            "mean_batch": self.points / self.batches if self.batches else None,
+            "queued": self.__queue.qsize() if self.__queue else 0,
+            "uptime": (
+                time.monotonic() - self.__started if self.__started else 0.0
+            ),
+            "providers": self.md_object.latency_stats(),
+            "caches": caches,
+        }
+
+    async def __batcher(self):
+        """Collects queued points into batches and resolves them"""
+
+        import asyncio
+
+        loop = asyncio.get_event_loop()
+        while True:
+            if self.__getter is None:
+                self.__getter = loop.create_task(self.__queue.get())
+            batch = [await self.__getter]
+            self.__getter = None
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.__queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                # the pending get is kept for the next batch on timeout
+                self.__getter = loop.create_task(self.__queue.get())
+                done, _ = await asyncio.wait((self.__getter,), timeout=timeout)
+                if not done:
+                    break
+                batch.append(self.__getter.result())
+                self.__getter = None
+            task = loop.create_task(self.__resolve(batch))
+            self.__tasks.add(task)
+            task.add_done_callback(self.__tasks.discard)
+
+    async def __resolve(self, batch):
+        """Resolves the batch, identical points share one lookup"""
+
+        import asyncio
+
+        groups = {}
+        for point, provider, future in batch:
+            groups.setdefault(provider, {}).setdefault(point, []).append(
+                future
+            )
+        self.batches += 1
+        self.points += len(batch)
+        self.unique_points += sum(len(group) for group in groups.values())
+        await asyncio.gather(
+            *(
+                self.__resolve_group(provider, waiters)
+                for provider, waiters in groups.items()
+            )
+        )
+
+    async def __resolve_group(self, provider, waiters):
+        """Resolves the points of one provider and wakes their waiters"""
+
+        points = list(waiters)
+        try:
+            results = await self.__lookup_group(provider, points)
+        except Exception as error:
+            results = [error] * len(points)
+        for point, result in zip(points, results):
+            for future in waiters[point]:
+                if future.done():
+                    continue
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    async def __lookup_group(self, provider, points) -> list:
+        """
+        Returns declinations or exceptions of the provider's points using
+        the most efficient path of the provider.
+        """
+
+        import asyncio
+
+        spec = _provider(provider)
+        if isinstance(spec, tuple) and spec[0] == "LOCAL":
+            if len(points) > 1:
+                try:
+                    return self.__local_array(provider, points)
+                except (ImportError, TypeError, ValueError, RuntimeError):
+                    # some points are incorrect, report them one by one
+                    pass
+            results = []
+            for point in points:
+                try:
+                    results.append(self.md_object.md(*point, provider))
+                except Exception as error:
+                    results.append(error)
+            return results
+
+        if isinstance(spec, tuple):
+            lookups = (
+                self.md_object.amd(*point, provider) for point in points
+            )
+        else:
+            # registered callables and tiles may block
+            loop = asyncio.get_event_loop()
+            lookups = (
+                loop.run_in_executor(
+                    None,
+                    functools.partial(self.md_object.md, *point, provider),
+                )
+                for point in points
+            )
+        return await asyncio.gather(*lookups, return_exceptions=True)
+
+    def __local_array(self, provider, points) -> typing.List[float]:
+        """Returns local model's declinations of points evaluated at once"""
+
+        import numpy as np
+
+        years = []
+        for lat, lon, elev, year, mon, day in points:
+            datetime.date(year, mon, day)
+            years.append(_decimal_year(year, mon, day))
+        lat, lon, elev = np.array([point[:3] for point in points]).T
+        return self.md_object.md_array(
+            lat, lon, elev, np.array(years), provider
+        ).tolist()
+
+    async def __annotate(self, row, provider) -> typing.Tuple[int, dict]:
+        """
+        Returns HTTP status and the row with declination and error: 400 if
+        the point is incorrect, 502 if the provider failed.
+        """
+
+        try:
+            if not isinstance(row, dict):
+                raise ValueError("point must be an object")
+            provider = row.get("provider", provider)
+            point = _point(row)
+            self.md_object.check(*point, provider)
+        except KeyError as error:
+            return 400, dict(row, declination=None, error=f"no {error}")
+        except (TypeError, ValueError) as error:
+            row = row if isinstance(row, dict) else {"point": row}
+            return 400, dict(row, declination=None, error=str(error))
+        try:
+            md = await self.lookup(*point, provider)
+        except Exception as error:
+            return 502, dict(row, declination=None, error=str(error))
+        return 200, dict(row, declination=md, error="")
+
+    async def __respond(self, method, target, body) -> tuple:
+        """Returns HTTP status, content type and body of the request"""
+
+        import asyncio
+        import urllib.parse
+
+        url = urllib.parse.urlsplit(target)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        if method not in ("GET", "POST"):
+            return 405, {"error": "method not allowed"}
+        if url.path == "/health" and method == "GET":
+            return 200, {"status": "ok"}
+        if url.path == "/stats" and method == "GET":
+            return 200, self.stats()
+        if url.path == "/metrics" and method == "GET":
+            if self.md_object.metrics is not None:
+                return 200, self.md_object.metrics.prometheus()
+        if url.path != "/md":
+            return 404, {"error": "not found"}
+
+        provider = query.pop("provider", self.provider)
+        if method == "GET":
+            return await self.__annotate(query, provider)
+        try:
+            rows = json.loads(body)
+        except ValueError as error:
+            return 400, {"error": f"incorrect JSON: {error}"}
+        if not isinstance(rows, list):
+            return 400, {"error": "JSON array of points expected"}
+        results = await asyncio.gather(
+            *(self.__annotate(row, provider) for row in rows)
+        )
+        return 200, [row for _, row in results]
+
+    def __connected(self, reader, writer):
+        """Serves the new connection in a task closed by close()"""
+
+        import asyncio
+
+        self.__connections[writer] = asyncio.ensure_future(
+            self.__handle(reader, writer)
+        )
+
+    async def __handle(self, reader, writer):
+        """Serves HTTP/1.1 requests of the connection"""
+
+        import asyncio
+        import http
+
+        try:
+            while True:
+                keep_alive = False
+                # lines longer than the stream's limit raise ValueError
+                try:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    method, target, version = line.decode("latin-1").split()
+                    headers = {}
+                    while True:
+                        header = await reader.readline()
+                        if header in (b"\r\n", b"\n", b""):
+                            break
+                        name, _, value = header.decode("latin-1").partition(
+                            ":"
+                        )
+                        headers[name.strip().lower()] = value.strip()
+                    length = int(headers.get("content-length", 0))
+                    if length < 0:
+                        raise ValueError(f"Content-Length {length}")
+                except ValueError:
+                    status, content = 400, {"error": "bad request"}
+                else:
+                    if "transfer-encoding" in headers:
+                        status, content = 411, {"error": "length required"}
+                    elif length > self.max_body:
+                        status, content = 413, {"error": "body too large"}
+                    else:
+                        body = await reader.readexactly(length)
+                        self.requests += 1
+                        status, content = await self.__respond(
+                            method, target, body
+                        )
+                        keep_alive = (
+                            version == "HTTP/1.1"
+                            and headers.get("connection", "").lower()
+                            != "close"
+                        )
+
+                if isinstance(content, str):
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                    payload = content.encode()
+                else:
+                    content_type = "application/json"
+                    payload = json.dumps(content).encode()
+                writer.write(
+                    (
+                        f"HTTP/1.1 {status} {http.HTTPStatus(status).phrase}"
+                        f"\r\nContent-Type: {content_type}"
+                        f"\r\nContent-Length: {len(payload)}"
+                        + ("" if keep_alive else "\r\nConnection: close")
+                        + "\r\n\r\n"
+                    ).encode("latin-1")
+                    + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.__connections.pop(writer, None)
+            writer.close()
+
+
+def _run(coroutine):
+    """
+    Runs the coroutine in a new event loop like asyncio.run() of Python
+    3.7+, tasks left pending are cancelled before the loop is closed.
+    """
+
+    import asyncio
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        try:
+            all_tasks = getattr(asyncio, "all_tasks", None)
+            tasks = (all_tasks or asyncio.Task.all_tasks)(loop)
+            tasks = [task for task in tasks if not task.done()]
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                loop.run_until_complete(
+                    asyncio.gather(*tasks, return_exceptions=True)
+                )
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            loop.close()
+
+
+def _ordered_map(func, iterable, workers) -> typing.Iterator:
+    """
+    Lazily applies func to items of iterable on the thread pool and yields
+    results in input order, at most 2 * workers items are held at once.
+    """
+
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        pending = collections.deque()
+        for item in iterable:
+            pending.append(pool.submit(func, item))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _point(row) -> typing.Tuple[float, float, float, int, int, int]:
+    """
+    Returns (lat, lon, elev, year, mon, day) of the input row, date is
+    either ISO "date" or separate "year", "mon", "day".
+    """
+
+    if row.get("date"):
+        year, mon, day = (int(part) for part in str(row["date"]).split("-"))
+    else:
+        year, mon, day = int(row["year"]), int(row["mon"]), int(row["day"])
+    elev = row.get("elev")
+    return (
+        float(row["lat"]),
+        float(row["lon"]),
+        float(elev) if elev not in (None, "") else 0.0,
+        year,
+        mon,
+        day,
+    )
+
+
+def main(argv=None) -> int:
+    """
+    Command line interface: annotates CSV or JSON lines points with
+    magnetic declination, rows are streamed in input order.
+    """
+
+    import argparse
+    import csv
+
+    parser = argparse.ArgumentParser(
+        prog="python -m demag",
+        description=(
+            "Reads points (lat, lon, optional elev in km, date as YYYY-MM-DD "
+            "or year, mon, day) and writes them with declination and error "
+            "columns added."
+        ),
+    )
+    parser.add_argument(
+        "input", nargs="?", default="-", help="input file, stdin by default"
+    )
+    parser.add_argument(
+        "-f", "--format", choices=("csv", "jsonl"), default="csv"
+    )
+    parser.add_argument("-p", "--provider", default="NOAA_WMM")
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=8,
+        help="concurrent lookups, bounds rows in flight",
+    )
+    parser.add_argument(
+        "--serve",
+        type=int,
+        metavar="PORT",
+        help="serve lookups over HTTP instead of annotating input",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=64,
+        help="most points resolved at once by the server",
+    )
+    parser.add_argument(
+        "--max-wait",
+        type=float,
+        default=0.005,
+        help="seconds the server waits to fill a batch",
+    )
+    parser.add_argument("--cache", help="SQLite cache file of the server")
+    args = parser.parse_args(argv)
+
+    if args.serve is not None:
+        md_object = MagneticDeclination(
+            workers=args.workers,
+            memo=LRUCache(),
+            cache=SQLiteCache(args.cache) if args.cache else None,
+        )
+        server = Server(
+            md_object, args.provider, args.batch_size, args.max_wait
+        )
+        server.run(args.host, args.serve)
+        return 0
+
+    md_object = MagneticDeclination(workers=args.workers)
+
+    def annotate(row):
+        try:
+            if not isinstance(row, dict):
+                raise ValueError("point must be an object")
+            md = md_object.md(*_point(row), provider=args.provider)
+            return dict(row, declination=md, error="")
+        except Exception as error:
+            row = row if isinstance(row, dict) else {"point": row}
+            return dict(row, declination=None, error=str(error))
+
+    def annotate_line(line):
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            return {
+                "line": line.rstrip("\r\n"),
+                "declination": None,
+                "error": f"incorrect JSON: {error}",
+            }
+        return annotate(row)
+
+    source = sys.stdin if args.input == "-" else open(args.input, newline="")
+    with source:
+        if args.format == "csv":
+            rows = csv.DictReader(source)
+            fieldnames = list(rows.fieldnames or ()) + ["declination", "error"]
+            # values of fields missing from the header are dropped
+            writer = csv.DictWriter(
+                sys.stdout, fieldnames=fieldnames, extrasaction="ignore"
+            )
+            writer.writeheader()
+            for row in _ordered_map(annotate, rows, args.workers):
+                writer.writerow(row)
+        else:
+            lines = (line for line in source if line.strip())
+            for row in _ordered_map(annotate_line, lines, args.workers):
+                sys.stdout.write(json.dumps(row) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+"""
+Local stand-in for NOAA and BGS online calculators. Serves responses in the
+recorded formats of both services with values calculated by the local
+models, with configurable latency and error injection.
+"""
+
+import http.server
+import json
+import random
+import socketserver
+import sys
+import threading
+import time
+import urllib.parse
+
+from demag import MagneticDeclination, _calendar_date, _decimal_year
+
+NOAA_XML = """<maggridresult>
+    <version>0.5.1.0</version>
+    <model>{model}</model>
+{results}
+</maggridresult>"""
+
+NOAA_RESULT_XML = (
+    "    <result>\n"
+    "        <date>{date:.5f}</date>\n"
+    '        <latitude units="degree">{lat:.5f}</latitude>\n'
+    '        <longitude units="degree">{lon:.5f}</longitude>\n'
+    '        <elevation units="km">{elev:.5f}</elevation>\n'
+    '        <declination units="degree">'
+    "{field.declination:.5f}</declination>\n"
+    '        <declination_sv units="degree">'
+    "{field.declination_sv:.5f}</declination_sv>\n"
+    '        <declination_uncertainty units="degree">'
+    "0.44237</declination_uncertainty>\n"
+    "    </result>"
+)
+
+BGS_ELEMENTS = (
+    ("total-intensity", "total_intensity", "nT", "nT/y"),
+    ("declination", "declination", "deg (east)", "arcmin/y (east)"),
+    ("inclination", "inclination", "deg (down)", "arcmin/y (down)"),
+    ("north-intensity", "north_intensity", "nT", "nT/y"),
+    ("east-intensity", "east_intensity", "nT", "nT/y"),
+    ("vertical-intensity", "vertical_intensity", "nT", "nT/y"),
+    ("horizontal-intensity", "horizontal_intensity", "nT", "nT/y"),
+)
+
+
+class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    # concurrent clients must not overflow the listen backlog
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # clients giving up at their deadline close connections early
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class StandIn:
+    """
+    Stand-in HTTP server on localhost. Every response is delayed by latency
+    seconds plus up to jitter seconds, error_rate share of requests is
+    answered with error_status. Use as context manager or start()/stop().
+    """
+
+    def __init__(
+        self, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = 0
+        self.__lock = threading.Lock()
+        self.__md_object = MagneticDeclination()
+        self.__server = Server(("127.0.0.1", 0), self.__handler())
+        self.url = "http://127.0.0.1:{}".format(self.__server.server_port)
+        self.urls = {"NOAA": self.url, "BGS": self.url}
+
+    def start(self):
+        threading.Thread(
+            target=self.__server.serve_forever, daemon=True
+        ).start()
+        return self
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def __handler(self):
+        stand_in = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                status, content_type, body = stand_in.respond(self.path)
+                body = body.encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def respond(self, path):
+        """Returns (status, content type, body) for the request path"""
+
+        with self.__lock:
+            self.requests += 1
+        time.sleep(self.latency + random.uniform(0.0, self.jitter))
+        if random.random() < self.error_rate:
+            return self.error_status, "text/plain", "Injected error"
+
+        url = urllib.parse.urlparse(path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        try:
+            if url.path.endswith("calculateDeclination"):
+                return 200, "application/xml", self.__noaa_declination(query)
+            if url.path.endswith("calculateGrid"):
+                return 200, "application/xml", self.__noaa_grid(query)
+            if url.path.startswith("/web_service/GMModels/wmm/"):
+                return 200, "application/json", self.__bgs(query)
+        except (KeyError, ValueError, RuntimeError) as error:
+            return 400, "text/plain", str(error)
+        return 404, "text/plain", "Not found"
+
+    def __field(self, model, lat, lon, elev, date):
+        return self.__md_object.field(
+            lat, lon, elev, *date, provider="LOCAL_" + model
+        )
+
+    def __noaa_xml(self, model, points):
+        results = "\n".join(
+            NOAA_RESULT_XML.format(
+                date=_decimal_year(*date),
+                lat=lat,
+                lon=lon,
+                elev=elev,
+                field=self.__field(model, lat, lon, elev, date),
+            )
+            for lat, lon, elev, date in points
+        )
+        return NOAA_XML.format(model=model, results=results)
+
+    def __noaa_declination(self, query):
+        model = query.get("model", "WMM")
+        lat, lon = float(query["lat1"]), float(query["lon1"])
+        start = tuple(
+            int(query[key]) for key in ("startYear", "startMonth", "startDay")
+        )
+        dates = [start]
+        if "endYear" in query:
+            end = tuple(
+                int(query[key]) for key in ("endYear", "endMonth", "endDay")
+            )
+            step = float(query.get("dateStepSize", 1.0))
+            first, last = _decimal_year(*start), _decimal_year(*end)
+            count = int((last - first) / step + 1e-9) + 1
+            dates = [_calendar_date(first + i * step) for i in range(count)]
+        return self.__noaa_xml(
+            model, [(lat, lon, 0.0, date) for date in dates]
+        )
+
+    def __noaa_grid(self, query):
+        model = query.get("model", "WMM")
+        lat1, lat2 = float(query["lat1"]), float(query["lat2"])
+        lon1, lon2 = float(query["lon1"]), float(query["lon2"])
+        lat_step = float(query["latStepSize"])
+        lon_step = float(query["lonStepSize"])
+        elev = float(query.get("elevation", 0.0))
+        date = tuple(
+            int(query[key]) for key in ("startYear", "startMonth", "startDay")
+        )
+        rows = int((lat2 - lat1) / lat_step + 1e-9) + 1
+        cols = int((lon2 - lon1) / lon_step + 1e-9) + 1
+        # NOAA lists the grid from north to south
+        points = [
+            (lat1 + row * lat_step, lon1 + col * lon_step, elev, date)
+            for row in reversed(range(rows))
+            for col in range(cols)
+        ]
+        return self.__noaa_xml(model, points)
+
+    def __bgs(self, query):
+        lat, lon = float(query["latitude"]), float(query["longitude"])
+        elev = float(query["altitude"])
+        date = tuple(int(part) for part in query["date"].split("-"))
+        field = self.__field("WMM", lat, lon, elev, date)
+        sv = field._replace(
+            declination=field.declination_sv * 60.0,
+            inclination=field.inclination_sv * 60.0,
+            total_intensity=field.total_intensity_sv,
+            north_intensity=field.north_intensity_sv,
+            east_intensity=field.east_intensity_sv,
+            vertical_intensity=field.vertical_intensity_sv,
+            horizontal_intensity=field.horizontal_intensity_sv,
+        )
+        return json.dumps(
+            {
+                "geomagnetic-field-model-result": {
+                    "model": {"revision": "2020", "value": "wmm"},
+                    "date": {"value": query["date"]},
+                    "coordinates": {
+                        "latitude": {"units": "deg (north)", "value": lat},
+                        "longitude": {"units": "deg (east)", "value": lon},
+                        "altitude": {"units": "km", "value": elev},
+                    },
+                    "field-value": {
+                        name: {"units": units, "value": getattr(field, attr)}
+                        for name, attr, units, _ in BGS_ELEMENTS
+                    },
+                    "secular-variation": {
+                        name: {"units": units, "value": getattr(sv, attr)}
+                        for name, attr, _, units in BGS_ELEMENTS
+                    },
+                }
+            }
+        )
@@ -0,0 +1,42 @@
+import unittest
+
+from demag import MagneticDeclination, _run
+
+
+class TestAMD(unittest.TestCase):
+    """Testing asynchronous lookups"""
+
+    def setUp(self):
+        self.md_object = MagneticDeclination(concurrency=2)
+
+    def test_local(self):
+        """Local provider through asynchronous interface"""
+        self.assertAlmostEqual(
+            _run(
+                self.md_object.amd(
+                    lat=45.0,
+                    lon=-90.0,
+                    year=2020,
+                    mon=10,
+                    day=15,
+                    provider="LOCAL_WMM",
+                )
+            ),
+            -2.545,
+            delta=0.01,
+        )
+
+    def test_incorrect(self):
+        """Latitude far more than 90.0"""
+        with self.assertRaises(ValueError):
+            _run(self.md_object.amd(lat=100.0))
+
+    def test_many_order(self):
+        """Results are in the same order as points"""
+        points = [
+            (lat, 0.0, 0.0, (2020, 10, 15)) for lat in (-45.0, 0.0, 45.0)
+        ]
+        self.assertEqual(
+            _run(self.md_object.amd_many(points, provider="LOCAL_WMM")),
+            self.md_object.md_many(points, provider="LOCAL_WMM"),
+        )
@@ -203,3 +203,12 @@ class TestBGSWMMOnline(unittest.TestCase):
             21.145,
             delta=0.01,
         )
+
+    def test_field_N45_W90(self):
+        """WMM N45 W90 2020-10-15 all elements"""
+        field = self.md_object.field(
+            lon=-90.0, lat=45.0, year=2020, mon=10, day=15, provider="BGS_WMM"
+        )
+        self.assertAlmostEqual(field.declination, -2.545, delta=0.01)
+        self.assertIsNotNone(field.total_intensity)
+        self.assertIsNotNone(field.declination_sv)
@@ -0,0 +1,81 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+import demag
+
+
+class TestCLI(unittest.TestCase):
+    """Testing command line interface"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def run_main(self, content, *args):
+        path = os.path.join(self.tmp_dir.name, "points")
+        with open(path, "w") as points:
+            points.write(content)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            demag.main([path, "--provider", "LOCAL_WMM", *args])
+        return output.getvalue()
+
+    def test_csv(self):
+        """CSV rows are annotated in input order"""
+        output = self.run_main(
+            "name,lat,lon,date\n"
+            "a,45,-90,2020-10-15\n"
+            "b,100,0,2020-10-15\n"
+            "c,0,0,2020-10-15\n",
+            "--workers",
+            "2",
+        )
+        lines = output.splitlines()
+        self.assertEqual(lines[0], "name,lat,lon,date,declination,error")
+        self.assertEqual(
+            [line.split(",")[0] for line in lines[1:]], ["a", "b", "c"]
+        )
+        self.assertAlmostEqual(float(lines[1].split(",")[4]), -2.545, 2)
+        self.assertTrue(lines[2].split(",")[5])
+
+    def test_jsonl(self):
+        """JSON lines with separate date fields"""
+        output = self.run_main(
+            '{"lat": 0, "lon": 0, "year": 2020, "mon": 10, "day": 15}\n',
+            "--format",
+            "jsonl",
+        )
+        row = json.loads(output)
+        self.assertAlmostEqual(row["declination"], -4.54, delta=0.01)
+        self.assertEqual(row["error"], "")
+
+    def test_incorrect_rows(self):
+        """Malformed rows are reported without stopping the stream"""
+        output = self.run_main(
+            '{"lat": 0, "lon": 0, "date": "2020-10-15"\n'
+            "[1, 2]\n"
+            '{"lat": 0, "lon": 0, "date": "2020-10-15"}\n',
+            "--format",
+            "jsonl",
+        )
+        malformed, array, row = map(json.loads, output.splitlines())
+        self.assertIsNone(malformed["declination"])
+        self.assertIn("incorrect JSON", malformed["error"])
+        self.assertEqual(array["point"], [1, 2])
+        self.assertTrue(array["error"])
+        self.assertAlmostEqual(row["declination"], -4.54, delta=0.01)
+
+        output = self.run_main(
+            "lat,lon,date\n0,0,2020-10-15,extra\n45\n0,0,2020-10-15\n"
+        )
+        lines = output.splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertAlmostEqual(float(lines[1].split(",")[3]), -4.54, 2)
+        self.assertTrue(lines[2].split(",")[4])
+        self.assertAlmostEqual(float(lines[3].split(",")[3]), -4.54, 2)
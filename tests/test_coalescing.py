@@ -0,0 +1,63 @@
+import concurrent.futures
+import threading
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+from demag import MagneticDeclination
+
+NOAA_XML = (
+    "<maggridresult><result>"
+    "<declination units='degree'>1.0</declination>"
+    "</result></maggridresult>"
+)
+
+
+class TestCoalescing(unittest.TestCase):
+    """Testing coalescing of identical in-flight lookups"""
+
+    def setUp(self):
+        self.md_object = MagneticDeclination(retries=0)
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def fake_get(self, status):
+        def get(session, url, **kwargs):
+            with self.lock:
+                self.calls += 1
+            time.sleep(0.1)
+            md_request = requests.Response()
+            md_request.status_code = status
+            md_request._content = NOAA_XML.encode()
+            return md_request
+
+        return get
+
+    def lookup_many(self, *points):
+        with concurrent.futures.ThreadPoolExecutor(len(points)) as pool:
+            futures = [
+                pool.submit(self.md_object.md, lat, 0, 0, 2020, 10, 15)
+                for lat in points
+            ]
+        return [future.exception() or future.result() for future in futures]
+
+    def test_identical(self):
+        """Identical lookups share one request"""
+        with mock.patch.object(requests.Session, "get", self.fake_get(200)):
+            self.assertEqual(self.lookup_many(10, 10, 10, 10), [1.0] * 4)
+        self.assertEqual(self.calls, 1)
+
+    def test_different(self):
+        """Different lookups are not coalesced"""
+        with mock.patch.object(requests.Session, "get", self.fake_get(200)):
+            self.lookup_many(10, 20, 10)
+        self.assertEqual(self.calls, 2)
+
+    def test_shared_exception(self):
+        """Exception is shared by identical lookups"""
+        with mock.patch.object(requests.Session, "get", self.fake_get(400)):
+            results = self.lookup_many(10, 10, 10)
+        self.assertTrue(all(isinstance(r, RuntimeError) for r in results))
+        self.assertEqual(self.calls, 1)
@@ -0,0 +1,251 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import demag
+from demag import (
+    Answer,
+    LRUCache,
+    MagneticDeclination,
+    Metrics,
+    SpatialCache,
+    SQLiteCache,
+    _run,
+    register_provider,
+)
+
+from .standin import StandIn
+
+
+class TestDeadline(unittest.TestCase):
+    """Testing lookups with deadline and their fallbacks"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stand_in = StandIn().start()
+        cls.local = MagneticDeclination().md(
+            45.0, -90.0, 0.0, 2021, 1, 1, "LOCAL_WMM"
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stand_in.stop()
+
+    def setUp(self):
+        self.stand_in.latency = 0.5
+        self.metrics = Metrics()
+
+    def tearDown(self):
+        self.stand_in.latency = 0.0
+        self.stand_in.error_rate = 0.0
+
+    def md_object(self, **kwargs):
+        return MagneticDeclination(
+            urls=self.stand_in.urls, metrics=self.metrics, **kwargs
+        )
+
+    def test_in_time(self):
+        """Provider answering in time is the source"""
+        self.stand_in.latency = 0.0
+        answer = self.md_object().answer(
+            45.0, -90.0, 0.0, 2021, 1, 1, "NOAA_WMM", deadline=5.0
+        )
+        self.assertEqual(answer.source, "NOAA_WMM")
+        self.assertAlmostEqual(answer.declination, self.local, places=4)
+        self.assertEqual(self.metrics.answers("NOAA_WMM", "NOAA_WMM"), 1)
+
+    def test_local(self):
+        """Late provider is replaced by the local model"""
+        start = time.monotonic()
+        answer = self.md_object().answer(
+            45.0, -90.0, 0.0, 2021, 1, 1, "NOAA_WMM", deadline=0.1
+        )
+        self.assertLess(time.monotonic() - start, 0.4)
+        self.assertEqual(answer, Answer(self.local, "LOCAL_WMM"))
+        self.assertEqual(self.metrics.answers("NOAA_WMM", "LOCAL_WMM"), 1)
+
+    def test_late_lookup(self):
+        """Late lookup gives up at the deadline"""
+        md_object = self.md_object(memo=LRUCache())
+        md_object.md(45.0, -90.0, 0.0, 2021, 1, 1, "BGS_WMM", deadline=0.1)
+        time.sleep(0.8)
+        answer = md_object.answer(
+            45.0, -90.0, 0.0, 2021, 1, 1, "BGS_WMM", deadline=0.1
+        )
+        self.assertEqual(answer.source, "LOCAL_WMM")
+        md_object.close()
+
+    def run_script(self, script):
+        """Runs the script with the stand-in's URL, returns its duration"""
+        start = time.monotonic()
+        subprocess.check_call(
+            [sys.executable, "-c", script, self.stand_in.url],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        )
+        return time.monotonic() - start
+
+    def test_exit(self):
+        """Late lookup doesn't keep the process alive"""
+        self.stand_in.latency = 3.0
+        elapsed = self.run_script(
+            "import sys, demag\n"
+            "url = sys.argv[1]\n"
+            "md_object = demag.MagneticDeclination("
+            "urls={'NOAA': url, 'BGS': url})\n"
+            "md_object.md(45, -90, 0, 2021, 1, 1, deadline=0.1)\n"
+        )
+        self.assertLess(elapsed, 2.5)
+
+    def test_first_async(self):
+        """The first asynchronous lookup keeps its deadline"""
+        elapsed = self.run_script(
+            "import sys, time, demag\n"
+            "url = sys.argv[1]\n"
+            "md_object = demag.MagneticDeclination("
+            "urls={'NOAA': url, 'BGS': url})\n"
+            "async def lookup():\n"
+            "    start = time.monotonic()\n"
+            "    await md_object.amd(45, -90, 0, 2021, 1, 1, deadline=0.1)\n"
+            "    assert time.monotonic() - start < 0.2\n"
+            "    await md_object.aclose()\n"
+            "demag._run(lookup())\n"
+        )
+        self.assertLess(elapsed, 5.0)
+
+    def test_stale_cache(self):
+        """Expired cache entry answers in place of late provider"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = SQLiteCache(os.path.join(tmp_dir, "md.sqlite"), ttl=0.01)
+            key = cache.key("NOAA_WMM", 45.0, -90.0, 0.0, 2021, 1, 1)
+            cache.set(key, 1.5)
+            time.sleep(0.02)
+            answer = self.md_object(cache=cache).answer(
+                45.0, -90.0, 0.0, 2021, 1, 1, "NOAA_WMM", deadline=0.1
+            )
+        self.assertEqual(answer, Answer(1.5, "cache"))
+
+    def test_spatial(self):
+        """The nearest cached point answers in place of late provider"""
+        spatial = SpatialCache(tolerance=0.0)
+        spatial.set(
+            spatial.key("NOAA_WMM", 0.0, 2021, 1, 1), 45.001, -90.0, 2.5
+        )
+        answer = self.md_object(spatial=spatial).answer(
+            45.0, -90.0, 0.0, 2021, 1, 1, "NOAA_WMM", deadline=0.1
+        )
+        self.assertEqual(answer, Answer(2.5, "spatial"))
+
+    def test_chain(self):
+        """Fallbacks are tried in order"""
+        md_object = self.md_object(
+            fallbacks=("cache", "spatial", "NO_WMM", "LOCAL_IGRF")
+        )
+        answer = md_object.answer(
+            45.0, -90.0, 0.0, 2021, 1, 1, "NOAA_WMM", deadline=0.1
+        )
+        self.assertEqual(answer.source, "LOCAL_IGRF")
+        md_object.fallbacks = ()
+        with self.assertRaises(RuntimeError):
+            md_object.md(45.0, -90.0, 0.0, 2021, 1, 1, deadline=0.1)
+
+    def test_failure(self):
+        """Failed provider is replaced before the deadline"""
+        self.stand_in.latency = 0.0
+        self.stand_in.error_rate = 1.0
+        md_object = self.md_object(retries=0)
+        answer = md_object.answer(
+            45.0, -90.0, 0.0, 2021, 1, 1, "NOAA_IGRF", deadline=5.0
+        )
+        self.assertEqual(answer.source, "LOCAL_IGRF")
+
+    def test_parse_error(self):
+        """Provider's ValueError is replaced like any failure"""
+
+        def provider(*args):
+            raise json.JSONDecodeError("Expecting value", "<html>", 0)
+
+        register_provider("HTML_WMM", provider)
+        spatial = SpatialCache(tolerance=0.0)
+        spatial.set(spatial.key("HTML_WMM", 0.0, 2021, 1, 1), 45.0, -90.0, 2.5)
+        md_object = self.md_object(spatial=spatial)
+        try:
+            answer = md_object.answer(
+                45.0, -90.0, 0.0, 2021, 1, 1, "HTML_WMM", deadline=5.0
+            )
+            async_answer = _run(
+                md_object.aanswer(
+                    45.0, -90.0, 0.0, 2021, 1, 1, "HTML_WMM", deadline=5.0
+                )
+            )
+        finally:
+            del demag.PROVIDERS["HTML_WMM"]
+        self.assertEqual(answer, Answer(2.5, "spatial"))
+        self.assertEqual(async_answer, Answer(2.5, "spatial"))
+
+    def test_incorrect(self):
+        """Incorrect arguments are not replaced"""
+        with self.assertRaises(ValueError):
+            self.md_object().md(100.0, 0.0, 0.0, 2021, 1, 1, deadline=0.1)
+
+    def test_md_many(self):
+        """Deadline bounds the whole batch"""
+        points = [(45.0, lon, 0.0, (2021, 1, 1)) for lon in range(-90, -80)]
+        start = time.monotonic()
+        mds = self.md_object(workers=2).md_many(points, "BGS_WMM", 0.2)
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(
+            mds,
+            MagneticDeclination().md_many(points, "LOCAL_WMM"),
+        )
+
+    def test_columns(self):
+        """Deadline bounds network lookups of columns"""
+        columns = {"lat": 45.0, "lon": [-90.0, -80.0], "date": 2021.0}
+        start = time.monotonic()
+        mds = self.md_object(workers=2).md_array(
+            columns["lat"],
+            columns["lon"],
+            0.0,
+            (2021, 1, 1),
+            "NOAA_WMM",
+            deadline=0.2,
+        )
+        mds_columns, statuses = self.md_object().md_columns(
+            columns, "NOAA_WMM", deadline=0.2
+        )
+        self.assertLess(time.monotonic() - start, 0.8)
+        self.assertEqual(statuses.tolist(), [demag.STATUS_OK] * 2)
+        self.assertEqual(mds.tolist(), mds_columns.tolist())
+        self.assertAlmostEqual(mds[0], self.local, places=4)
+
+    def test_async(self):
+        """Awaitable lookups with deadline"""
+        md_object = self.md_object()
+
+        async def run():
+            try:
+                answer = await md_object.aanswer(
+                    45.0, -90.0, 0.0, 2021, 1, 1, "NOAA_WMM", deadline=0.1
+                )
+                mds = await md_object.amd_many(
+                    [(45.0, -90.0, 0.0, (2021, 1, 1))] * 3,
+                    "NOAA_WMM",
+                    deadline=0.1,
+                )
+                return answer, mds
+            finally:
+                await md_object.aclose()
+
+        start = time.monotonic()
+        answer, mds = _run(run())
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(answer, Answer(self.local, "LOCAL_WMM"))
+        self.assertEqual(mds, [self.local] * 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import math
+import unittest
+
+from demag import Field, MagneticDeclination
+
+
+class TestField(unittest.TestCase):
+    """Testing field elements calculated locally"""
+
+    def setUp(self):
+        self.md_object = MagneticDeclination()
+
+    def test_declination(self):
+        """Declination equals to md()"""
+        field = self.md_object.field(
+            lat=-45.0,
+            lon=90.0,
+            year=2020,
+            mon=10,
+            day=15,
+            provider="LOCAL_WMM",
+        )
+        self.assertIsInstance(field, Field)
+        self.assertAlmostEqual(field.declination, -41.083, delta=0.01)
+
+    def test_components(self):
+        """Intensities are consistent"""
+        field = self.md_object.field(
+            lat=-80.0,
+            lon=-120.0,
+            year=2021,
+            mon=7,
+            day=2,
+            provider="LOCAL_WMM",
+        )
+        self.assertAlmostEqual(
+            field.total_intensity,
+            math.hypot(field.horizontal_intensity, field.vertical_intensity),
+        )
+        self.assertAlmostEqual(
+            field.horizontal_intensity,
+            math.hypot(field.north_intensity, field.east_intensity),
+        )
+        self.assertAlmostEqual(field.inclination, -72.13, delta=0.01)
+        self.assertIsNone(field.declination_uncertainty)
+
+    def test_secular_variation(self):
+        """Secular variation equals to yearly change"""
+        before = self.md_object.field(
+            lat=60.0, lon=40.0, year=2021, mon=1, day=1, provider="LOCAL_WMM"
+        )
+        after = self.md_object.field(
+            lat=60.0, lon=40.0, year=2022, mon=1, day=1, provider="LOCAL_WMM"
+        )
+        self.assertAlmostEqual(
+            before.declination_sv,
+            after.declination - before.declination,
+            delta=0.001,
+        )
+        self.assertAlmostEqual(
+            before.total_intensity_sv,
+            after.total_intensity - before.total_intensity,
+            delta=0.1,
+        )
@@ -0,0 +1,71 @@
+import json
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+from demag import MagneticDeclination
+
+NOAA_XML = (
+    "<maggridresult><result>"
+    "<declination units='degree'>1.0</declination>"
+    "</result></maggridresult>"
+)
+BGS_JSON = json.dumps(
+    {
+        "geomagnetic-field-model-result": {
+            "field-value": {"declination": {"units": "deg", "value": 2.0}}
+        }
+    }
+)
+
+
+def fake_get(noaa_delay, noaa_status=200):
+    def get(session, url, **kwargs):
+        md_request = requests.Response()
+        if "noaa" in url:
+            time.sleep(noaa_delay)
+            md_request.status_code = noaa_status
+            md_request._content = NOAA_XML.encode()
+        else:
+            md_request.status_code = 200
+            md_request._content = BGS_JSON.encode()
+        return md_request
+
+    return get
+
+
+class TestHedged(unittest.TestCase):
+    """Testing composite WMM provider"""
+
+    def setUp(self):
+        self.md_object = MagneticDeclination(hedge_delay=0.05, retries=0)
+
+    def md(self):
+        return self.md_object.md(45, 45, 0, 2020, 10, 15, provider="ANY_WMM")
+
+    def test_first_answers(self):
+        """Fast provider answers before hedging"""
+        with mock.patch.object(requests.Session, "get", fake_get(0.0)):
+            self.assertIn(self.md(), (1.0, 2.0))
+
+    def test_hedged(self):
+        """Slow provider is hedged with the other one"""
+        with mock.patch.object(requests.Session, "get", fake_get(0.0)):
+            for _ in range(3):
+                self.md()
+        # NOAA is slower from now on, both are tried and BGS wins
+        with mock.patch.object(requests.Session, "get", fake_get(0.5)):
+            start = time.monotonic()
+            self.assertEqual(self.md(), 2.0)
+            self.assertLess(time.monotonic() - start, 0.4)
+
+    def test_failover(self):
+        """Failed provider is replaced by the other one"""
+        with mock.patch.object(requests.Session, "get", fake_get(0.0, 400)):
+            for _ in range(3):
+                self.assertEqual(self.md(), 2.0)
+        stats = self.md_object.latency_stats()
+        self.assertGreaterEqual(stats["NOAA_WMM"]["errors"], 1)
+        self.assertEqual(stats["BGS_WMM"]["errors"], 0)
@@ -0,0 +1,79 @@
+import unittest
+
+from demag import MagneticDeclination
+
+
+class TestLocalIGRF(unittest.TestCase):
+    """Testing IGRF calculated locally"""
+
+    def setUp(self):
+        self.md_object = MagneticDeclination()
+
+    def test_incorrect_before(self):
+        """Date is before IGRF model's range"""
+        with self.assertRaises(RuntimeError):
+            self.md_object.md(year=1590, mon=1, day=25, provider="LOCAL_IGRF")
+
+    def test_incorrect_after(self):
+        """Date is after IGRF model's range"""
+        with self.assertRaises(RuntimeError):
+            self.md_object.md(year=2030, mon=1, day=2, provider="LOCAL_IGRF")
+
+    def test_first_epoch(self):
+        """IGRF N0 E0 1900-01-01"""
+        self.assertIsInstance(
+            self.md_object.md(year=1900, mon=1, day=1, provider="LOCAL_IGRF"),
+            float,
+        )
+
+    def test_last_epoch(self):
+        """IGRF N0 E0 2030-01-01"""
+        self.assertIsInstance(
+            self.md_object.md(year=2030, mon=1, day=1, provider="LOCAL_IGRF"),
+            float,
+        )
+
+    def test_N0_W180(self):
+        """IGRF N0 W180 2015-10-15"""
+        self.assertAlmostEqual(
+            self.md_object.md(
+                lon=-180.0,
+                lat=0.0,
+                year=2015,
+                mon=10,
+                day=15,
+                provider="LOCAL_IGRF",
+            ),
+            9.58,
+            delta=0.01,
+        )
+
+    def test_S45_W90_1990(self):
+        """IGRF S45 W90 1990-10-15"""
+        self.assertAlmostEqual(
+            self.md_object.md(
+                lon=-90.0,
+                lat=-45.0,
+                year=1990,
+                mon=10,
+                day=15,
+                provider="LOCAL_IGRF",
+            ),
+            22.36,
+            delta=0.01,
+        )
+
+    def test_S45_W90_2007(self):
+        """IGRF S45 W90 2007-10-15"""
+        self.assertAlmostEqual(
+            self.md_object.md(
+                lon=-90.0,
+                lat=-45.0,
+                year=2007,
+                mon=10,
+                day=15,
+                provider="LOCAL_IGRF",
+            ),
+            21.80,
+            delta=0.01,
+        )
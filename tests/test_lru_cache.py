@@ -0,0 +1,48 @@
+import unittest
+
+from demag import LRUCache, MagneticDeclination
+
+
+class TestLRUCache(unittest.TestCase):
+    """Testing in-memory cache"""
+
+    def test_hit(self):
+        """Near points share an entry"""
+        memo = LRUCache(resolution=0.01)
+        md_object = MagneticDeclination(memo=memo)
+        first = md_object.md(45.0, 90.0, 0, 2020, 10, 15, "LOCAL_WMM")
+        second = md_object.md(45.001, 90.002, 0, 2020, 10, 15, "LOCAL_WMM")
+        self.assertEqual(first, second)
+        self.assertEqual(
+            memo.stats(), {"hits": 1, "misses": 1, "evictions": 0, "size": 1}
+        )
+
+    def test_eviction(self):
+        """Least recently used entry is evicted"""
+        memo = LRUCache(capacity=2)
+        memo.set("first", 1.0)
+        memo.set("second", 2.0)
+        memo.get("first")
+        memo.set("third", 3.0)
+        self.assertIsNone(memo.get("second"))
+        self.assertEqual(memo.get("first"), 1.0)
+        self.assertEqual(memo.evictions, 1)
+
+    def test_incorrect_not_cached(self):
+        """Incorrect arguments are validated"""
+        md_object = MagneticDeclination(memo=LRUCache())
+        md_object.md(0, 0, 0, 2020, 10, 15, "LOCAL_WMM")
+        with self.assertRaises(ValueError):
+            md_object.md(0, 0, 0, 2020.0, 10, 15, "LOCAL_WMM")
+        with self.assertRaises(ValueError):
+            md_object.md("lat", 0, 0, 2020, 10, 15, "LOCAL_WMM")
+
+    def test_beyond_limits_not_cached(self):
+        """Lat/lon beyond limits are rejected next to a cached point"""
+        md_object = MagneticDeclination(memo=LRUCache(resolution=0.01))
+        md_object.md(90.0, 180.0, 0, 2020, 10, 15, "LOCAL_WMM")
+        for lat, lon in ((90.004, 180.0), (90.0, 180.004)):
+            with self.assertRaises(ValueError):
+                md_object.md(lat, lon, 0, 2020, 10, 15, "LOCAL_WMM")
+            with self.assertRaises(ValueError):
+                md_object.answer(lat, lon, 0, 2020, 10, 15, "LOCAL_WMM")
@@ -0,0 +1,126 @@
+import datetime
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from demag import MagneticDeclination, _calendar_date, _decimal_year
+
+from .standin import StandIn
+
+
+class TestMDArray(unittest.TestCase):
+    """Testing vectorized lookups of NumPy arrays"""
+
+    def setUp(self):
+        self.md_object = MagneticDeclination()
+        rng = np.random.default_rng(0)
+        self.lat = rng.uniform(-90.0, 90.0, 200)
+        self.lon = rng.uniform(-180.0, 180.0, 200)
+        self.elev = rng.uniform(0.0, 10.0, 200)
+
+    def assert_scalar(self, mds, years, provider):
+        for md, lat, lon, elev, year in zip(
+            mds, self.lat, self.lon, self.elev, years
+        ):
+            expected = self.md_object.md(
+                lat, lon, elev, *_calendar_date(year), provider
+            )
+            self.assertAlmostEqual(md, expected, places=9)
+
+    def test_local_wmm(self):
+        """LOCAL_WMM arrays match scalar lookups"""
+        years = [
+            _decimal_year(2020 + i % 10, 1 + i % 12, 1 + i % 28)
+            for i in range(200)
+        ]
+        mds = self.md_object.md_array(
+            self.lat, self.lon, self.elev, np.array(years)
+        )
+        self.assertEqual(mds.dtype, np.float64)
+        self.assert_scalar(mds, years, "LOCAL_WMM")
+
+    def test_local_igrf(self):
+        """LOCAL_IGRF arrays spanning several epochs match scalar lookups"""
+        years = [_decimal_year(1900 + i % 125, 6, 15) for i in range(200)]
+        mds = self.md_object.md_array(
+            self.lat, self.lon, self.elev, np.array(years), "LOCAL_IGRF"
+        )
+        self.assert_scalar(mds, years, "LOCAL_IGRF")
+
+    def test_datetime64(self):
+        """Dates as numpy.datetime64"""
+        dates = np.array(["2020-10-15", "2024-02-29"], dtype="datetime64[D]")
+        np.testing.assert_allclose(
+            self.md_object.md_array(45.0, -90.0, 0.0, dates),
+            [
+                self.md_object.md(45.0, -90.0, 0.0, 2020, 10, 15, "LOCAL_WMM"),
+                self.md_object.md(45.0, -90.0, 0.0, 2024, 2, 29, "LOCAL_WMM"),
+            ],
+        )
+
+    def test_broadcast(self):
+        """Arguments are broadcast, the result keeps their shape"""
+        lat = np.linspace(-80.0, 80.0, 5).reshape(5, 1)
+        lon = np.linspace(-170.0, 170.0, 4)
+        mds = self.md_object.md_array(lat, lon, date=datetime.date(2021, 1, 1))
+        self.assertEqual(mds.shape, (5, 4))
+        self.assertAlmostEqual(
+            mds[4, 3],
+            self.md_object.md(80.0, 170.0, 0.0, 2021, 1, 1, "LOCAL_WMM"),
+            places=9,
+        )
+
+    def test_processes(self):
+        """Process pool gives the same result"""
+        mds = self.md_object.md_array(
+            self.lat, self.lon, self.elev, (2022, 3, 4)
+        )
+        pooled = self.md_object.md_array(
+            self.lat, self.lon, self.elev, (2022, 3, 4), processes=2
+        )
+        np.testing.assert_array_equal(mds, pooled)
+
+    def test_after_scalar(self):
+        """Scalar lookups do not turn off the vectorized path"""
+        self.md_object.md(45.0, -90.0, 0.0, 2021, 1, 1, "LOCAL_WMM")
+        with mock.patch.object(
+            self.md_object, "md_many", side_effect=AssertionError
+        ):
+            self.md_object.md_array(
+                self.lat, self.lon, self.elev, (2022, 3, 4)
+            )
+
+    def test_other_provider(self):
+        """Providers without vectorized path are looked up point by point"""
+        with StandIn() as stand_in:
+            md_object = MagneticDeclination(urls=stand_in.urls)
+            mds = md_object.md_array(
+                [10.0, 20.0], [30.0, 40.0], 0.0, (2021, 5, 6), "NOAA_WMM"
+            )
+        np.testing.assert_allclose(
+            mds,
+            self.md_object.md_array(
+                [10.0, 20.0], [30.0, 40.0], 0.0, (2021, 5, 6)
+            ),
+            atol=1e-4,
+        )
+
+    def test_incorrect(self):
+        """Incorrect arguments"""
+        with self.assertRaises(ValueError):
+            self.md_object.md_array([0.0, 91.0], [0.0, 0.0])
+        with self.assertRaises(ValueError):
+            self.md_object.md_array(0.0, 0.0, date=(2021, 2, 30))
+        with self.assertRaises(ValueError):
+            self.md_object.md_array(0.0, 0.0, provider="NO_WMM")
+        with self.assertRaises(RuntimeError):
+            self.md_object.md_array([0.0, 0.0], 0.0, date=[2021.0, 2040.0])
+        with self.assertRaises(RuntimeError):
+            self.md_object.md_array(
+                [0.0, 0.0], 0.0, date=[2021.0, 2040.0], processes=2
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import demag
+from demag import (
+    STATUS_FAILED,
+    STATUS_INCORRECT,
+    STATUS_OK,
+    MagneticDeclination,
+    register_provider,
+)
+
+from .standin import StandIn
+
+DTYPE = [
+    ("lat", "f8"),
+    ("lon", "f8"),
+    ("elev", "f4"),
+    ("year", "i2"),
+    ("mon", "i1"),
+    ("day", "i1"),
+]
+
+
+class TestMDColumns(unittest.TestCase):
+    """Testing columnar bulk lookups"""
+
+    def setUp(self):
+        self.md_object = MagneticDeclination()
+        rng = np.random.default_rng(0)
+        self.points = np.zeros(300, dtype=DTYPE)
+        self.points["lat"] = rng.uniform(-90.0, 90.0, 300)
+        self.points["lon"] = rng.uniform(-180.0, 180.0, 300)
+        self.points["elev"] = rng.uniform(0.0, 10.0, 300)
+        self.points["year"] = rng.integers(2020, 2030, 300)
+        self.points["mon"] = rng.integers(1, 13, 300)
+        self.points["day"] = rng.integers(1, 29, 300)
+
+    def assert_scalar(self, mds, points):
+        for md, point in zip(mds, points):
+            self.assertAlmostEqual(
+                md,
+                self.md_object.md(*point.tolist(), "LOCAL_WMM"),
+                places=9,
+            )
+
+    def test_structured(self):
+        """Structured array matches scalar lookups"""
+        mds, statuses = self.md_object.md_columns(self.points)
+        self.assertEqual(mds.dtype, np.float64)
+        self.assertEqual(statuses.dtype, np.uint8)
+        self.assertTrue((statuses == STATUS_OK).all())
+        self.assert_scalar(mds, self.points)
+
+    def test_chunks(self):
+        """Points are evaluated in chunks"""
+        expected = self.md_object.md_columns(self.points)
+        with mock.patch("demag.ARRAY_CHUNK", 7):
+            mds, statuses = self.md_object.md_columns(self.points)
+        np.testing.assert_array_equal(mds, expected[0])
+        np.testing.assert_array_equal(statuses, expected[1])
+
+    def test_memmap(self):
+        """Memory-mapped file gives the same result"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "points.npy")
+            np.save(path, self.points)
+            points = np.load(path, mmap_mode="r")
+            mds, statuses = self.md_object.md_columns(points)
+            del points
+        np.testing.assert_array_equal(
+            mds, self.md_object.md_columns(self.points)[0]
+        )
+
+    def test_statuses(self):
+        """Incorrect points and dates out of range are marked"""
+        self.points["lat"][0] = 91.0
+        self.points["lon"][1] = np.nan
+        self.points["mon"][2] = 13
+        self.points["year"][3:5] = (2021, 2024)
+        self.points["mon"][3:5] = 2
+        self.points["day"][3:5] = 29
+        self.points["elev"][5] = np.inf
+        self.points["year"][6] = 2040
+        mds, statuses = self.md_object.md_columns(self.points)
+        self.assertEqual(
+            statuses[:8].tolist(),
+            [STATUS_INCORRECT] * 4
+            + [STATUS_OK, STATUS_INCORRECT]
+            + [STATUS_FAILED, STATUS_OK],
+        )
+        self.assertTrue(np.isnan(mds[statuses != STATUS_OK]).all())
+        self.assert_scalar(mds[7:], self.points[7:])
+
+    def test_date_column(self):
+        """Mapping of columns with datetime64 or decimal year dates"""
+        dates = np.array(
+            ["2020-10-15", "NaT", "2024-02-29"], dtype="datetime64[D]"
+        )
+        columns = {"lat": [45.0, 0.0, 10.0], "lon": -90.0, "date": dates}
+        mds, statuses = self.md_object.md_columns(columns, "LOCAL_IGRF")
+        self.assertEqual(
+            statuses.tolist(), [STATUS_OK, STATUS_INCORRECT, STATUS_OK]
+        )
+        self.assertAlmostEqual(
+            mds[2],
+            self.md_object.md(10.0, -90.0, 0.0, 2024, 2, 29, "LOCAL_IGRF"),
+            places=9,
+        )
+        mds, statuses = self.md_object.md_columns(
+            {"lat": 45.0, "lon": -90.0, "date": [2020.5, np.nan]}
+        )
+        self.assertEqual(statuses.tolist(), [STATUS_OK, STATUS_INCORRECT])
+
+    def test_shape(self):
+        """Results keep the broadcast shape of the columns"""
+        columns = {
+            "lat": np.linspace(-80.0, 80.0, 5).reshape(5, 1),
+            "lon": np.linspace(-170.0, 170.0, 4),
+            "date": 2021.0,
+        }
+        mds, statuses = self.md_object.md_columns(columns)
+        self.assertEqual(mds.shape, (5, 4))
+        self.assertEqual(statuses.shape, (5, 4))
+
+    def test_other_provider(self):
+        """Other providers are looked up point by point"""
+        points = self.points[:20].copy()
+        points["lat"][0] = 100.0
+        with StandIn() as stand_in:
+            md_object = MagneticDeclination(urls=stand_in.urls)
+            mds, statuses = md_object.md_columns(points, "NOAA_WMM")
+            expected = [
+                md_object.md(*point.tolist(), "NOAA_WMM")
+                for point in points[1:]
+            ]
+        self.assertEqual(statuses[0], STATUS_INCORRECT)
+        self.assertTrue((statuses[1:] == STATUS_OK).all())
+        self.assertEqual(mds[1:].tolist(), expected)
+
+    def test_provider_value_error(self):
+        """Provider's ValueError is a failure, not an incorrect point"""
+
+        def provider(md_object, lat, lon, elev, year, mon, day):
+            if lat > 0.0:
+                raise ValueError("unexpected response")
+            return 1.5
+
+        register_provider("BROKEN", provider)
+        try:
+            mds, statuses = self.md_object.md_columns(
+                {"lat": [-10.0, 10.0, 100.0], "lon": 0.0, "date": 2021.0},
+                "BROKEN",
+            )
+        finally:
+            del demag.PROVIDERS["BROKEN"]
+        self.assertEqual(
+            statuses.tolist(), [STATUS_OK, STATUS_FAILED, STATUS_INCORRECT]
+        )
+        self.assertEqual(mds[0], 1.5)
+
+    def test_incorrect(self):
+        """Missing columns and unregistered provider"""
+        with self.assertRaises(ValueError):
+            self.md_object.md_columns({"lat": [0.0], "lon": [0.0]})
+        with self.assertRaises(ValueError):
+            self.md_object.md_columns(self.points, "NO_WMM")
+
+
+if __name__ == "__main__":
+    unittest.main()
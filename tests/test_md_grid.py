@@ -0,0 +1,59 @@
+import unittest
+
+from demag import MagneticDeclination
+
+
+class TestMDGrid(unittest.TestCase):
+    """Testing grid lookups"""
+
+    def setUp(self):
+        self.md_object = MagneticDeclination()
+
+    def test_shape(self):
+        """Rows of latitude, columns of longitude"""
+        grid = self.md_object.md_grid(
+            -10.0,
+            10.0,
+            0.0,
+            30.0,
+            5.0,
+            10.0,
+            year=2020,
+            mon=10,
+            day=15,
+            provider="LOCAL_WMM",
+        )
+        self.assertEqual(len(grid), 5)
+        self.assertTrue(all(len(row) == 4 for row in grid))
+
+    def test_values(self):
+        """Grid cells equal to point lookups"""
+        grid = self.md_object.md_grid(
+            -45.0,
+            45.0,
+            -90.0,
+            90.0,
+            45.0,
+            90.0,
+            year=2020,
+            mon=10,
+            day=15,
+            provider="LOCAL_WMM",
+        )
+        self.assertAlmostEqual(grid[0][0], 21.145, delta=0.01)
+        self.assertAlmostEqual(grid[1][1], -4.54, delta=0.01)
+        self.assertAlmostEqual(grid[2][2], 2.089, delta=0.01)
+
+    def test_incorrect_axis(self):
+        """Latitude range is reversed"""
+        with self.assertRaises(ValueError):
+            self.md_object.md_grid(
+                10.0, -10.0, 0.0, 30.0, 5.0, 10.0, provider="LOCAL_WMM"
+            )
+
+    def test_incorrect_lat(self):
+        """Latitude far more than 90.0"""
+        with self.assertRaises(ValueError):
+            self.md_object.md_grid(
+                80.0, 100.0, 0.0, 30.0, 5.0, 10.0, provider="LOCAL_WMM"
+            )
@@ -0,0 +1,46 @@
+import datetime
+import unittest
+
+from demag import MagneticDeclination
+
+
+class TestMDMany(unittest.TestCase):
+    """Testing batch lookups"""
+
+    def setUp(self):
+        self.md_object = MagneticDeclination(workers=4)
+        self.points = [
+            (lat, lon, 0.0, (2020, 10, 15))
+            for lat in (-45.0, 0.0, 45.0)
+            for lon in (-90.0, 0.0, 90.0)
+        ]
+
+    def test_order(self):
+        """Results are in the same order as points"""
+        self.assertEqual(
+            self.md_object.md_many(self.points, provider="LOCAL_WMM"),
+            [
+                self.md_object.md(lat, lon, elev, *date, provider="LOCAL_WMM")
+                for lat, lon, elev, date in self.points
+            ],
+        )
+
+    def test_date_object(self):
+        """Date given as datetime.date"""
+        result = self.md_object.md_many(
+            [(0.0, 0.0, 0.0, datetime.date(2020, 10, 15))],
+            provider="LOCAL_WMM",
+        )
+        self.assertAlmostEqual(result[0], -4.54, delta=0.01)
+
+    def test_empty(self):
+        """No points"""
+        self.assertEqual(self.md_object.md_many([], provider="LOCAL_WMM"), [])
+
+    def test_incorrect_point(self):
+        """One of the points is beyond limits"""
+        with self.assertRaises(ValueError):
+            self.md_object.md_many(
+                self.points + [(100.0, 0.0, 0.0, (2020, 10, 15))],
+                provider="LOCAL_WMM",
+            )
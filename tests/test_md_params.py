@@ -22,6 +22,16 @@ class TestMDArguments(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.md_object.md(lat="lon")
 
+    def test_not_finite(self):
+        """Latitude, longitude or elevation is float NaN or infinite"""
+        for args in (
+            (float("nan"), 0.0, 0.0),
+            (0.0, float("nan"), 0.0),
+            (0.0, 0.0, float("inf")),
+        ):
+            with self.assertRaises(ValueError):
+                self.md_object.md(*args, 2021, 1, 1, "LOCAL_WMM")
+
     def test_lat_beyond_max(self):
         """Latitude far more than 90.0"""
         with self.assertRaises(ValueError):
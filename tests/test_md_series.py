@@ -0,0 +1,43 @@
+import datetime
+import unittest
+
+from demag import MagneticDeclination
+
+
+class TestMDSeries(unittest.TestCase):
+    """Testing time series lookups"""
+
+    def setUp(self):
+        self.md_object = MagneticDeclination()
+
+    def test_monthly(self):
+        """Every month of a year"""
+        series = self.md_object.md_series(
+            lat=45.0,
+            lon=90.0,
+            start=(2020, 1, 1),
+            end=datetime.date(2020, 12, 31),
+            step=1 / 12,
+            provider="LOCAL_WMM",
+        )
+        self.assertEqual(len(series), 12)
+        self.assertEqual(series[0][0], 2020.0)
+        self.assertEqual(
+            series[9][1],
+            self.md_object.md(45.0, 90.0, 0.0, 2020, 10, 1, "LOCAL_WMM"),
+        )
+
+    def test_single(self):
+        """Start equals end"""
+        series = self.md_object.md_series(
+            start=(2020, 10, 15), end=(2020, 10, 15), provider="LOCAL_WMM"
+        )
+        self.assertEqual(len(series), 1)
+        self.assertAlmostEqual(series[0][1], -4.54, delta=0.01)
+
+    def test_incorrect_range(self):
+        """End is before start"""
+        with self.assertRaises(ValueError):
+            self.md_object.md_series(
+                start=(2021, 1, 1), end=(2020, 1, 1), provider="LOCAL_WMM"
+            )
@@ -0,0 +1,81 @@
+import datetime
+import unittest
+
+from demag import MagneticDeclination
+
+from .standin import StandIn
+
+
+class TestMDTrack(unittest.TestCase):
+    """Testing adaptive sampling of tracks"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stand_in = StandIn().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stand_in.stop()
+
+    def setUp(self):
+        self.md_object = MagneticDeclination(urls=self.stand_in.urls)
+
+    def assert_track(self, track, tolerance, max_requests):
+        requests = self.stand_in.requests
+        mds = self.md_object.md_track(track, "NOAA_WMM", tolerance)
+        self.assertLessEqual(self.stand_in.requests - requests, max_requests)
+        self.assertEqual(len(mds), len(track))
+        for md, (lat, lon, elev, date) in zip(mds, track):
+            expected = self.md_object.md(
+                lat, lon, elev, *date, provider="LOCAL_WMM"
+            )
+            error = (md - expected + 180.0) % 360.0 - 180.0
+            self.assertLess(abs(error), tolerance)
+
+    def test_flight(self):
+        """10000 fixes cost tens of requests"""
+        start = datetime.datetime(2021, 3, 1)
+        track = []
+        for i in range(10000):
+            time = start + datetime.timedelta(minutes=i)
+            track.append(
+                (
+                    40.0 + 15.0 * i / 10000,
+                    -120.0 + 100.0 * i / 10000,
+                    10.0,
+                    (time.year, time.month, time.day),
+                )
+            )
+        self.assert_track(track, 0.05, 100)
+
+    def test_polar(self):
+        """Declination wraps around 180 near the pole"""
+        track = [
+            (
+                80.0 + 9.9 * i / 2000,
+                -180.0 + 360.0 * i / 2000,
+                0.0,
+                (2021, 1, 1),
+            )
+            for i in range(2000)
+        ]
+        self.assert_track(track, 0.1, 300)
+
+    def test_short(self):
+        """Short tracks and repeated fixes"""
+        self.assertEqual(self.md_object.md_track([]), [])
+        fix = (45.0, -90.0, 0.0, datetime.date(2021, 1, 1))
+        md = self.md_object.md(45.0, -90.0, 0.0, 2021, 1, 1)
+        self.assertEqual(self.md_object.md_track([fix]), [md])
+        self.assertEqual(self.md_object.md_track([fix, fix, fix]), [md] * 3)
+
+    def test_incorrect(self):
+        """Every fix is validated"""
+        track = [(0.0, 0.0, 0.0, (2021, 1, 1))] * 3
+        track[1] = (0.0, 200.0, 0.0, (2021, 1, 1))
+        with self.assertRaises(ValueError):
+            self.md_object.md_track(track)
+
+
+if __name__ == "__main__":
+    unittest.main()
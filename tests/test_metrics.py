@@ -0,0 +1,180 @@
+import asyncio
+import contextlib
+import unittest
+import urllib.request
+
+from demag import LRUCache, MagneticDeclination, Metrics, _run
+
+from .standin import StandIn
+
+
+class TestMetrics(unittest.TestCase):
+    """Testing instrumentation of lookups"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stand_in = StandIn().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stand_in.stop()
+
+    def setUp(self):
+        self.stand_in.error_rate = 0.0
+        self.metrics = Metrics()
+        self.md_object = MagneticDeclination(
+            urls=self.stand_in.urls,
+            backoff=0.001,
+            memo=LRUCache(),
+            metrics=self.metrics,
+        )
+
+    def test_callbacks(self):
+        """Callbacks receive every phase of the lookup"""
+        phases = []
+        self.metrics.add_callback(
+            lambda phase, provider, seconds, error: phases.append(
+                (phase, provider, error)
+            )
+        )
+        self.md_object.md(45.0, -90.0, 0.0, 2020, 10, 15, "NOAA_WMM")
+        self.assertEqual(
+            phases,
+            [
+                ("cache", "NOAA_WMM", None),
+                ("validate", "NOAA_WMM", None),
+                ("http", "NOAA_WMM", None),
+                ("parse", "NOAA_WMM", None),
+                ("provider", "NOAA_WMM", None),
+            ],
+        )
+
+    def test_contexts(self):
+        """Context managers are entered around every phase"""
+        entered = []
+
+        @contextlib.contextmanager
+        def span(phase, provider):
+            entered.append(phase)
+            yield
+
+        self.metrics.add_context(span)
+        self.md_object.md(45.0, -90.0, 0.0, 2020, 10, 15, "BGS_WMM")
+        self.assertEqual(
+            entered, ["cache", "validate", "provider", "http", "parse"]
+        )
+
+    def test_errors(self):
+        """Failed phases are counted by provider"""
+        with self.assertRaises(RuntimeError):
+            self.md_object.md(0.0, 0.0, 0.0, 1800, 1, 1, "LOCAL_IGRF")
+        with self.assertRaises(ValueError):
+            self.md_object.md(100.0, 0.0, 0.0, 2020, 1, 1, "LOCAL_IGRF")
+        self.assertEqual(self.metrics.errors("provider", "LOCAL_IGRF"), 1)
+        self.assertEqual(self.metrics.errors("validate", "LOCAL_IGRF"), 1)
+
+    def test_cancelled(self):
+        """Cancelled phases are not recorded"""
+        phases = []
+        self.metrics.add_callback(
+            lambda phase, provider, seconds, error: phases.append(phase)
+        )
+
+        async def phase():
+            with self.metrics.phase("http", "NOAA_WMM"):
+                await asyncio.sleep(10.0)
+
+        async def cancel():
+            task = asyncio.ensure_future(phase())
+            await asyncio.sleep(0.01)
+            task.cancel()
+            await asyncio.wait([task])
+            return task.cancelled()
+
+        self.assertTrue(_run(cancel()))
+        self.assertEqual(phases, [])
+        self.assertEqual(self.metrics.errors("http", "NOAA_WMM"), 0)
+
+    def test_hit_ratio(self):
+        """Memo hits and misses"""
+        self.assertIsNone(self.metrics.hit_ratio("memo"))
+        for _ in range(4):
+            self.md_object.md(10.0, 10.0, 0.0, 2020, 1, 1, "LOCAL_WMM")
+        self.assertEqual(self.metrics.hit_ratio("memo"), 0.75)
+
+    def test_retries(self):
+        """Retried requests are counted by service"""
+        self.stand_in.error_rate = 1.0
+        with self.assertRaises(RuntimeError):
+            self.md_object.md(45.0, -90.0, 0.0, 2020, 10, 15, "NOAA_WMM")
+        self.assertIn(
+            'demag_retries_total{service="NOAA"} 3',
+            self.metrics.prometheus(),
+        )
+        self.assertEqual(self.metrics.errors("http", "NOAA_WMM"), 1)
+
+    def test_async(self):
+        """Phases of awaitable lookups"""
+        phases = []
+        self.metrics.add_callback(
+            lambda phase, provider, seconds, error: phases.append(phase)
+        )
+
+        async def lookup():
+            try:
+                return await self.md_object.amd(
+                    45.0, -90.0, 0.0, 2020, 10, 15, "BGS_WMM"
+                )
+            finally:
+                await self.md_object.aclose()
+
+        _run(lookup())
+        self.assertEqual(
+            phases, ["cache", "validate", "http", "parse", "provider"]
+        )
+
+    def test_prometheus(self):
+        """Prometheus text format"""
+        self.md_object.md(10.0, 10.0, 0.0, 2020, 1, 1, "LOCAL_WMM")
+        text = self.metrics.prometheus()
+        self.assertIn("# TYPE demag_phase_seconds histogram\n", text)
+        self.assertIn(
+            'demag_phase_seconds_bucket{phase="provider",'
+            'provider="LOCAL_WMM",le="+Inf"} 1\n',
+            text,
+        )
+        self.assertIn(
+            'demag_phase_seconds_count{phase="validate",'
+            'provider="LOCAL_WMM"} 1\n',
+            text,
+        )
+        self.assertIn(
+            'demag_cache_requests_total{cache="memo",result="miss"} 1\n', text
+        )
+        self.assertIn('demag_cache_hit_ratio{cache="memo"} 0.0\n', text)
+        for line in text.splitlines():
+            if not line.startswith("#"):
+                float(line.rsplit(" ", 1)[1])
+
+    def test_label_escaping(self):
+        """Special characters of label values are escaped"""
+        self.metrics.observe("http", 'a"b\\c\nd', 0.5)
+        self.assertIn('provider="a\\"b\\\\c\\nd"', self.metrics.prometheus())
+
+    def test_serve(self):
+        """Metrics are exposed over HTTP"""
+        self.md_object.md(10.0, 10.0, 0.0, 2020, 1, 1, "LOCAL_WMM")
+        server = self.metrics.serve(port=0, addr="127.0.0.1")
+        try:
+            url = "http://127.0.0.1:{}/metrics".format(server.server_port)
+            with urllib.request.urlopen(url) as response:
+                self.assertEqual(
+                    response.read().decode(), self.metrics.prometheus()
+                )
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,6 @@
 import unittest
 
-from demag import MagneticDeclination
+from demag import MagneticDeclination, _run
 
 
 class TestWMMOnline(unittest.TestCase):
@@ -117,3 +117,16 @@ class TestWMMOnline(unittest.TestCase):
             21.15,
             delta=0.01,
         )
+
+    def test_N0_E0_async(self):
+        """WMM 0 0 2020-10-15 asynchronous"""
+
+        async def lookup():
+            try:
+                return await self.md_object.amd(
+                    lon=0, lat=0, year=2020, mon=10, day=15
+                )
+            finally:
+                await self.md_object.aclose()
+
+        self.assertAlmostEqual(_run(lookup()), -4.54, delta=0.01)
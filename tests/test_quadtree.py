@@ -0,0 +1,161 @@
+import os
+import random
+import tempfile
+import unittest
+
+from demag import MagneticDeclination, QuadTree
+
+
+class TestQuadTree(unittest.TestCase):
+    """Testing adaptive quadtree grids"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.tmp_dir.name, "wmm.qtree")
+        cls.md_object = MagneticDeclination()
+        cls.lookups = cls.md_object.build_quadtree(
+            cls.path,
+            lat1=30.0,
+            lat2=60.0,
+            lon1=-20.0,
+            lon2=20.0,
+            step=10.0,
+            tolerance=0.02,
+            max_depth=5,
+            year=2020,
+            mon=10,
+            day=15,
+            provider="LOCAL_WMM",
+        )
+        cls.md_object.add_quadtree("QTREE_WMM", cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def test_header(self):
+        """Header keeps bounds, root step, elevation, date and provider"""
+        tree = QuadTree(self.path)
+        self.assertEqual((tree.rows, tree.cols), (3, 4))
+        self.assertEqual((tree.lat1, tree.lat2), (30.0, 60.0))
+        self.assertEqual((tree.lon1, tree.lon2), (-20.0, 20.0))
+        self.assertEqual(tree.date, (2020, 10, 15))
+        self.assertEqual(tree.elev, 0.0)
+        self.assertEqual(tree.provider, "LOCAL_WMM")
+        self.assertGreater(tree.nodes, 12)
+        tree.close()
+
+    def test_adaptive(self):
+        """Far fewer lookups than the uniform grid of the deepest cells"""
+        self.assertLess(self.lookups, (3 * 32 + 1) * (4 * 32 + 1) / 10)
+
+    def test_error(self):
+        """Interpolated values are within tolerance"""
+        random.seed(1)
+        for _ in range(200):
+            lat, lon = random.uniform(30.0, 60.0), random.uniform(-20.0, 20.0)
+            self.assertAlmostEqual(
+                self.md_object.md(lat, lon, 0, 2020, 10, 15, "QTREE_WMM"),
+                self.md_object.md(lat, lon, 0, 2020, 10, 15, "LOCAL_WMM"),
+                delta=0.03,
+            )
+
+    def test_edges(self):
+        """Points on the tree's edges"""
+        for lat, lon in ((30.0, -20.0), (60.0, 20.0), (60.0, 0.0)):
+            self.assertAlmostEqual(
+                self.md_object.md(lat, lon, 0, 2020, 10, 15, "QTREE_WMM"),
+                self.md_object.md(lat, lon, 0, 2020, 10, 15, "LOCAL_WMM"),
+                delta=0.001,
+            )
+
+    def test_min_depth(self):
+        """Cells are split down to min_depth, declination wraps at 180"""
+        path = os.path.join(self.tmp_dir.name, "pole.qtree")
+        self.md_object.build_quadtree(
+            path,
+            lat1=80.0,
+            lat2=90.0,
+            lon1=120.0,
+            lon2=150.0,
+            step=10.0,
+            tolerance=360.0,
+            max_depth=2,
+            min_depth=2,
+            year=2025,
+            mon=1,
+            day=1,
+            provider="LOCAL_WMM",
+        )
+        tree = QuadTree(path)
+        self.assertEqual(tree.nodes, 3 * (1 + 4 + 16))
+        self.assertEqual(tree.values, 3 * 5 * 5 - 2 * 5)
+        self.assertAlmostEqual(
+            tree.declination(87.5, 130.0),
+            self.md_object.md(87.5, 130.0, 0, 2025, 1, 1, "LOCAL_WMM"),
+            delta=0.0001,
+        )
+        tree.close()
+
+    def test_outside(self):
+        """Point is out of the tree"""
+        with self.assertRaises(RuntimeError):
+            self.md_object.md(70.0, 0.0, 0, 2020, 10, 15, "QTREE_WMM")
+
+    def test_date_too_far(self):
+        """Date is too far from the tree's date"""
+        with self.assertRaises(RuntimeError):
+            self.md_object.md(45.0, 0.0, 0, 2022, 10, 15, "QTREE_WMM")
+
+    def test_elevation(self):
+        """Tree answers at its elevation only"""
+        path = os.path.join(self.tmp_dir.name, "high.qtree")
+        self.md_object.build_quadtree(
+            path,
+            lat1=30.0,
+            lat2=40.0,
+            lon1=0.0,
+            lon2=10.0,
+            max_depth=1,
+            elev=5.0,
+            year=2020,
+            mon=10,
+            day=15,
+            provider="LOCAL_WMM",
+        )
+        self.md_object.add_quadtree("HIGH_WMM", path)
+        self.assertAlmostEqual(
+            self.md_object.md(35.0, 5.0, 5.0, 2020, 10, 15, "HIGH_WMM"),
+            self.md_object.md(35.0, 5.0, 5.0, 2020, 10, 15, "LOCAL_WMM"),
+            delta=0.0001,
+        )
+        with self.assertRaises(RuntimeError):
+            self.md_object.md(35.0, 5.0, 0, 2020, 10, 15, "HIGH_WMM")
+
+    def test_incorrect(self):
+        """Root step wider than the area"""
+        with self.assertRaises(ValueError):
+            self.md_object.build_quadtree(
+                self.path, 30.0, 35.0, 0.0, 10.0, step=10.0
+            )
+
+    def test_long_provider(self):
+        """Provider name over 16 bytes is not truncated"""
+        path = os.path.join(self.tmp_dir.name, "long.qtree")
+        with self.assertRaises(ValueError):
+            QuadTree.write(
+                path,
+                0.0,
+                0.0,
+                1.0,
+                (1, 1),
+                [],
+                [],
+                (2020, 10, 15),
+                "\N{DEGREE SIGN}" * 9,
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import subprocess
+import sys
+import unittest
+from unittest import mock
+
+import demag
+from demag import MagneticDeclination, register_provider
+
+
+class FakeEntryPoint:
+    def __init__(self, name, provider):
+        self.name = name
+        self.provider = provider
+        self.loads = 0
+
+    def load(self):
+        self.loads += 1
+        return self.provider
+
+
+class TestRegistry(unittest.TestCase):
+    """Testing the provider registry"""
+
+    def setUp(self):
+        self.providers = dict(demag.PROVIDERS)
+        self.entry_points = demag._entry_points
+
+    def tearDown(self):
+        demag.PROVIDERS.clear()
+        demag.PROVIDERS.update(self.providers)
+        demag._entry_points = self.entry_points
+
+    def test_register(self):
+        """Registered provider is used by every object"""
+
+        def provider(md_object, lat, lon, elev, year, mon, day):
+            return lat + lon + year
+
+        register_provider("SUM", provider)
+        self.assertEqual(
+            MagneticDeclination().md(1.0, 2.0, 0, 2021, 1, 1, "SUM"), 2024.0
+        )
+        self.assertEqual(
+            MagneticDeclination().md_many(
+                [(1.0, 2.0, 0, (2021, 1, 1)), (2.0, 2.0, 0, (2021, 1, 1))],
+                "SUM",
+            ),
+            [2024.0, 2025.0],
+        )
+
+    def test_composite(self):
+        """Composite of other members keeps their latency stats"""
+        register_provider("ANY_LOCAL", ("ANY", ("LOCAL_IGRF", "LOCAL_WMM")))
+        md_object = MagneticDeclination()
+        self.assertEqual(md_object.latency_stats(), {})
+        self.assertEqual(
+            md_object.md(45.0, -90.0, 0, 2021, 1, 1, "ANY_LOCAL"),
+            md_object.md(45.0, -90.0, 0, 2021, 1, 1, "LOCAL_IGRF"),
+        )
+        self.assertEqual(
+            md_object.latency_stats()["LOCAL_IGRF"]["requests"], 1
+        )
+
+    def test_unknown(self):
+        """Unknown provider"""
+        with mock.patch("demag._load_entry_points", return_value={}):
+            demag._entry_points = None
+            with self.assertRaises(ValueError):
+                MagneticDeclination().md(0.0, 0.0, 0, 2021, 1, 1, "NO_WMM")
+
+    def test_entry_point(self):
+        """Entry points are loaded on the first use of their name"""
+        entry_point = FakeEntryPoint("EP_WMM", lambda *args: 1.5)
+        demag._entry_points = None
+        with mock.patch(
+            "demag._load_entry_points",
+            return_value={"EP_WMM": entry_point},
+        ) as load_entry_points:
+            md_object = MagneticDeclination()
+            md_object.md(0.0, 0.0, 0, 2021, 1, 1, "LOCAL_WMM")
+            load_entry_points.assert_not_called()
+            self.assertEqual(entry_point.loads, 0)
+            for _ in range(2):
+                self.assertEqual(
+                    md_object.md(0.0, 0.0, 0, 2021, 1, 1, "EP_WMM"), 1.5
+                )
+            load_entry_points.assert_called_once()
+        self.assertEqual(entry_point.loads, 1)
+
+    def test_lazy_imports(self):
+        """Importing the module does not import HTTP, XML or asyncio"""
+        output = subprocess.check_output(
+            [
+                sys.executable,
+                "-c",
+                "import sys, demag; demag.MagneticDeclination(); "
+                "print(' '.join(sorted(sys.modules)))",
+            ],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            universal_newlines=True,
+        ).split()
+        for module in ("requests", "xml.etree.ElementTree", "asyncio"):
+            self.assertNotIn(module, output)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+from demag import MagneticDeclination, RateLimiter
+
+NOAA_XML = (
+    "<maggridresult><result>"
+    "<declination units='degree'>14.05269</declination>"
+    "</result></maggridresult>"
+)
+
+
+def response(status, text="", headers=None):
+    md_request = requests.Response()
+    md_request.status_code = status
+    md_request._content = text.encode()
+    md_request.headers.update(headers or {})
+    return md_request
+
+
+class TestRetry(unittest.TestCase):
+    """Testing rate limits, timeouts and retries"""
+
+    def setUp(self):
+        self.md_object = MagneticDeclination(
+            retries=2, backoff=0.001, timeout=(1.0, 2.0)
+        )
+
+    def test_retry_server_error(self):
+        """Server error is retried"""
+        with mock.patch.object(
+            requests.Session,
+            "get",
+            side_effect=[response(503), response(200, NOAA_XML)],
+        ) as get:
+            self.assertEqual(
+                self.md_object.md(60, 40, 0, 2020, 1, 1), 14.05269
+            )
+        self.assertEqual(get.call_count, 2)
+        self.assertEqual(get.call_args[1]["timeout"], (1.0, 2.0))
+
+    def test_no_retry_client_error(self):
+        """Client error is not retried"""
+        with mock.patch.object(
+            requests.Session, "get", side_effect=[response(400)]
+        ) as get:
+            with self.assertRaises(RuntimeError):
+                self.md_object.md(60, 40, 0, 2020, 1, 1)
+        self.assertEqual(get.call_count, 1)
+
+    def test_retries_exhausted(self):
+        """Connection error after all retries"""
+        with mock.patch.object(
+            requests.Session, "get", side_effect=requests.ConnectionError
+        ) as get:
+            with self.assertRaises(requests.ConnectionError):
+                self.md_object.md(60, 40, 0, 2020, 1, 1)
+        self.assertEqual(get.call_count, 3)
+
+    def test_rate_limiter(self):
+        """Requests beyond burst wait for tokens"""
+        limiter = RateLimiter(rate=100.0, burst=2)
+        start = time.monotonic()
+        for _ in range(6):
+            limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.035)
@@ -0,0 +1,239 @@
+import asyncio
+import json
+import unittest
+
+import demag
+from demag import (
+    LRUCache,
+    MagneticDeclination,
+    Server,
+    _run,
+    register_provider,
+)
+
+from .standin import StandIn
+
+
+async def request(port, method, path, body=None, connection=None):
+    """Sends HTTP request, returns status and decoded JSON body"""
+
+    reader, writer = connection or await asyncio.open_connection(
+        "127.0.0.1", port
+    )
+    payload = b"" if body is None else json.dumps(body).encode()
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+        f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+    )
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line == b"\r\n":
+            break
+        name, _, value = line.decode().partition(":")
+        headers[name.lower()] = value.strip()
+    content = await reader.readexactly(int(headers["content-length"]))
+    if connection is None:
+        writer.close()
+    return status, json.loads(content)
+
+
+class TestServer(unittest.TestCase):
+    """Testing HTTP microservice mode"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stand_in = StandIn().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stand_in.stop()
+
+    def setUp(self):
+        self.md_object = MagneticDeclination(
+            urls=self.stand_in.urls, memo=LRUCache()
+        )
+
+    def serve(self, test, **kwargs):
+        async def run():
+            server = await Server(self.md_object, **kwargs).start(port=0)
+            try:
+                return await test(server)
+            finally:
+                await server.close()
+
+        return _run(run())
+
+    def test_batching(self):
+        """Concurrent lookups are resolved in batches"""
+        points = [
+            (lat, lon, 0.0, 2021, 1, 1)
+            for lat in range(-60, 60, 10)
+            for lon in range(-180, 180, 30)
+        ]
+
+        async def test(server):
+            mds = await asyncio.gather(
+                *(server.lookup(*point, "LOCAL_WMM") for point in points)
+            )
+            return mds, server.stats()
+
+        mds, stats = self.serve(test, batch_size=50, max_wait=0.05)
+        for md, point in zip(mds, points):
+            self.assertAlmostEqual(
+                md, self.md_object.md(*point, "LOCAL_WMM"), places=9
+            )
+        self.assertEqual(stats["points"], len(points))
+        self.assertEqual(stats["batches"], 3)
+
+    def test_network(self):
+        """Identical points of a batch share one request"""
+
+        async def test(server):
+            return await asyncio.gather(
+                *(
+                    server.lookup(45.0, -90.0, 0.0, 2021, 1, 1)
+                    for _ in range(20)
+                )
+            )
+
+        requests = self.stand_in.requests
+        mds = self.serve(test, max_wait=0.05)
+        self.assertEqual(self.stand_in.requests, requests + 1)
+        self.assertEqual(len(set(mds)), 1)
+
+    def test_http(self):
+        """Point lookups, batches, health and stats over HTTP"""
+
+        async def test(server):
+            connection = await asyncio.open_connection(
+                "127.0.0.1", server.port
+            )
+            responses = [
+                await request(
+                    server.port,
+                    "GET",
+                    "/md?lat=45&lon=-90&date=2020-10-15&provider=LOCAL_WMM",
+                    connection=connection,
+                ),
+                await request(
+                    server.port,
+                    "POST",
+                    "/md",
+                    [
+                        {
+                            "lat": 0,
+                            "lon": 0,
+                            "year": 2020,
+                            "mon": 10,
+                            "day": 15,
+                        },
+                        {"lat": 100, "lon": 0, "date": "2020-10-15"},
+                        {"lon": 0, "date": "2020-10-15"},
+                    ],
+                    connection=connection,
+                ),
+                await request(server.port, "GET", "/md?lat=100&lon=0"),
+                await request(server.port, "GET", "/health"),
+                await request(server.port, "GET", "/stats"),
+                await request(server.port, "GET", "/nowhere"),
+            ]
+            connection[1].close()
+            return responses
+
+        point, batch, incorrect, health, stats, missing = self.serve(
+            test, provider="LOCAL_WMM"
+        )
+        self.assertEqual(point[0], 200)
+        self.assertAlmostEqual(point[1]["declination"], -2.545, delta=0.01)
+        self.assertEqual(point[1]["error"], "")
+        self.assertEqual(batch[0], 200)
+        self.assertAlmostEqual(batch[1][0]["declination"], -4.54, delta=0.01)
+        self.assertIsNone(batch[1][1]["declination"])
+        self.assertTrue(batch[1][1]["error"])
+        self.assertTrue(batch[1][2]["error"])
+        self.assertEqual(incorrect[0], 400)
+        self.assertEqual(health, (200, {"status": "ok"}))
+        self.assertEqual(stats[0], 200)
+        self.assertEqual(stats[1]["requests"], 5)
+        self.assertIn("memo", stats[1]["caches"])
+        self.assertEqual(missing[0], 404)
+
+    def test_provider_error(self):
+        """Provider failures are reported per point"""
+
+        async def test(server):
+            return await request(
+                server.port, "GET", "/md?lat=0&lon=0&date=2021-01-01"
+            )
+
+        self.stand_in.error_rate = 1.0
+        self.md_object.retries = 0
+        try:
+            status, row = self.serve(test)
+        finally:
+            self.stand_in.error_rate = 0.0
+        self.assertEqual(status, 502)
+        self.assertTrue(row["error"])
+
+    def test_provider_value_error(self):
+        """Provider's ValueError is a failure, not an incorrect point"""
+
+        def provider(*args):
+            raise ValueError("unexpected response")
+
+        async def test(server):
+            return await request(
+                server.port,
+                "GET",
+                "/md?lat=0&lon=0&date=2021-01-01&provider=BROKEN",
+            )
+
+        register_provider("BROKEN", provider)
+        try:
+            status, row = self.serve(test)
+        finally:
+            del demag.PROVIDERS["BROKEN"]
+        self.assertEqual(status, 502)
+        self.assertEqual(row["error"], "unexpected response")
+
+    def test_negative_length(self):
+        """Negative Content-Length is a bad request"""
+
+        async def test(server):
+            reader, writer = await asyncio.open_connection(
+                "127.0.0.1", server.port
+            )
+            writer.write(b"POST /md HTTP/1.1\r\nContent-Length: -5\r\n\r\n")
+            status = int((await reader.readline()).split()[1])
+            writer.close()
+            return status
+
+        self.assertEqual(self.serve(test), 400)
+
+    def test_incorrect_requests(self):
+        """Over-long request line and NaN coordinates are bad requests"""
+
+        async def test(server):
+            reader, writer = await asyncio.open_connection(
+                "127.0.0.1", server.port
+            )
+            writer.write(b"GET /" + b"x" * 70000 + b" HTTP/1.1\r\n\r\n")
+            status = int((await reader.readline()).split()[1])
+            writer.close()
+            nan = await request(
+                server.port,
+                "GET",
+                "/md?lat=nan&lon=0&date=2021-01-01&provider=LOCAL_WMM",
+            )
+            return status, nan
+
+        status, nan = self.serve(test)
+        self.assertEqual(status, 400)
+        self.assertEqual(nan[0], 400)
+        self.assertIsNone(nan[1]["declination"])
+
+
+if __name__ == "__main__":
+    unittest.main()
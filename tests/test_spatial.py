@@ -0,0 +1,123 @@
+import unittest
+
+from demag import MagneticDeclination, SpatialCache, _run
+
+from .standin import StandIn
+
+
+class TestSpatialCache(unittest.TestCase):
+    """Testing neighbour search of stored results"""
+
+    def setUp(self):
+        self.cache = SpatialCache(distance=1.0, tolerance=0.01, capacity=4)
+        self.key = self.cache.key("NOAA_WMM", 0.0, 2021, 1, 1)
+
+    def test_neighbour(self):
+        """Close neighbour answers, far one does not"""
+        self.cache.set(self.key, 45.0, -90.0, 1.5)
+        self.assertEqual(self.cache.get(self.key, 45.0, -90.0), 1.5)
+        self.assertEqual(self.cache.get(self.key, 45.00001, -90.00001), 1.5)
+        self.assertIsNone(self.cache.get(self.key, 45.02, -90.0))
+        other_date = self.cache.key("NOAA_WMM", 0.0, 2021, 1, 2)
+        self.assertIsNone(self.cache.get(other_date, 45.0, -90.0))
+        self.assertEqual(self.cache.stats()["hits"], 2)
+
+    def test_antimeridian_and_pole(self):
+        """Neighbours across the antimeridian and around the pole"""
+        self.cache.set(self.key, 10.0, 179.99999, 5.0)
+        self.assertEqual(self.cache.get(self.key, 10.0, -179.99999), 5.0)
+        self.cache.set(self.key, 89.99999, 0.0, -30.0)
+        self.assertEqual(self.cache.get(self.key, 89.99999, 180.0), -30.0)
+
+    def test_interpolation(self):
+        """Neighbours are interpolated by inverse distance"""
+        self.cache.set(self.key, 0.0, 0.0, 1.0)
+        self.cache.set(self.key, 0.0, 0.001, 1.001)
+        self.assertAlmostEqual(
+            self.cache.get(self.key, 0.0, 0.00025), 1.00025, places=6
+        )
+        # declinations are interpolated across 180
+        key = self.cache.key("NOAA_WMM", 0.0, 2021, 1, 2)
+        self.cache.set(key, 0.0, 0.0, 179.999)
+        self.cache.set(key, 0.0, 0.001, -179.999)
+        self.assertAlmostEqual(self.cache.get(key, 0.0, 0.00025), 179.9995)
+        self.assertAlmostEqual(self.cache.get(key, 0.0, 0.00075), -179.9995)
+
+    def test_gradient(self):
+        """Steep gradient between neighbours bounds the error"""
+        self.cache.set(self.key, 0.0, 0.0, 1.0)
+        self.cache.set(self.key, 0.0, 0.005, 2.0)
+        self.assertIsNone(self.cache.get(self.key, 0.0, 0.001))
+
+    def test_nearest(self):
+        """The nearest point answers regardless of tolerance"""
+        self.cache.set(self.key, 0.0, 0.0, 1.0)
+        self.cache.set(self.key, 0.0, 0.012, 3.0)
+        self.assertIsNone(self.cache.get(self.key, 0.0, 0.008))
+        self.assertEqual(self.cache.nearest(self.key, 0.0, 0.008), 3.0)
+        self.assertIsNone(self.cache.nearest(self.key, 1.0, 1.0))
+
+    def test_capacity(self):
+        """The oldest points are evicted"""
+        for lon in range(5):
+            self.cache.set(self.key, 0.0, float(lon), float(lon))
+        self.assertIsNone(self.cache.get(self.key, 0.0, 0.0))
+        self.assertEqual(self.cache.get(self.key, 0.0, 4.0), 4.0)
+        self.assertEqual(self.cache.stats()["size"], 4)
+
+
+class TestSpatialReuse(unittest.TestCase):
+    """Testing reuse of network providers' results at neighbouring points"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stand_in = StandIn().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stand_in.stop()
+
+    def setUp(self):
+        self.md_object = MagneticDeclination(
+            urls=self.stand_in.urls, spatial=SpatialCache()
+        )
+
+    def test_md(self):
+        """Fixes around the point share one request"""
+        requests = self.stand_in.requests
+        md = self.md_object.md(45.0, -90.0, 0.0, 2021, 1, 1, "BGS_WMM")
+        for offset in (0.00001, -0.00002, 0.00003):
+            self.assertEqual(
+                self.md_object.md(
+                    45.0 + offset, -90.0 - offset, 0.0, 2021, 1, 1, "BGS_WMM"
+                ),
+                md,
+            )
+        self.assertEqual(self.stand_in.requests, requests + 1)
+        self.md_object.md(45.1, -90.0, 0.0, 2021, 1, 1, "BGS_WMM")
+        self.md_object.md(45.0, -90.0, 0.0, 2021, 1, 2, "BGS_WMM")
+        self.assertEqual(self.stand_in.requests, requests + 3)
+
+    def test_amd(self):
+        """Awaitable lookups reuse neighbours too"""
+
+        async def run():
+            try:
+                first = await self.md_object.amd(
+                    45.0, -90.0, 0.0, 2021, 1, 1, "NOAA_WMM"
+                )
+                second = await self.md_object.amd(
+                    45.00001, -90.0, 0.0, 2021, 1, 1, "NOAA_WMM"
+                )
+                return first, second
+            finally:
+                await self.md_object.aclose()
+
+        requests = self.stand_in.requests
+        first, second = _run(run())
+        self.assertEqual(first, second)
+        self.assertEqual(self.stand_in.requests, requests + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import tempfile
+import time
+import unittest
+
+from demag import MagneticDeclination, SQLiteCache
+
+
+class TestSQLiteCache(unittest.TestCase):
+    """Testing persistent cache"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "md.sqlite")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_hit(self):
+        """Cached value is returned without calling the provider"""
+        cache = SQLiteCache(self.path)
+        key = cache.key("LOCAL_WMM", 0.0, 0.0, 0.0, 2020, 10, 15)
+        cache.set(key, 123.0)
+        md_object = MagneticDeclination(cache=cache)
+        self.assertEqual(
+            md_object.md(year=2020, mon=10, day=15, provider="LOCAL_WMM"),
+            123.0,
+        )
+
+    def test_miss(self):
+        """Provider's result is stored"""
+        cache = SQLiteCache(self.path)
+        md_object = MagneticDeclination(cache=cache)
+        md = md_object.md(year=2020, mon=10, day=15, provider="LOCAL_WMM")
+        key = cache.key("LOCAL_WMM", 0, 0, 0, 2020, 10, 15)
+        self.assertEqual(SQLiteCache(self.path).get(key), md)
+
+    def test_rounding(self):
+        """Coordinates are rounded"""
+        cache = SQLiteCache(self.path, digits=2)
+        self.assertEqual(
+            cache.key("LOCAL_WMM", 10.001, 20.0, 0.0, 2020, 10, 15),
+            cache.key("LOCAL_WMM", 10.0, 20.004, 0.0, 2020, 10, 15),
+        )
+
+    def test_ttl(self):
+        """Expired value is ignored"""
+        cache = SQLiteCache(self.path, ttl=0.01)
+        cache.set("key", 1.0)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("key"))
+        self.assertEqual(cache.get("key", stale=True), 1.0)
+
+    def test_eviction(self):
+        """Least recently used value is evicted"""
+        cache = SQLiteCache(self.path, max_size=2)
+        cache.set("first", 1.0)
+        time.sleep(0.01)
+        cache.set("second", 2.0)
+        time.sleep(0.01)
+        cache.get("first")
+        time.sleep(0.01)
+        cache.set("third", 3.0)
+        self.assertEqual(cache.get("first"), 1.0)
+        self.assertIsNone(cache.get("second"))
+        self.assertEqual(cache.get("third"), 3.0)
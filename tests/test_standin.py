@@ -0,0 +1,103 @@
+import asyncio
+import unittest
+
+from demag import MagneticDeclination, _run
+
+from .standin import StandIn
+
+
+class TestStandIn(unittest.TestCase):
+    """Testing online providers against the local stand-in"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stand_in = StandIn().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stand_in.stop()
+
+    def setUp(self):
+        self.stand_in.error_rate = 0.0
+        self.md_object = MagneticDeclination(
+            urls=self.stand_in.urls, backoff=0.001
+        )
+
+    def test_noaa_wmm(self):
+        """NOAA WMM S45 W90 2020-10-15"""
+        self.assertAlmostEqual(
+            self.md_object.md(-45.0, -90.0, 0.0, 2020, 10, 15, "NOAA_WMM"),
+            21.145,
+            delta=0.01,
+        )
+
+    def test_noaa_incorrect(self):
+        """Date is out of WMM model's range"""
+        with self.assertRaises(RuntimeError):
+            self.md_object.md(year=2000, mon=1, day=25)
+
+    def test_bgs_field(self):
+        """BGS WMM N45 W90 2020-10-15 all elements"""
+        field = self.md_object.field(45.0, -90.0, 0.0, 2020, 10, 15, "BGS_WMM")
+        self.assertAlmostEqual(field.declination, -2.545, delta=0.01)
+        self.assertAlmostEqual(field.inclination, 71.25, delta=0.01)
+        self.assertAlmostEqual(field.declination_sv, -0.038, delta=0.001)
+
+    def test_grid(self):
+        """NOAA grid in several requests"""
+        requests = self.stand_in.requests
+        grid = self.md_object.md_grid(
+            40.0,
+            44.0,
+            0.0,
+            2.0,
+            1.0,
+            1.0,
+            year=2020,
+            mon=10,
+            day=15,
+            max_cells=6,
+        )
+        self.assertEqual(self.stand_in.requests - requests, 3)
+        self.assertAlmostEqual(
+            grid[4][2],
+            self.md_object.md(44.0, 2.0, 0.0, 2020, 10, 15, "LOCAL_WMM"),
+            delta=0.0001,
+        )
+
+    def test_series(self):
+        """NOAA series in one request"""
+        requests = self.stand_in.requests
+        series = self.md_object.md_series(
+            45.0, -90.0, 0.0, (2020, 1, 1), (2024, 12, 31), 1 / 12
+        )
+        self.assertEqual(self.stand_in.requests - requests, 1)
+        self.assertEqual(len(series), 60)
+
+    def test_retry(self):
+        """Injected errors are retried"""
+        self.stand_in.error_rate = 0.5
+        md_object = MagneticDeclination(
+            urls=self.stand_in.urls, retries=20, backoff=0.001
+        )
+        points = [(0.0, float(lon), 0.0, (2020, 10, 15)) for lon in range(10)]
+        self.assertEqual(len(md_object.md_many(points)), 10)
+
+    def test_async(self):
+        """Asynchronous lookups of every network provider"""
+
+        async def lookup():
+            try:
+                return await asyncio.gather(
+                    *(
+                        self.md_object.amd(
+                            -45.0, -90.0, 0.0, 2020, 10, 15, provider
+                        )
+                        for provider in ("NOAA_WMM", "BGS_WMM", "ANY_WMM")
+                    )
+                )
+            finally:
+                await self.md_object.aclose()
+
+        for md in _run(lookup()):
+            self.assertAlmostEqual(md, 21.145, delta=0.01)
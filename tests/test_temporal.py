@@ -0,0 +1,131 @@
+import unittest
+
+from demag import Field, MagneticDeclination, Metrics, TemporalCache, _run
+
+from .standin import StandIn
+
+
+class TestTemporalCache(unittest.TestCase):
+    """Testing extrapolation of stored results"""
+
+    def setUp(self):
+        self.cache = TemporalCache(window=1.0, tolerance=0.01, rate=0.01)
+        self.key = self.cache.key("NOAA_WMM", 10.0, 20.0, 0.0)
+
+    def test_extrapolation(self):
+        """Declination is extrapolated with its secular variation"""
+        self.cache.set(self.key, 2021.0, Field(10.0, declination_sv=0.2))
+        self.assertAlmostEqual(self.cache.get(self.key, 2021.5), 10.1)
+        self.assertAlmostEqual(self.cache.get(self.key, 2020.5), 9.9)
+        self.assertEqual(self.cache.stats()["hits"], 2)
+
+    def test_closest(self):
+        """The closest in time sample answers"""
+        self.cache.set(self.key, 2021.0, Field(10.0, declination_sv=0.2))
+        self.cache.set(self.key, 2021.8, Field(20.0, declination_sv=0.0))
+        self.assertAlmostEqual(self.cache.get(self.key, 2021.2), 10.04)
+        self.assertAlmostEqual(self.cache.get(self.key, 2021.6), 20.0)
+
+    def test_wrap(self):
+        """Results stay within (-180, 180]"""
+        self.cache.set(self.key, 2021.0, Field(179.9, declination_sv=0.4))
+        self.assertAlmostEqual(self.cache.get(self.key, 2021.5), -179.9)
+
+    def test_limits(self):
+        """Samples too far in time, past epoch or error bound are unused"""
+        self.cache.set(self.key, 2024.5, Field(10.0, declination_sv=0.2))
+        self.assertIsNone(self.cache.get(self.key, 2023.4))
+        self.assertIsNone(self.cache.get(self.key, 2025.0))
+        self.assertIsNotNone(self.cache.get(self.key, 2024.0))
+        # fast changing horizontal intensity bounds the error
+        self.cache.set(
+            self.key,
+            2021.0,
+            Field(
+                10.0,
+                declination_sv=2.0,
+                horizontal_intensity=1000.0,
+                horizontal_intensity_sv=100.0,
+            ),
+        )
+        self.assertIsNone(self.cache.get(self.key, 2021.3))
+        self.assertIsNotNone(self.cache.get(self.key, 2021.2))
+
+    def test_without_sv(self):
+        """Results without secular variation are not stored"""
+        self.cache.set(self.key, 2021.0, Field(10.0))
+        self.assertIsNone(self.cache.get(self.key, 2021.0))
+
+
+class TestTemporalReuse(unittest.TestCase):
+    """Testing reuse of network providers' results at other dates"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stand_in = StandIn().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stand_in.stop()
+
+    def setUp(self):
+        self.metrics = Metrics()
+        self.md_object = MagneticDeclination(
+            urls=self.stand_in.urls,
+            temporal=TemporalCache(window=1.0),
+            metrics=self.metrics,
+        )
+
+    def assert_reuse(self, provider, lookup):
+        requests = self.stand_in.requests
+        dates = [(2021, 1, 1), (2021, 4, 1), (2021, 12, 31), (2020, 6, 1)]
+        for year, mon, day in dates:
+            self.assertAlmostEqual(
+                lookup(45.0, -90.0, 0.0, year, mon, day, provider),
+                self.md_object.md(
+                    45.0, -90.0, 0.0, year, mon, day, "LOCAL_WMM"
+                ),
+                delta=0.001,
+            )
+        self.assertEqual(self.stand_in.requests, requests + 1)
+        self.assertEqual(self.metrics.hit_ratio("temporal"), 0.75)
+
+    def test_noaa(self):
+        """NOAA result answers other dates of the point"""
+        self.assert_reuse("NOAA_WMM", self.md_object.md)
+
+    def test_bgs(self):
+        """BGS result answers other dates of the point"""
+        self.assert_reuse("BGS_WMM", self.md_object.md)
+
+    def test_async(self):
+        """Awaitable lookups reuse results too"""
+
+        def lookup(*args):
+            async def run():
+                try:
+                    return await self.md_object.amd(*args)
+                finally:
+                    await self.md_object.aclose()
+
+            return _run(run())
+
+        self.assert_reuse("NOAA_WMM", lookup)
+
+    def test_refetch(self):
+        """Dates beyond the window are requested"""
+        requests = self.stand_in.requests
+        self.md_object.md(45.0, -90.0, 0.0, 2021, 1, 1, "NOAA_WMM")
+        self.md_object.md(45.0, -90.0, 0.0, 2022, 6, 1, "NOAA_WMM")
+        self.md_object.md(45.0, -90.0, 0.0, 2022, 12, 1, "NOAA_WMM")
+        self.assertEqual(self.stand_in.requests, requests + 2)
+
+    def test_local(self):
+        """Local providers are not reused"""
+        self.md_object.md(45.0, -90.0, 0.0, 2021, 1, 1, "LOCAL_WMM")
+        self.md_object.md(45.0, -90.0, 0.0, 2021, 1, 2, "LOCAL_WMM")
+        self.assertIsNone(self.metrics.hit_ratio("temporal"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+
+from demag import MagneticDeclination, Tile
+
+
+class TestTile(unittest.TestCase):
+    """Testing precomputed tiles"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "wmm.tile")
+        self.md_object = MagneticDeclination()
+        self.md_object.build_tile(
+            self.path,
+            lat1=30.0,
+            lat2=60.0,
+            lon1=-20.0,
+            lon2=20.0,
+            lat_step=1.0,
+            lon_step=1.0,
+            year=2020,
+            mon=10,
+            day=15,
+            provider="LOCAL_WMM",
+        )
+        self.md_object.add_tile("TILE_WMM", self.path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_header(self):
+        """Header keeps bounds, step, elevation, date and provider"""
+        tile = Tile(self.path)
+        self.assertEqual((tile.rows, tile.cols), (31, 41))
+        self.assertEqual((tile.lat1, tile.lon2), (30.0, 20.0))
+        self.assertEqual(tile.date, (2020, 10, 15))
+        self.assertEqual(tile.elev, 0.0)
+        self.assertEqual(tile.provider, "LOCAL_WMM")
+        tile.close()
+
+    def test_node(self):
+        """Grid node equals the provider's value"""
+        self.assertAlmostEqual(
+            self.md_object.md(45.0, 0.0, 0, 2020, 10, 15, "TILE_WMM"),
+            0.69,
+            delta=0.01,
+        )
+
+    def test_interpolated(self):
+        """Value between grid nodes"""
+        self.assertAlmostEqual(
+            self.md_object.md(45.5, 10.25, 0, 2020, 10, 15, "TILE_WMM"),
+            self.md_object.md(45.5, 10.25, 0, 2020, 10, 15, "LOCAL_WMM"),
+            delta=0.05,
+        )
+
+    def test_outside(self):
+        """Point is out of the tile"""
+        with self.assertRaises(RuntimeError):
+            self.md_object.md(70.0, 0.0, 0, 2020, 10, 15, "TILE_WMM")
+
+    def test_date_too_far(self):
+        """Date is too far from the tile's date"""
+        with self.assertRaises(RuntimeError):
+            self.md_object.md(45.0, 0.0, 0, 2022, 10, 15, "TILE_WMM")
+
+    def test_long_provider(self):
+        """Provider name over 16 bytes is not truncated"""
+        with self.assertRaises(ValueError):
+            Tile.write(
+                self.path,
+                [0.0],
+                [0.0],
+                [[0.0]],
+                (2020, 10, 15),
+                "\N{DEGREE SIGN}" * 9,
+            )
+        with self.assertRaisesRegex(ValueError, "over 16 bytes"):
+            self.md_object.build_tile(self.path, provider="TILE_WMM" * 3)
+
+    def test_elevation(self):
+        """Elevation differs from the tile's one"""
+        with self.assertRaises(RuntimeError):
+            self.md_object.md(45.0, 0.0, 0.1, 2020, 10, 15, "TILE_WMM")
+        self.md_object.add_tile("TILE_WMM", self.path, max_elev=1.0)
+        self.assertEqual(
+            self.md_object.md(45.0, 0.0, 0.1, 2020, 10, 15, "TILE_WMM"),
+            self.md_object.md(45.0, 0.0, 0.0, 2020, 10, 15, "TILE_WMM"),
+        )